@@ -0,0 +1,235 @@
+"""Indicadores de jornada: banco de horas, horas extras, atrasos e inconsistências de batida.
+
+Lê resumo_diario (um dia por funcionário com ao menos uma batida) com os horários em
+segundos do dia. Durações viram minutos inteiros por dia e tudo
+é agregado com np.bincount sobre os códigos do factorize, sem laços por linha. Os dias
+lidos ficam num _CacheResumoDiario: depois da primeira consulta, uma batida só relê o dia
+alterado. Dias sem nenhuma batida não entram: o sistema não tem calendário de expediente.
+"""
+import numpy as np
+import pandas as pd
+
+import metricas
+from config import ANALISE_EM_CACHE, HORARIOS_PADRAO, TOLERANCIA_MINUTOS
+from relatorios import _CacheResumoDiario, ler_funcionarios_df
+from services import _segundos_previstos, calcular_diferencas_min, obter_horarios_funcionario
+
+EVENTOS = list(HORARIOS_PADRAO.keys())
+COLUNAS_EVENTOS = ["inicio_expediente", "inicio_almoco", "fim_almoco", "fim_expediente"]
+AUSENTE = -1
+
+# Cada dia vem do SQLite como um bloco de largura fixa "AAAA-MM-DDHH:MM:SS..." (data e
+# os quatro horários, "--:--:--" quando ausente), concatenado por funcionário com
+# group_concat. São poucas linhas para o Python montar e os dígitos viram inteiros com
+# aritmética sobre uma matriz uint8; linha a linha, o fetchall dominava o tempo total.
+_LARGURA_DIA = 10 + 8 * len(COLUNAS_EVENTOS)
+_HORA_AUSENTE = "--:--:--"
+
+def _ler_dias(conn, fonte, where, parametros):
+    blocos = " || ".join(["r.data", *(f"COALESCE(r.{coluna}, '{_HORA_AUSENTE}')" for coluna in COLUNAS_EVENTOS)])
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    linhas = cursor.execute(f"""
+        SELECT r.codigo_funcionario, COUNT(*), group_concat({blocos}, '')
+        FROM {fonte} r
+        JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+        WHERE {where}
+        GROUP BY r.codigo_funcionario
+    """, parametros).fetchall()
+    codigos = np.array([linha[0] for linha in linhas], dtype=object)
+    quantidades = np.array([linha[1] for linha in linhas], dtype=np.int64)
+    texto = "".join(linha[2] for linha in linhas).encode("ascii")
+    if len(texto) != _LARGURA_DIA * quantidades.sum():
+        raise ValueError("resumo_diario tem data ou horário fora do formato AAAA-MM-DD / HH:MM:SS.")
+
+    matriz = np.frombuffer(texto, dtype=np.uint8).reshape(-1, _LARGURA_DIA)
+    datas_bytes = np.ascontiguousarray(matriz[:, :10]).view("S10").ravel()
+    datas = datas_bytes.astype(str).astype(object)
+    codigos = np.repeat(codigos, quantidades)
+    dias = pd.DataFrame(
+        {"codigo": codigos, "data": datas, "dia": datas_bytes.astype("datetime64[D]").astype(np.int32)},
+        index=pd.MultiIndex.from_arrays([datas, codigos]),
+    )
+    digitos = matriz.astype(np.int32) - ord("0")
+    for i, coluna in enumerate(COLUNAS_EVENTOS):
+        o = 10 + 8 * i
+        segundos = (
+            (digitos[:, o] * 10 + digitos[:, o + 1]) * 3600
+            + (digitos[:, o + 3] * 10 + digitos[:, o + 4]) * 60
+            + digitos[:, o + 6] * 10 + digitos[:, o + 7]
+        )
+        dias[coluna] = np.where(matriz[:, o] == ord("-"), AUSENTE, segundos).astype(np.int32)
+    return dias
+
+# A ordem das linhas não importa para os indicadores: os dias relidos vão para o fim.
+_dias_em_cache = _CacheResumoDiario(_ler_dias, ANALISE_EM_CACHE, ordenar=False)
+
+def carregar_dias(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    """Um dia por linha: código, data, dia (desde 1970-01-01), horários em segundos do
+    dia (AUSENTE quando não batido) e nome/empresa do cadastro atual."""
+    dias = _dias_em_cache.consultar(empresa_id, data_inicio, data_fim, codigo).reset_index(drop=True)
+    posicoes, codigos = pd.factorize(dias["codigo"])
+    cadastro = ler_funcionarios_df().set_index("codigo").reindex(codigos)
+    dias["nome"] = cadastro["nome"].to_numpy(dtype=object)[posicoes]
+    dias["empresa_id"] = cadastro["empresa_id"].fillna(0).to_numpy(dtype=np.int64)[posicoes]
+    dias["empresa"] = cadastro["nome_empresa"].fillna("").to_numpy(dtype=object)[posicoes]
+    return dias
+
+def _previstos_por_funcionario(codigos_unicos):
+    # (funcionários x eventos) em segundos do dia, com os horários próprios ou da empresa.
+    return np.array(
+        [list(_segundos_previstos(obter_horarios_funcionario(c)).values()) for c in codigos_unicos],
+        dtype=np.int32,
+    ).reshape(len(codigos_unicos), len(EVENTOS))
+
+def calcular_indicadores_diarios(dias, tolerancia=TOLERANCIA_MINUTOS):
+    """Acrescenta a ``dias`` os indicadores de cada dia, em minutos inteiros.
+
+    Regras: a pausa é fim - início do almoço (zero se negativa ou incompleta, como no
+    relatório) e o dia só é apurado com início e fim de expediente. O saldo do banco de
+    horas é trabalhado - previsto nos dias apurados; o atraso é a diferença do início do
+    expediente calculada por calcular_diferencas_min, quando positiva.
+    """
+    posicoes, codigos_unicos = pd.factorize(dias["codigo"])
+    previstos = _previstos_por_funcionario(codigos_unicos)[posicoes]
+    horarios = dias[COLUNAS_EVENTOS].to_numpy(dtype=np.int32)
+    presentes = horarios != AUSENTE
+    inicio_exp, inicio_alm, fim_alm, fim_exp = horarios.T
+
+    almoco_completo = presentes[:, 1] & presentes[:, 2]
+    pausa_bruta = fim_alm - inicio_alm
+    pausa = np.where(almoco_completo & (pausa_bruta >= 0), pausa_bruta, 0)
+    apurado = presentes[:, 0] & presentes[:, 3]
+    trabalhado = np.where(apurado, fim_exp - inicio_exp - pausa, 0)
+    previsto = (previstos[:, 3] - previstos[:, 0]) - np.maximum(previstos[:, 2] - previstos[:, 1], 0)
+
+    trabalhado_min = trabalhado // 60
+    previsto_min = np.where(apurado, previsto // 60, 0)
+    saldo_min = trabalhado_min - previsto_min
+    diferenca_entrada = np.where(
+        presentes[:, 0], calcular_diferencas_min(inicio_exp, previstos[:, 0], tolerancia), 0
+    )
+
+    resultado = dias.copy()
+    resultado["trabalhado_min"] = trabalhado_min.astype(np.int32)
+    resultado["previsto_min"] = previsto_min.astype(np.int32)
+    resultado["saldo_min"] = saldo_min.astype(np.int32)
+    resultado["extra_min"] = np.maximum(saldo_min, 0).astype(np.int32)
+    resultado["atraso_min"] = np.maximum(diferenca_entrada, 0).astype(np.int32)
+    resultado["apurado"] = apurado
+    resultado["batidas_faltando"] = (~presentes).sum(axis=1).astype(np.int8)
+    resultado["pausa_negativa"] = almoco_completo & (pausa_bruta < 0)
+    resultado["jornada_negativa"] = apurado & (trabalhado < 0)
+    return resultado
+
+def _somar_por_grupo(posicoes, tamanho, valores):
+    return np.bincount(posicoes, weights=valores, minlength=tamanho).astype(np.int64)
+
+def _resumir(diario, coluna_grupo, colunas_rotulo):
+    posicoes, grupos = pd.factorize(diario[coluna_grupo], sort=True)
+    n = len(grupos)
+    atrasado = (diario["atraso_min"].to_numpy() > 0)
+    resumo = pd.DataFrame({coluna_grupo: grupos})
+    primeira = np.unique(posicoes, return_index=True)[1]
+    for coluna in colunas_rotulo:
+        resumo[coluna] = diario[coluna].to_numpy()[primeira]
+    resumo["dias"] = np.bincount(posicoes, minlength=n)
+    resumo["dias_apurados"] = _somar_por_grupo(posicoes, n, diario["apurado"].to_numpy())
+    for coluna in ["trabalhado_min", "previsto_min", "saldo_min", "extra_min", "atraso_min"]:
+        resumo[coluna] = _somar_por_grupo(posicoes, n, diario[coluna].to_numpy())
+    resumo["deficit_min"] = _somar_por_grupo(posicoes, n, np.maximum(-diario["saldo_min"].to_numpy(), 0))
+    resumo["dias_com_atraso"] = _somar_por_grupo(posicoes, n, atrasado)
+    resumo["dias_batida_faltando"] = _somar_por_grupo(posicoes, n, diario["batidas_faltando"].to_numpy() > 0)
+    resumo["dias_pausa_negativa"] = _somar_por_grupo(posicoes, n, diario["pausa_negativa"].to_numpy())
+    resumo["dias_jornada_negativa"] = _somar_por_grupo(posicoes, n, diario["jornada_negativa"].to_numpy())
+    return resumo
+
+def resumir_por_funcionario(diario):
+    resumo = _resumir(diario, "codigo", ["nome", "empresa"])
+    resumo["tendencia_atraso_min_semana"] = _tendencia_atrasos(diario, resumo["codigo"])
+    return resumo
+
+def resumir_por_empresa(diario):
+    resumo = _resumir(diario, "empresa_id", ["empresa"])
+    resumo["funcionarios"] = diario.groupby("empresa_id")["codigo"].nunique().reindex(resumo["empresa_id"]).to_numpy()
+    return resumo
+
+def _semanas(dias_epoca):
+    # 1970-01-01 foi uma quinta-feira: +3 alinha as semanas na segunda-feira.
+    return (dias_epoca + 3) // 7
+
+def atrasos_por_semana(diario):
+    """Minutos de atraso e dias com atraso por empresa e semana (segunda-feira)."""
+    semanas = _semanas(diario["dia"].to_numpy())
+    agrupado = pd.DataFrame({
+        "empresa": diario["empresa"].to_numpy(),
+        "semana": semanas,
+        "atraso_min": diario["atraso_min"].to_numpy(),
+        "dias_com_atraso": diario["atraso_min"].to_numpy() > 0,
+        "dias": 1,
+    }).groupby(["empresa", "semana"], sort=True).sum().reset_index()
+    agrupado["semana"] = pd.to_datetime(agrupado["semana"] * 7 - 3, unit="D")
+    agrupado["taxa_atraso"] = agrupado["dias_com_atraso"] / agrupado["dias"]
+    return agrupado
+
+def _tendencia_atrasos(diario, codigos):
+    # Inclinação (mínimos quadrados) dos minutos de atraso semanais de cada funcionário,
+    # em minutos por semana: positiva quando os atrasos estão aumentando. As somas por
+    # grupo saem de bincount sobre pares (funcionário, semana).
+    semanas = _semanas(diario["dia"].to_numpy().astype(np.int64))
+    semanas -= semanas.min()
+    posicoes = pd.Index(codigos).get_indexer(diario["codigo"]).astype(np.int64)
+    pares, indice_par = np.unique(posicoes * (semanas.max() + 1) + semanas, return_inverse=True)
+    y = np.bincount(indice_par, weights=diario["atraso_min"].to_numpy(), minlength=len(pares))
+    funcionario, x = np.divmod(pares, semanas.max() + 1)
+    x = x.astype(np.float64)
+    n = np.bincount(funcionario, minlength=len(codigos))
+    soma_x = np.bincount(funcionario, weights=x, minlength=len(codigos))
+    soma_y = np.bincount(funcionario, weights=y, minlength=len(codigos))
+    soma_xy = np.bincount(funcionario, weights=x * y, minlength=len(codigos))
+    soma_xx = np.bincount(funcionario, weights=x * x, minlength=len(codigos))
+    denominador = n * soma_xx - soma_x ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        inclinacao = np.where(denominador > 0, (n * soma_xy - soma_x * soma_y) / denominador, 0.0)
+    return np.round(inclinacao, 2)
+
+def listar_ocorrencias(diario):
+    """Dias com batida faltando, pausa negativa ou jornada negativa, um por linha."""
+    faltando = diario[COLUNAS_EVENTOS].to_numpy() == AUSENTE
+    marcado = faltando.any(axis=1) | diario["pausa_negativa"].to_numpy() | diario["jornada_negativa"].to_numpy()
+    selecionados = diario.loc[marcado, ["data", "codigo", "nome", "empresa"]].reset_index(drop=True)
+    faltando = faltando[marcado]
+    textos = np.full(len(selecionados), "", dtype=object)
+    for i, evento in enumerate(EVENTOS):
+        textos = np.where(faltando[:, i], textos + f"{evento} ausente; ", textos)
+    textos = np.where(diario["pausa_negativa"].to_numpy()[marcado], textos + "pausa negativa; ", textos)
+    textos = np.where(diario["jornada_negativa"].to_numpy()[marcado], textos + "jornada negativa; ", textos)
+    selecionados["ocorrencias"] = pd.Series(textos, dtype=object).str.rstrip("; ").to_numpy()
+    return selecionados.sort_values(["data", "codigo"], ignore_index=True)
+
+def formatar_minutos(minutos, sinal=False):
+    """Minutos inteiros como "HH:MM" (ou "+HH:MM"/"-HH:MM"), vetorizado."""
+    minutos = np.asarray(minutos, dtype=np.int64)
+    absolutos = np.abs(minutos)
+    texto = (
+        pd.Series(absolutos // 60).astype(str).str.zfill(2) + ":" + pd.Series(absolutos % 60).astype(str).str.zfill(2)
+    ).to_numpy(dtype=object)
+    if sinal:
+        texto = np.where(minutos < 0, "-", "+") + texto
+    return texto
+
+@metricas.instrumentar
+def analisar_jornadas(empresa_id=None, data_inicio=None, data_fim=None, codigo=None, tolerancia=TOLERANCIA_MINUTOS):
+    """Devolve um dict de DataFrames: ``diario``, ``funcionarios``, ``empresas``,
+    ``atrasos_semanais`` e ``ocorrencias``. Valores de tempo em minutos inteiros."""
+    diario = calcular_indicadores_diarios(carregar_dias(empresa_id, data_inicio, data_fim, codigo), tolerancia)
+    if diario.empty:
+        return {"diario": diario, "funcionarios": pd.DataFrame(), "empresas": pd.DataFrame(),
+                "atrasos_semanais": pd.DataFrame(), "ocorrencias": pd.DataFrame()}
+    return {
+        "diario": diario,
+        "funcionarios": resumir_por_funcionario(diario),
+        "empresas": resumir_por_empresa(diario),
+        "atrasos_semanais": atrasos_por_semana(diario),
+        "ocorrencias": listar_ocorrencias(diario),
+    }
@@ -0,0 +1,334 @@
+"""Serviço HTTP do Ponto Omega, sem Streamlit.
+
+Servidor asyncio da biblioteca padrão (HTTP/1.1 com keep-alive, respostas JSON) sobre as
+funções de services.py, para quiosques e rotinas de folha. Cada chamada ao SQLite ou ao
+scrypt roda num ThreadPoolExecutor, de modo que o laço de eventos só faz E/S de rede.
+
+Rotas:
+    GET  /saude
+    POST /batidas                              {"codigo", "senha", "evento_esperado"?}
+    GET  /funcionarios/<codigo>/proximo-evento  (Basic: o próprio funcionário ou admin)
+    GET  /funcionarios/<codigo>/historico       ?limite=&apos=  (idem)
+    GET  /relatorios/registros                  ?formato=&empresa_id=&data_inicio=&data_fim=&codigo=  (admin)
+
+Uso: python cli.py servidor [--host 0.0.0.0] [--porta 8765]
+"""
+import asyncio
+import base64
+import binascii
+import functools
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import relatorios
+import services
+from config import (
+    API_HOST, API_PORTA, API_THREADS, API_TAMANHO_BLOCO_ENVIO, API_TAMANHO_MAX_CORPO, TAMANHO_PAGINA_HISTORICO
+)
+
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+class Requisicao:
+    __slots__ = ("metodo", "caminho", "consulta", "cabecalhos", "corpo")
+
+    def __init__(self, metodo, caminho, consulta, cabecalhos, corpo):
+        self.metodo = metodo
+        self.caminho = caminho
+        self.consulta = consulta
+        self.cabecalhos = cabecalhos
+        self.corpo = corpo
+
+    def parametro(self, nome, padrao=None):
+        valores = self.consulta.get(nome)
+        return valores[0] if valores else padrao
+
+    def json(self):
+        try:
+            dados = json.loads(self.corpo or b"{}")
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise ErroHTTP(HTTPStatus.BAD_REQUEST, "Corpo JSON inválido.") from None
+        if not isinstance(dados, dict):
+            raise ErroHTTP(HTTPStatus.BAD_REQUEST, "O corpo deve ser um objeto JSON.")
+        return dados
+
+class Resposta:
+    # `arquivo`: caminho de um arquivo temporário enviado em blocos no lugar de `corpo`
+    # e apagado ao fim do envio.
+    __slots__ = ("status", "corpo", "tipo", "cabecalhos", "arquivo")
+
+    def __init__(self, status, corpo, tipo="application/json; charset=utf-8", cabecalhos=None, arquivo=None):
+        self.status = status
+        self.corpo = corpo
+        self.tipo = tipo
+        self.cabecalhos = cabecalhos or {}
+        self.arquivo = arquivo
+
+def resposta_json(status, dados):
+    return Resposta(status, json.dumps(dados, ensure_ascii=False, default=str).encode("utf-8"))
+
+_executor = None
+
+def _obter_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api")
+    return _executor
+
+async def em_thread(funcao, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_obter_executor(), functools.partial(funcao, *args, **kwargs))
+
+def _status_falha_login(mensagem):
+    if mensagem.startswith("Muitas tentativas"):
+        return HTTPStatus.TOO_MANY_REQUESTS
+    if mensagem.startswith("Servidor ocupado"):
+        return HTTPStatus.SERVICE_UNAVAILABLE
+    return HTTPStatus.UNAUTHORIZED
+
+async def _autenticar(codigo, senha):
+    usuario, erro = await em_thread(services.verificar_login, codigo, senha)
+    if usuario is None:
+        raise ErroHTTP(_status_falha_login(erro), erro)
+    return usuario
+
+async def _autenticar_basic(requisicao):
+    cabecalho = requisicao.cabecalhos.get("authorization", "")
+    esquema, _, credenciais = cabecalho.partition(" ")
+    if esquema.lower() != "basic":
+        raise ErroHTTP(HTTPStatus.UNAUTHORIZED, "Autenticação Basic obrigatória.")
+    try:
+        codigo, _, senha = base64.b64decode(credenciais, validate=True).decode("utf-8").partition(":")
+    except (binascii.Error, UnicodeDecodeError):
+        raise ErroHTTP(HTTPStatus.UNAUTHORIZED, "Credenciais malformadas.") from None
+    return await _autenticar(codigo, senha)
+
+async def _autorizar_funcionario(requisicao, codigo):
+    usuario = await _autenticar_basic(requisicao)
+    if usuario["codigo"] != codigo and usuario["role"] != "admin":
+        raise ErroHTTP(HTTPStatus.FORBIDDEN, "Acesso restrito ao próprio funcionário.")
+    return usuario
+
+def _codificar_cursor(cursor):
+    if cursor is None:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(list(cursor)).encode("utf-8")).decode("ascii")
+
+def _decodificar_cursor(texto):
+    if not texto:
+        return None
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(texto.encode("ascii")))
+    except (ValueError, binascii.Error):
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, "Cursor 'apos' inválido.") from None
+    if not isinstance(cursor, list) or len(cursor) != 3:
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, "Cursor 'apos' inválido.")
+    return tuple(cursor)
+
+def _inteiro(requisicao, nome, padrao=None, minimo=None, maximo=None):
+    valor = requisicao.parametro(nome)
+    if valor in (None, ""):
+        return padrao
+    try:
+        valor = int(valor)
+    except ValueError:
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, f"'{nome}' deve ser um inteiro.") from None
+    if (minimo is not None and valor < minimo) or (maximo is not None and valor > maximo):
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, f"'{nome}' fora do intervalo permitido.")
+    return valor
+
+def _data(requisicao, nome):
+    valor = requisicao.parametro(nome)
+    if not valor:
+        return None
+    if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", valor):
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, f"'{nome}' deve estar no formato AAAA-MM-DD.")
+    return valor
+
+async def saude(requisicao):
+    return resposta_json(HTTPStatus.OK, {"status": "ok"})
+
+_STATUS_BATIDA = {"success": HTTPStatus.CREATED, "warning": HTTPStatus.CONFLICT, "error": HTTPStatus.INTERNAL_SERVER_ERROR}
+
+async def bater(requisicao):
+    dados = requisicao.json()
+    codigo, senha = str(dados.get("codigo", "")).strip(), str(dados.get("senha", ""))
+    if not codigo or not senha:
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, "Informe 'codigo' e 'senha'.")
+    usuario = await _autenticar(codigo, senha)
+    mensagem, tipo = await em_thread(
+        services.bater_ponto, usuario["codigo"], usuario["nome"], usuario["cargo"],
+        evento_esperado=dados.get("evento_esperado")
+    )
+    return resposta_json(_STATUS_BATIDA[tipo], {"mensagem": mensagem, "tipo": tipo})
+
+async def proximo_evento(requisicao, codigo):
+    await _autorizar_funcionario(requisicao, codigo)
+    evento = await em_thread(services.obter_proximo_evento, codigo)
+    return resposta_json(HTTPStatus.OK, {"codigo": codigo, "proximo_evento": evento})
+
+async def historico(requisicao, codigo):
+    await _autorizar_funcionario(requisicao, codigo)
+    limite = _inteiro(requisicao, "limite", TAMANHO_PAGINA_HISTORICO, minimo=1, maximo=1000)
+    apos = _decodificar_cursor(requisicao.parametro("apos"))
+    pagina, cursor = await em_thread(relatorios.consultar_historico_funcionario, codigo, limite=limite, apos=apos)
+    return resposta_json(HTTPStatus.OK, {
+        "registros": pagina.astype(object).where(pagina.notna(), None).to_dict(orient="records"),
+        "proximo": _codificar_cursor(cursor),
+    })
+
+async def relatorio_registros(requisicao):
+    usuario = await _autenticar_basic(requisicao)
+    if usuario["role"] != "admin":
+        raise ErroHTTP(HTTPStatus.FORBIDDEN, "Relatórios são restritos ao administrador.")
+    formato = requisicao.parametro("formato", "csv")
+    if formato not in relatorios.formatos_exportacao_disponiveis():
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, f"Formato indisponível: '{formato}'.")
+    filtros = {
+        "empresa_id": _inteiro(requisicao, "empresa_id"),
+        "data_inicio": _data(requisicao, "data_inicio"),
+        "data_fim": _data(requisicao, "data_fim"),
+        "codigo": requisicao.parametro("codigo") or None,
+    }
+    # O relatório é gerado em disco pelos exportadores em lotes e enviado em blocos, de
+    # modo que a memória do serviço não cresce com o tamanho do período.
+    descritor, caminho = tempfile.mkstemp(prefix="relatorio_ponto_", suffix=f".{formato}")
+    os.close(descritor)
+    try:
+        await em_thread(relatorios.exportar_registros, formato, caminho, **filtros)
+    except BaseException:
+        os.remove(caminho)
+        raise
+    return Resposta(
+        HTTPStatus.OK, b"", relatorios.EXPORTADORES[formato]["mime"],
+        {"Content-Disposition": f'attachment; filename="relatorio_ponto.{formato}"'}, arquivo=caminho
+    )
+
+ROTAS = [
+    ("GET", re.compile(r"/saude"), saude),
+    ("POST", re.compile(r"/batidas"), bater),
+    ("GET", re.compile(r"/funcionarios/(?P<codigo>[^/]+)/proximo-evento"), proximo_evento),
+    ("GET", re.compile(r"/funcionarios/(?P<codigo>[^/]+)/historico"), historico),
+    ("GET", re.compile(r"/relatorios/registros"), relatorio_registros),
+]
+
+async def despachar(requisicao):
+    metodos_permitidos = []
+    for metodo, padrao, tratador in ROTAS:
+        casamento = padrao.fullmatch(requisicao.caminho)
+        if casamento is None:
+            continue
+        if metodo != requisicao.metodo:
+            metodos_permitidos.append(metodo)
+            continue
+        argumentos = {nome: unquote(valor) for nome, valor in casamento.groupdict().items()}
+        return await tratador(requisicao, **argumentos)
+    if metodos_permitidos:
+        raise ErroHTTP(HTTPStatus.METHOD_NOT_ALLOWED, "Método não permitido.")
+    raise ErroHTTP(HTTPStatus.NOT_FOUND, "Rota não encontrada.")
+
+async def _ler_requisicao(reader):
+    linha = await reader.readline()
+    if not linha:
+        return None
+    try:
+        metodo, alvo, versao = linha.decode("latin-1").rstrip("\r\n").split(" ")
+    except ValueError:
+        raise ErroHTTP(HTTPStatus.BAD_REQUEST, "Linha de requisição inválida.") from None
+    cabecalhos = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b"\r\n", b"\n", b""):
+            break
+        nome, _, valor = linha.decode("latin-1").partition(":")
+        cabecalhos[nome.strip().lower()] = valor.strip()
+    tamanho = int(cabecalhos.get("content-length") or 0)
+    if tamanho > API_TAMANHO_MAX_CORPO:
+        raise ErroHTTP(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Corpo da requisição muito grande.")
+    corpo = await reader.readexactly(tamanho) if tamanho else b""
+    partes = urlsplit(alvo)
+    if versao == "HTTP/1.0" and cabecalhos.get("connection", "").lower() != "keep-alive":
+        cabecalhos.setdefault("connection", "close")
+    return Requisicao(metodo.upper(), partes.path.rstrip("/") or "/", parse_qs(partes.query), cabecalhos, corpo)
+
+def _cabecalho(resposta, manter_conexao, tamanho):
+    linhas = [
+        f"HTTP/1.1 {resposta.status.value} {resposta.status.phrase}",
+        f"Content-Type: {resposta.tipo}",
+        f"Content-Length: {tamanho}",
+        f"Connection: {'keep-alive' if manter_conexao else 'close'}",
+    ]
+    linhas.extend(f"{nome}: {valor}" for nome, valor in resposta.cabecalhos.items())
+    return ("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1")
+
+def _serializar(resposta, manter_conexao):
+    return _cabecalho(resposta, manter_conexao, len(resposta.corpo)) + resposta.corpo
+
+async def _enviar_arquivo(writer, resposta, manter_conexao):
+    try:
+        with open(resposta.arquivo, "rb") as arquivo:
+            writer.write(_cabecalho(resposta, manter_conexao, os.fstat(arquivo.fileno()).st_size))
+            while True:
+                bloco = await em_thread(arquivo.read, API_TAMANHO_BLOCO_ENVIO)
+                if not bloco:
+                    break
+                writer.write(bloco)
+                await writer.drain()
+    finally:
+        os.remove(resposta.arquivo)
+
+async def _atender(reader, writer):
+    try:
+        while True:
+            manter_conexao = True
+            try:
+                requisicao = await _ler_requisicao(reader)
+                if requisicao is None:
+                    break
+                manter_conexao = requisicao.cabecalhos.get("connection", "").lower() != "close"
+                resposta = await despachar(requisicao)
+            except ErroHTTP as erro:
+                resposta = resposta_json(erro.status, {"erro": erro.mensagem})
+            except ValueError as erro:
+                resposta = resposta_json(HTTPStatus.BAD_REQUEST, {"erro": str(erro)})
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            except Exception as erro:
+                resposta = resposta_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"erro": f"Erro interno: {erro}"})
+            if resposta.arquivo is not None:
+                await _enviar_arquivo(writer, resposta, manter_conexao)
+            else:
+                writer.write(_serializar(resposta, manter_conexao))
+                await writer.drain()
+            if not manter_conexao:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def servir(host=API_HOST, porta=API_PORTA):
+    await em_thread(services.init_db)
+    servidor = await asyncio.start_server(_atender, host, porta)
+    enderecos = ", ".join(f"{s.getsockname()[0]}:{s.getsockname()[1]}" for s in servidor.sockets)
+    print(f"Ponto Omega API ouvindo em {enderecos}", flush=True)
+    async with servidor:
+        await servidor.serve_forever()
+
+def executar(host=API_HOST, porta=API_PORTA):
+    try:
+        asyncio.run(servir(host, porta))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        services.fechar_conexoes()
@@ -1,22 +1,34 @@
 import streamlit as st
-import pandas as pd
 import time
-from datetime import date, datetime
+from datetime import date
+from config import TAMANHO_PAGINA_ADMIN, RELATORIO_CSV
+import metricas
 from services import (
     init_db,
-    ler_registros_df,
+    contar_registros,
     bater_ponto,
     verificar_login,
     obter_proximo_evento,
     atualizar_registro,
-    ler_funcionarios_df,
+    atualizar_registros,
+    listar_alteracoes_registro,
     adicionar_funcionario,
-    gerar_relatorio_organizado_df,
-    gerar_arquivo_excel,
-    ler_empresas
+    obter_horarios_empresa,
+    obter_horarios_funcionario,
+    funcionario_tem_horario_proprio,
+    definir_horarios_empresa,
+    definir_horarios_funcionario,
+    estatisticas_cache
 )
 
-init_db()
+# pandas, openpyxl e os relatórios (relatorios.py) são importados dentro das telas que
+# os usam, para que a tela de login e a batida de ponto não esperem por eles.
+
+@st.cache_resource
+def inicializar_banco():
+    init_db()
+
+inicializar_banco()
 
 st.set_page_config(
     page_title="Ponto Omega",
@@ -80,6 +92,10 @@ if 'edit_id' not in st.session_state:
     st.session_state.edit_id = None
 if 'status_message' not in st.session_state:
     st.session_state.status_message = None
+if 'historico' not in st.session_state:
+    st.session_state.historico = None
+if 'exportacao' not in st.session_state:
+    st.session_state.exportacao = None
 
 def tela_de_login():
     with st.container():
@@ -102,6 +118,9 @@ def tela_de_login():
                     st.warning("Por favor, preencha todos os campos.")
 
 def tela_funcionario():
+    import pandas as pd
+    from relatorios import consultar_historico_funcionario
+
     st.title(f"Bem-vindo, {st.session_state.user_info['nome']}!")
     tab1, tab2 = st.tabs(["Registrar Ponto", "Meus Registros"])
     with tab1:
@@ -110,41 +129,112 @@ def tela_funcionario():
         if proximo_evento == "Jornada Finalizada":
             st.info("Sua jornada de hoje já foi completamente registrada. Bom descanso!")
         else:
+            hora_prevista = obter_horarios_funcionario(st.session_state.user_info['codigo'])[proximo_evento]
+            st.caption(f"Horário previsto: {hora_prevista.strftime('%H:%M')}")
             if st.button(f"Confirmar {proximo_evento}", type="primary", use_container_width=True):
                 mensagem, tipo = bater_ponto(
                     st.session_state.user_info['codigo'],
                     st.session_state.user_info['nome'],
-                    st.session_state.user_info['cargo']
+                    st.session_state.user_info['cargo'],
+                    evento_esperado=proximo_evento
                 )
                 if tipo == "success":
+                    st.session_state.historico = None
                     st.success(mensagem)
                     time.sleep(1)
                     st.rerun()
+                elif tipo == "warning":
+                    st.warning(mensagem)
                 else:
                     st.error(mensagem)
     with tab2:
         st.header("Histórico dos Meus Pontos")
-        df_todos_registros = ler_registros_df()
-        meus_registros_df = df_todos_registros[df_todos_registros['Código'] == st.session_state.user_info['codigo']]
-        if meus_registros_df.empty:
+        codigo_usuario = st.session_state.user_info['codigo']
+        if st.session_state.historico is None:
+            primeira_pagina, cursor = consultar_historico_funcionario(codigo_usuario)
+            st.session_state.historico = {"paginas": [primeira_pagina], "cursor": cursor}
+        historico = st.session_state.historico
+        if historico["paginas"][0].empty:
             st.info("Você ainda não possui registros de ponto.")
         else:
-            df_visualizacao = meus_registros_df.sort_values(by=["Data", "Hora"], ascending=False)
-            for _, row in df_visualizacao.iterrows():
-                with st.container(border=True):
-                    data_br = datetime.strptime(row['Data'], '%Y-%m-%d').strftime('%d/%m/%Y')
-                    diff = row['Diferença (min)']
-                    cor_diff = "green" if diff == 0 else "red" if diff > 0 else "blue"
-                    texto_diff = "Em ponto" if diff == 0 else f"{'+' if diff > 0 else ''}{diff} min ({'atraso' if diff > 0 else 'adiantado'})"
-                    col1, col2, col3, col4 = st.columns([3, 2, 2, 4])
-                    col1.text(f"Evento: {row['Descrição']}")
-                    col2.text(f"Data: {data_br}")
-                    col3.text(f"Hora: {row['Hora']}")
-                    col4.markdown(f"Status: **<font color='{cor_diff}'>{texto_diff}</font>**", unsafe_allow_html=True)
-                    if row.get('Observação'):
-                        st.markdown(f"**Obs:** *{row['Observação']}*")
+            for pagina_historico in historico["paginas"]:
+                datas_br = pd.to_datetime(pagina_historico['Data'], format='%Y-%m-%d').dt.strftime('%d/%m/%Y')
+                linhas = zip(
+                    pagina_historico['Descrição'], datas_br, pagina_historico['Hora'],
+                    pagina_historico['Diferença (min)'], pagina_historico['Observação']
+                )
+                for descricao, data_br, hora, diff, observacao in linhas:
+                    with st.container(border=True):
+                        cor_diff = "green" if diff == 0 else "red" if diff > 0 else "blue"
+                        texto_diff = "Em ponto" if diff == 0 else f"{'+' if diff > 0 else ''}{diff} min ({'atraso' if diff > 0 else 'adiantado'})"
+                        col1, col2, col3, col4 = st.columns([3, 2, 2, 4])
+                        col1.text(f"Evento: {descricao}")
+                        col2.text(f"Data: {data_br}")
+                        col3.text(f"Hora: {hora}")
+                        col4.markdown(f"Status: **<font color='{cor_diff}'>{texto_diff}</font>**", unsafe_allow_html=True)
+                        if observacao:
+                            st.markdown(f"**Obs:** *{observacao}*")
+            if historico["cursor"] is not None and st.button("Carregar mais", use_container_width=True):
+                proxima_pagina, cursor = consultar_historico_funcionario(codigo_usuario, apos=historico["cursor"])
+                historico["paginas"].append(proxima_pagina)
+                historico["cursor"] = cursor
+                st.rerun()
+
+@st.fragment
+def painel_exportacao(formato, filtros):
+    # O arquivo é gerado em segundo plano (exportacoes.py); só este fragmento é
+    # reexecutado enquanto a tarefa anda, o resto da tela não.
+    from exportacoes import obter_fila
+    from relatorios import EXPORTADORES
+
+    pedido = {"formato": formato, **filtros}
+    exportacao = st.session_state.exportacao
+    if exportacao is None or exportacao["pedido"] != pedido:
+        if st.button("Gerar arquivo", use_container_width=True):
+            chave = obter_fila().solicitar(formato, **filtros)
+            st.session_state.exportacao = {"pedido": pedido, "chave": chave}
+            st.rerun(scope="fragment")
+        return
+    situacao = obter_fila().situacao(exportacao["chave"], formato)
+    if situacao["estado"] == "em_andamento":
+        st.progress(situacao["progresso"], text=f"Gerando relatório... {situacao['progresso']:.0%}")
+        time.sleep(1)
+        st.rerun(scope="fragment")
+    elif situacao["estado"] == "pronto":
+        with open(situacao["caminho"], "rb") as arquivo:
+            st.download_button(
+                label=f"📥 Baixar Relatório Filtrado ({formato.upper()})",
+                data=arquivo.read(),
+                file_name=RELATORIO_CSV if formato == "csv" else f"relatorio_ponto_filtrado.{formato}",
+                mime=EXPORTADORES[formato]["mime"],
+                use_container_width=True
+            )
+        if st.button("Gerar novamente com os dados atuais"):
+            st.session_state.exportacao = None
+            st.rerun(scope="fragment")
+    else:
+        if situacao["estado"] == "erro":
+            st.error(f"Falha ao gerar o relatório: {situacao['erro']}")
+        else:
+            st.warning("O arquivo gerado não está mais disponível.")
+        if st.button("Tentar novamente"):
+            st.session_state.exportacao = None
+            st.rerun(scope="fragment")
 
 def tela_admin():
+    import pandas as pd
+    from relatorios import (
+        consultar_registros,
+        consultar_relatorio_diario,
+        ler_funcionarios_df,
+        ler_planilha_funcionarios,
+        importar_funcionarios,
+        COLUNAS_PLANILHA_FUNCIONARIOS,
+        formatos_exportacao_disponiveis,
+        EXPORTADORES,
+        ler_empresas
+    )
+
     st.title("Painel do Administrador")
     if st.session_state.status_message:
         msg, tipo = st.session_state.status_message
@@ -153,7 +243,12 @@ def tela_admin():
         else: st.error(msg)
         st.session_state.status_message = None
 
-    tab1, tab2, tab3 = st.tabs(["Relatório de Pontos", "Cadastrar Funcionário", "Visualizar Funcionários"])
+    nomes_abas = ["Relatório de Pontos", "Cadastrar Funcionário", "Visualizar Funcionários", "Horários", "Indicadores"]
+    # Aba oculta: só aparece com a instrumentação ativa e ?diagnostico=1 na URL.
+    mostrar_diagnostico = metricas.ativo() and st.query_params.get("diagnostico") == "1"
+    if mostrar_diagnostico:
+        nomes_abas.append("Diagnóstico")
+    tab1, tab2, tab3, tab4, tab5, *tab_diagnostico = st.tabs(nomes_abas)
     with tab1:
         st.header("Filtros do Relatório")
         empresas_df = ler_empresas()
@@ -174,18 +269,10 @@ def tela_admin():
         st.divider()
         st.header("Relatório de Pontos")
         funcionarios_df = ler_funcionarios_df()
-        df_registros = ler_registros_df()
         if empresa_selecionada_id != 0:
             codigos_funcionarios_empresa = funcionarios_df[funcionarios_df['empresa_id'] == empresa_selecionada_id]['codigo'].tolist()
         else:
             codigos_funcionarios_empresa = funcionarios_df[funcionarios_df['role'] == 'employee']['codigo'].tolist()
-        
-        df_filtrado_empresa = df_registros[df_registros['Código'].isin(codigos_funcionarios_empresa)]
-        df_filtrado_empresa['Data_dt'] = pd.to_datetime(df_filtrado_empresa['Data'], format='%Y-%m-%d').dt.date
-        df_filtrado_data = df_filtrado_empresa[
-            (df_filtrado_empresa['Data_dt'] >= data_inicio) &
-            (df_filtrado_empresa['Data_dt'] <= data_fim)
-        ].copy()
 
         opcoes_funcionarios_filtrados = {"Todos": "Todos"}
         for _, row in funcionarios_df[funcionarios_df['codigo'].isin(codigos_funcionarios_empresa)].iterrows():
@@ -196,75 +283,145 @@ def tela_admin():
             format_func=lambda x: opcoes_funcionarios_filtrados[x]
         )
         
-        df_final_filtrado = df_filtrado_data.copy()
-        if codigo_selecionado != "Todos":
-            df_final_filtrado = df_final_filtrado[df_final_filtrado['Código'] == codigo_selecionado]
+        filtros_relatorio = {
+            "empresa_id": empresa_selecionada_id,
+            "data_inicio": data_inicio,
+            "data_fim": data_fim,
+            "codigo": None if codigo_selecionado == "Todos" else codigo_selecionado
+        }
+        total_registros = contar_registros(**filtros_relatorio)
         
-        if df_final_filtrado.empty:
+        if total_registros == 0:
             st.info("Nenhum registro encontrado para os filtros selecionados.")
         else:
             st.subheader("Visualização dos Eventos")
-            df_visualizacao = df_final_filtrado.sort_values(by=["Data_dt", "Hora"], ascending=False)
-            for index, row in df_visualizacao.iterrows():
-                registro_id = row['ID']
-                with st.container(border=True):
-                    data_br = row['Data_dt'].strftime('%d/%m/%Y')
-                    diff = row['Diferença (min)']
-                    cor_diff = "green" if diff == 0 else "red" if diff > 0 else "yellow"
-                    texto_diff = "Em ponto" if diff == 0 else f"{'+' if diff > 0 else ''}{diff} min ({'atraso' if diff > 0 else 'adiantado'})"
-                    col1, col2, col3, col4, col5 = st.columns([2, 3, 2, 3, 1])
-                    col1.text(f"Nome: {row['Nome']}")
-                    col2.text(f"Evento: {row['Descrição']}")
-                    col3.text(f"Data: {data_br}")
-                    col4.markdown(f"Hora: {row['Hora']} | Status: **<font color='{cor_diff}'>{texto_diff}</font>**", unsafe_allow_html=True)
-                    if col5.button("Editar", key=f"edit_{registro_id}"):
-                        st.session_state.edit_id = registro_id
-                        st.rerun()
-                    if st.session_state.edit_id == registro_id:
-                        edit_col1, edit_col2 = st.columns(2)
-                        with edit_col1:
-                            novo_horario = st.text_input("Nova Hora (HH:MM:SS):", value=row['Hora'], key=f"hora_{registro_id}")
-                        with edit_col2:
-                            nova_obs = st.text_area("Observação:", value=row.get('Observação', ''), key=f"obs_{registro_id}")
-                        col_save, col_cancel, _ = st.columns([1, 1, 5])
-                        if col_save.button("Salvar", key=f"save_{registro_id}", type="primary"):
-                            horario_mudou = novo_horario.strip() != row['Hora'].strip()
-                            obs_mudou = nova_obs.strip() != str(row.get('Observação', '')).strip()
-                            if horario_mudou or obs_mudou:
-                                horario_para_atualizar = novo_horario.strip() if horario_mudou else None
-                                obs_para_atualizar = nova_obs.strip() if obs_mudou else None
-                                msg, tipo = atualizar_registro(
-                                    registro_id,
-                                    novo_horario=horario_para_atualizar,
-                                    nova_observacao=obs_para_atualizar
-                                )
-                                st.session_state.status_message = (msg, tipo)
-                            st.session_state.edit_id = None
-                            st.rerun()
-                        if col_cancel.button("Cancelar", key=f"cancel_{registro_id}"):
-                            st.session_state.edit_id = None
+            total_paginas = max(1, -(-total_registros // TAMANHO_PAGINA_ADMIN))
+            col_modo, col_pagina, col_total = st.columns([2, 1, 2])
+            with col_modo:
+                modo_visualizacao = st.radio("Modo de visualização:", ["Cartões", "Tabela"], horizontal=True)
+            with col_pagina:
+                pagina = st.number_input(
+                    "Página",
+                    min_value=1,
+                    max_value=total_paginas,
+                    value=1,
+                    key=f"pagina_{empresa_selecionada_id}_{data_inicio}_{data_fim}_{codigo_selecionado}"
+                )
+            with col_total:
+                st.caption(f"{total_registros} eventos em {total_paginas} página(s)")
+
+            df_visualizacao = consultar_registros(
+                **filtros_relatorio,
+                limite=TAMANHO_PAGINA_ADMIN,
+                deslocamento=(pagina - 1) * TAMANHO_PAGINA_ADMIN,
+                decrescente=True
+            )
+            df_visualizacao['Data_dt'] = pd.to_datetime(df_visualizacao['Data'], format='%Y-%m-%d').dt.date
+
+            if modo_visualizacao == "Tabela":
+                df_tabela = df_visualizacao[['ID', 'Nome', 'Descrição', 'Data_dt', 'Hora', 'Diferença (min)', 'Observação']].copy()
+                df_tabela['Observação'] = df_tabela['Observação'].fillna('')
+                df_editado = st.data_editor(
+                    df_tabela,
+                    hide_index=True,
+                    use_container_width=True,
+                    disabled=['ID', 'Nome', 'Descrição', 'Data_dt', 'Diferença (min)'],
+                    column_config={
+                        'ID': None,
+                        'Data_dt': st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                        'Hora': st.column_config.TextColumn("Hora (HH:MM:SS)")
+                    },
+                    key=f"editor_{empresa_selecionada_id}_{data_inicio}_{data_fim}_{codigo_selecionado}_{pagina}"
+                )
+                if st.button("Salvar alterações da página", type="primary"):
+                    horas_editadas = df_editado['Hora'].fillna('').str.strip()
+                    obs_editadas = df_editado['Observação'].fillna('').str.strip()
+                    horario_mudou = horas_editadas != df_tabela['Hora'].str.strip()
+                    obs_mudou = obs_editadas != df_tabela['Observação'].str.strip()
+                    alterados = df_editado.index[horario_mudou | obs_mudou]
+                    st.session_state.status_message = atualizar_registros(
+                        [
+                            {
+                                "id": df_editado.at[idx, 'ID'],
+                                "novo_horario": horas_editadas[idx] if horario_mudou[idx] else None,
+                                "nova_observacao": obs_editadas[idx] if obs_mudou[idx] else None,
+                            }
+                            for idx in alterados
+                        ],
+                        editor=st.session_state.user_info['codigo']
+                    )
+                    st.rerun()
+            else:
+                for index, row in df_visualizacao.iterrows():
+                    registro_id = row['ID']
+                    with st.container(border=True):
+                        data_br = row['Data_dt'].strftime('%d/%m/%Y')
+                        diff = row['Diferença (min)']
+                        cor_diff = "green" if diff == 0 else "red" if diff > 0 else "yellow"
+                        texto_diff = "Em ponto" if diff == 0 else f"{'+' if diff > 0 else ''}{diff} min ({'atraso' if diff > 0 else 'adiantado'})"
+                        col1, col2, col3, col4, col5 = st.columns([2, 3, 2, 3, 1])
+                        col1.text(f"Nome: {row['Nome']}")
+                        col2.text(f"Evento: {row['Descrição']}")
+                        col3.text(f"Data: {data_br}")
+                        col4.markdown(f"Hora: {row['Hora']} | Status: **<font color='{cor_diff}'>{texto_diff}</font>**", unsafe_allow_html=True)
+                        if col5.button("Editar", key=f"edit_{registro_id}"):
+                            st.session_state.edit_id = registro_id
                             st.rerun()
-                    elif row.get('Observação'):
-                        st.markdown(f"**Obs:** *{row['Observação']}*")
+                        if st.session_state.edit_id == registro_id:
+                            edit_col1, edit_col2 = st.columns(2)
+                            with edit_col1:
+                                novo_horario = st.text_input("Nova Hora (HH:MM:SS):", value=row['Hora'], key=f"hora_{registro_id}")
+                            with edit_col2:
+                                nova_obs = st.text_area("Observação:", value=row.get('Observação', ''), key=f"obs_{registro_id}")
+                            col_save, col_cancel, _ = st.columns([1, 1, 5])
+                            if col_save.button("Salvar", key=f"save_{registro_id}", type="primary"):
+                                horario_mudou = novo_horario.strip() != row['Hora'].strip()
+                                obs_mudou = nova_obs.strip() != str(row.get('Observação', '')).strip()
+                                if horario_mudou or obs_mudou:
+                                    horario_para_atualizar = novo_horario.strip() if horario_mudou else None
+                                    obs_para_atualizar = nova_obs.strip() if obs_mudou else None
+                                    msg, tipo = atualizar_registro(
+                                        registro_id,
+                                        novo_horario=horario_para_atualizar,
+                                        nova_observacao=obs_para_atualizar,
+                                        editor=st.session_state.user_info['codigo']
+                                    )
+                                    st.session_state.status_message = (msg, tipo)
+                                st.session_state.edit_id = None
+                                st.rerun()
+                            if col_cancel.button("Cancelar", key=f"cancel_{registro_id}"):
+                                st.session_state.edit_id = None
+                                st.rerun()
+                            alteracoes = listar_alteracoes_registro(registro_id)
+                            if alteracoes:
+                                with st.expander(f"Histórico de alterações ({len(alteracoes)})"):
+                                    for alteracao in alteracoes:
+                                        evento_novo = alteracao['descricao_nova'] or alteracao['descricao']
+                                        st.caption(
+                                            f"{alteracao['alterado_em']} por {alteracao['editor'] or 'importação'}: "
+                                            f"evento {alteracao['descricao']} → {evento_novo}, "
+                                            f"hora {alteracao['hora_anterior']} → {alteracao['hora_nova']}, "
+                                            f"obs. '{alteracao['observacao_anterior'] or ''}' → '{alteracao['observacao_nova'] or ''}'"
+                                        )
+                        elif row.get('Observação'):
+                            st.markdown(f"**Obs:** *{row['Observação']}*")
             
+            st.divider()
+            st.subheader("Resumo Diário")
+            st.dataframe(consultar_relatorio_diario(**filtros_relatorio), hide_index=True, use_container_width=True)
+
             st.divider()
             st.subheader("Exportar Relatório Completo")
-            df_organizado = gerar_relatorio_organizado_df(df_final_filtrado)
-            df_bruto = df_final_filtrado.sort_values(by=["Data_dt", "Hora"]).copy()
-            df_bruto['Data'] = pd.to_datetime(df_bruto['Data']).dt.strftime('%d/%m/%Y')
-            excel_buffer = gerar_arquivo_excel(df_organizado, df_bruto.drop(columns=['Data_dt']))
-            st.download_button(
-                label="📥 Baixar Relatório Filtrado em Excel",
-                data=excel_buffer,
-                file_name=f"relatorio_ponto_filtrado.xlsx",
-                mime="application/vnd.openxmlformats-officedocument-spreadsheetml-sheet",
-                use_container_width=True
+            formato_exportacao = st.selectbox(
+                "Formato do arquivo:",
+                options=formatos_exportacao_disponiveis(),
+                format_func=lambda x: EXPORTADORES[x]["descricao"]
             )
+            painel_exportacao(formato_exportacao, filtros_relatorio)
 
     with tab2:
         st.header("Cadastrar Novo Funcionário")
-        empresas_df_cadastro = ler_empresas()
-        empresas_para_cadastro = dict(zip(empresas_df_cadastro['id'], empresas_df_cadastro['nome_empresa']))
+        empresas_para_cadastro = dict(zip(empresas_df['id'], empresas_df['nome_empresa']))
         with st.form("add_employee_form", clear_on_submit=True):
             empresa_id_cadastro = st.selectbox(
                 "Empresa do Funcionário",
@@ -287,6 +444,25 @@ def tela_admin():
                 st.session_state.status_message = (msg, tipo)
                 st.rerun()
 
+        st.divider()
+        st.header("Cadastro em Lote")
+        st.caption(
+            f"Envie uma planilha CSV ou XLSX com as colunas: {', '.join(COLUNAS_PLANILHA_FUNCIONARIOS)}. "
+            "A coluna 'empresa' aceita o nome ou o código da empresa."
+        )
+        planilha_enviada = st.file_uploader("Planilha de funcionários", type=["csv", "xlsx"])
+        if planilha_enviada is not None and st.button("Importar Funcionários", type="primary"):
+            try:
+                resultado = importar_funcionarios(ler_planilha_funcionarios(planilha_enviada))
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                if resultado["inseridos"]:
+                    st.success(f"{resultado['inseridos']} funcionário(s) cadastrado(s) com sucesso.")
+                if not resultado["erros"].empty:
+                    st.warning(f"{len(resultado['erros'])} linha(s) não foram importadas:")
+                    st.dataframe(resultado["erros"], use_container_width=True, hide_index=True)
+
     with tab3:
         st.header("Funcionários Cadastrados no Sistema")
         todos_funcionarios_df = ler_funcionarios_df()
@@ -302,16 +478,184 @@ def tela_admin():
             })
             st.dataframe(df_final, use_container_width=True, hide_index=True)
 
+    with tab4:
+        st.header("Horários por Empresa")
+        empresas_horario = dict(zip(empresas_df['id'], empresas_df['nome_empresa']))
+        empresa_horario_id = st.selectbox(
+            "Empresa",
+            options=list(empresas_horario.keys()),
+            format_func=lambda x: empresas_horario[x],
+            key="empresa_horario"
+        )
+        horarios_atuais = obter_horarios_empresa(empresa_horario_id)
+        with st.form(f"horarios_empresa_{empresa_horario_id}"):
+            colunas_horario = st.columns(len(horarios_atuais))
+            novos_horarios = {
+                evento: coluna.time_input(evento, value=hora, step=60)
+                for coluna, (evento, hora) in zip(colunas_horario, horarios_atuais.items())
+            }
+            if st.form_submit_button("Salvar horários da empresa"):
+                st.session_state.status_message = definir_horarios_empresa(empresa_horario_id, novos_horarios)
+                st.rerun()
+
+        st.divider()
+        st.header("Horário Próprio de Funcionário")
+        funcionarios_horario_df = ler_funcionarios_df()
+        funcionarios_horario_df = funcionarios_horario_df[funcionarios_horario_df['role'] == 'employee']
+        if funcionarios_horario_df.empty:
+            st.info("Nenhum funcionário cadastrado no sistema (além do administrador).")
+        else:
+            opcoes_funcionarios_horario = dict(zip(
+                funcionarios_horario_df['codigo'],
+                funcionarios_horario_df['nome'] + " (Cód: " + funcionarios_horario_df['codigo'] + ")"
+            ))
+            codigo_horario = st.selectbox(
+                "Funcionário",
+                options=list(opcoes_funcionarios_horario.keys()),
+                format_func=lambda x: opcoes_funcionarios_horario[x],
+                key="funcionario_horario"
+            )
+            horarios_funcionario = obter_horarios_funcionario(codigo_horario)
+            tem_horario_proprio = funcionario_tem_horario_proprio(codigo_horario)
+            st.caption("Usando horário próprio." if tem_horario_proprio else "Usando o horário da empresa.")
+            with st.form(f"horarios_funcionario_{codigo_horario}"):
+                colunas_horario = st.columns(len(horarios_funcionario))
+                novos_horarios = {
+                    evento: coluna.time_input(evento, value=hora, step=60, key=f"{codigo_horario}_{evento}")
+                    for coluna, (evento, hora) in zip(colunas_horario, horarios_funcionario.items())
+                }
+                col_salvar, col_remover, _ = st.columns([2, 2, 3])
+                if col_salvar.form_submit_button("Salvar horário próprio"):
+                    st.session_state.status_message = definir_horarios_funcionario(codigo_horario, novos_horarios)
+                    st.rerun()
+                if col_remover.form_submit_button("Voltar ao horário da empresa", disabled=not tem_horario_proprio):
+                    st.session_state.status_message = definir_horarios_funcionario(codigo_horario, None)
+                    st.rerun()
+
+    with tab5:
+        tela_indicadores(opcoes_empresas)
+
+    if mostrar_diagnostico:
+        with tab_diagnostico[0]:
+            tela_diagnostico()
+
+def _tabela_indicadores(resumo, rotulos, formatar_minutos):
+    tabela = resumo[list(rotulos)].rename(columns=rotulos)
+    tabela["Dias"] = resumo["dias"]
+    tabela["Trabalhado"] = formatar_minutos(resumo["trabalhado_min"])
+    tabela["Previsto"] = formatar_minutos(resumo["previsto_min"])
+    tabela["Banco de Horas"] = formatar_minutos(resumo["saldo_min"], sinal=True)
+    tabela["Horas Extras"] = formatar_minutos(resumo["extra_min"])
+    tabela["Dias com Atraso"] = resumo["dias_com_atraso"]
+    tabela["Atraso Total"] = formatar_minutos(resumo["atraso_min"])
+    tabela["Batida Faltando"] = resumo["dias_batida_faltando"]
+    tabela["Pausa Negativa"] = resumo["dias_pausa_negativa"]
+    return tabela
+
+def tela_indicadores(opcoes_empresas):
+    from analise import analisar_jornadas, formatar_minutos
+
+    st.header("Indicadores de Jornada")
+    col_empresa, col_inicio, col_fim = st.columns(3)
+    with col_empresa:
+        empresa_id = st.selectbox(
+            "Empresa:",
+            options=list(opcoes_empresas.keys()),
+            format_func=lambda x: opcoes_empresas[x],
+            key="indicadores_empresa"
+        )
+    with col_inicio:
+        inicio = st.date_input(
+            "Data Início", value=date.today().replace(month=1, day=1), format="DD/MM/YYYY", key="indicadores_inicio"
+        )
+    with col_fim:
+        fim = st.date_input("Data Fim", value=date.today(), format="DD/MM/YYYY", key="indicadores_fim")
+
+    indicadores = analisar_jornadas(empresa_id, inicio, fim)
+    funcionarios = indicadores["funcionarios"]
+    if funcionarios.empty:
+        st.info("Nenhum dia com batidas no período selecionado.")
+        return
+    st.caption("Banco de horas e horas extras consideram apenas dias com início e fim de expediente batidos.")
+
+    col1, col2, col3, col4, col5 = st.columns(5)
+    col1.metric("Banco de horas", formatar_minutos([funcionarios["saldo_min"].sum()], sinal=True)[0])
+    col2.metric("Horas extras", formatar_minutos([funcionarios["extra_min"].sum()])[0])
+    col3.metric("Dias com atraso", int(funcionarios["dias_com_atraso"].sum()))
+    col4.metric("Dias com batida faltando", int(funcionarios["dias_batida_faltando"].sum()))
+    col5.metric("Pausas negativas", int(funcionarios["dias_pausa_negativa"].sum()))
+
+    st.subheader("Por Funcionário")
+    tabela_funcionarios = _tabela_indicadores(
+        funcionarios, {"codigo": "Código", "nome": "Nome", "empresa": "Empresa"}, formatar_minutos
+    )
+    tabela_funcionarios["Tendência de Atraso (min/semana)"] = funcionarios["tendencia_atraso_min_semana"]
+    st.dataframe(tabela_funcionarios, hide_index=True, use_container_width=True)
+
+    st.subheader("Por Empresa")
+    st.dataframe(
+        _tabela_indicadores(indicadores["empresas"], {"empresa": "Empresa", "funcionarios": "Funcionários"}, formatar_minutos),
+        hide_index=True,
+        use_container_width=True
+    )
+
+    st.subheader("Minutos de Atraso por Semana")
+    st.line_chart(
+        indicadores["atrasos_semanais"].pivot(index="semana", columns="empresa", values="atraso_min").fillna(0)
+    )
+
+    st.subheader("Ocorrências")
+    ocorrencias = indicadores["ocorrencias"]
+    if ocorrencias.empty:
+        st.success("Nenhuma batida faltando ou pausa negativa no período.")
+    else:
+        st.dataframe(
+            ocorrencias.rename(columns={
+                "data": "Data", "codigo": "Código", "nome": "Nome", "empresa": "Empresa", "ocorrencias": "Ocorrências"
+            }),
+            hide_index=True,
+            use_container_width=True
+        )
+
+def tela_diagnostico():
+    import pandas as pd
+
+    st.header("Métricas de Desempenho")
+    resumo_metricas = pd.DataFrame(metricas.registro.resumo())
+    if resumo_metricas.empty:
+        st.info("Nenhuma métrica registrada desde o último reinício ou limpeza.")
+    else:
+        for titulo, prefixo in [("Telas", "ponto_tela"), ("Funções", "ponto_funcao"), ("SQL", "ponto_sql")]:
+            st.subheader(titulo)
+            df_metricas = resumo_metricas[resumo_metricas['metrica'].str.startswith(prefixo)]
+            st.dataframe(df_metricas.sort_values('total_s', ascending=False), use_container_width=True, hide_index=True)
+    st.caption(f"Cache de referência: {estatisticas_cache()}")
+    col_baixar, col_limpar, _ = st.columns([2, 2, 3])
+    col_baixar.download_button(
+        "📥 Baixar métricas (Prometheus)",
+        data=metricas.registro.texto_prometheus(),
+        file_name="metricas_ponto.prom",
+        mime="text/plain"
+    )
+    if col_limpar.button("Zerar métricas"):
+        metricas.registro.limpar()
+        st.rerun()
+
 if st.session_state.user_info:
     st.sidebar.image("assets/logo.png", use_container_width=True)
     if st.sidebar.button("Sair"):
         st.session_state.user_info = None
         st.session_state.edit_id = None
         st.session_state.status_message = None
+        st.session_state.historico = None
+        st.session_state.exportacao = None
         st.rerun()
     if st.session_state.user_info.get("role") == "admin":
-        tela_admin()
+        with metricas.medir_tela("tela_admin"):
+            tela_admin()
     else:
-        tela_funcionario()
+        with metricas.medir_tela("tela_funcionario"):
+            tela_funcionario()
 else:
-    tela_de_login()
\ No newline at end of file
+    with metricas.medir_tela("tela_de_login"):
+        tela_de_login()
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""Compara tempo e tamanho das exportações xlsx, csv e parquet sobre um banco sintético.
+
+Uso: python -m benchmarks.bench_exportacao [--batidas 200000]
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import relatorios
+import services
+from benchmarks.dados_sinteticos import gerar_registros_df, popular_banco
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batidas", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--memoria", action="store_true", help="repete cada exportação sob tracemalloc")
+    args = parser.parse_args()
+
+    print(f"{'batidas':>10} {'formato':>8} {'tempo (s)':>10} {'tamanho (KB)':>13} {'pico mem (MB)':>14}")
+    for total in args.batidas:
+        with tempfile.TemporaryDirectory() as diretorio:
+            popular_banco(os.path.join(diretorio, "bench.db"), gerar_registros_df(total))
+            for formato in relatorios.formatos_exportacao_disponiveis():
+                destino = os.path.join(diretorio, f"saida.{formato}")
+                inicio = time.perf_counter()
+                relatorios.exportar_registros(formato, destino)
+                duracao = time.perf_counter() - inicio
+                tamanho = os.path.getsize(destino) / 1024
+
+                pico = float("nan")
+                if args.memoria:
+                    tracemalloc.start()
+                    relatorios.exportar_registros(formato, destino)
+                    pico = tracemalloc.get_traced_memory()[1] / 2**20
+                    tracemalloc.stop()
+                print(f"{total:>10} {formato:>8} {duracao:>10.2f} {tamanho:>13.0f} {pico:>14.1f}")
+            services.fechar_conexoes()
+
+if __name__ == "__main__":
+    main()
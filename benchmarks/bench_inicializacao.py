@@ -0,0 +1,149 @@
+"""Mede o custo de partida: importação dos módulos, init_db e a primeira batida de ponto.
+
+Cada medição roda num interpretador novo (partida a frio), sobre um banco temporário já
+no esquema atual. Com --referencia, repete as mesmas medições numa revisão anterior do
+git (extraída com git archive) para comparar; a revisão precisa ter o mesmo esquema.
+
+Uso:
+    python -m benchmarks.bench_inicializacao --repeticoes 10
+    python -m benchmarks.bench_inicializacao --referencia HEAD~1 --saida partida.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import pandas as pd
+
+import relatorios
+import services
+
+SENHA = "partida123"
+PESADOS = ("pandas", "numpy", "openpyxl")
+
+# Cada trecho imprime, na última linha, um JSON com o tempo interno e os módulos pesados
+# carregados; o tempo de parede do subprocesso inclui a partida do interpretador.
+TRECHOS = {
+    "import services": "import services",
+    "import relatorios": "import relatorios",
+    "init_db": "import services\nservices.DATABASE_FILE = {banco!r}\nservices.init_db()",
+    "init_db repetido (x100)": (
+        "import services\nservices.DATABASE_FILE = {banco!r}\nservices.init_db()\n"
+        "inicio = time.perf_counter()\nfor _ in range(100):\n    services.init_db()\n"
+    ),
+    "primeira batida": (
+        "import services\nservices.DATABASE_FILE = {banco!r}\nservices.init_db()\n"
+        "mensagem, tipo = services.bater_ponto({codigo!r}, 'Funcionário', 'Operador')\n"
+        "assert tipo == 'success', mensagem\n"
+    ),
+}
+
+MOLDE = """\
+import json, sys, time
+inicio = time.perf_counter()
+{trecho}
+print(json.dumps({{"interno_ms": (time.perf_counter() - inicio) * 1000,
+                  "pesados": [m for m in {pesados!r} if m in sys.modules]}}))
+"""
+
+
+def _preparar_banco(caminho, funcionarios):
+    services.DATABASE_FILE = caminho
+    services.init_db()
+    planilha = pd.DataFrame({
+        "codigo": [f"p{i}" for i in range(funcionarios)],
+        "nome": [f"Funcionário {i}" for i in range(funcionarios)],
+        "cargo": "Operador",
+        "senha": SENHA,
+        "empresa": 1,
+    })
+    resultado = relatorios.importar_funcionarios(planilha)
+    services.fechar_conexoes()
+    if not resultado["erros"].empty:
+        raise SystemExit(resultado["erros"].to_string())
+
+
+def _extrair_revisao(revisao, destino):
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    pacote = os.path.join(destino, "revisao.tar")
+    with open(pacote, "wb") as arquivo:
+        subprocess.run(["git", "-C", raiz, "archive", revisao], stdout=arquivo, check=True)
+    arvore = os.path.join(destino, "arvore")
+    with tarfile.open(pacote) as tar:
+        tar.extractall(arvore)
+    return arvore
+
+
+def _medir(arvore, nome, repeticoes, banco, codigos, obrigatorio=True):
+    ambiente = dict(os.environ, PYTHONPATH=arvore)
+    paredes, internos, pesados = [], [], set()
+    for _ in range(repeticoes):
+        codigo_funcionario = next(codigos) if "{codigo" in TRECHOS[nome] else None
+        trecho = TRECHOS[nome].format(banco=banco, codigo=codigo_funcionario)
+        codigo = MOLDE.format(trecho=trecho, pesados=PESADOS)
+        inicio = time.perf_counter()
+        saida = subprocess.run(
+            [sys.executable, "-c", codigo], cwd=arvore, env=ambiente, capture_output=True, text=True
+        )
+        paredes.append((time.perf_counter() - inicio) * 1000)
+        if saida.returncode != 0:
+            if not obrigatorio:
+                # Ex.: "import relatorios" numa revisão anterior à criação do módulo.
+                return None
+            raise SystemExit(f"{nome} falhou em {arvore}:\n{saida.stderr}")
+        resultado = json.loads(saida.stdout.strip().splitlines()[-1])
+        internos.append(resultado["interno_ms"])
+        pesados.update(resultado["pesados"])
+    return {
+        "parede_ms": round(statistics.median(paredes), 2),
+        "interno_ms": round(statistics.median(internos), 3),
+        "pesados": sorted(pesados),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeticoes", type=int, default=7)
+    parser.add_argument("--referencia", help="revisão do git para comparar (ex.: HEAD~1)")
+    parser.add_argument("--saida", help="grava os resultados em JSON")
+    args = parser.parse_args()
+
+    arvores = {"atual": os.path.dirname(os.path.dirname(os.path.abspath(__file__)))}
+    resultados = {}
+    with tempfile.TemporaryDirectory() as diretorio:
+        if args.referencia:
+            arvores[args.referencia] = _extrair_revisao(args.referencia, diretorio)
+        banco = os.path.join(diretorio, "partida.db")
+        # Um funcionário novo por batida medida, para que todas sejam a primeira do dia.
+        _preparar_banco(banco, args.repeticoes * len(arvores))
+        codigos = iter(f"p{i}" for i in range(args.repeticoes * len(arvores)))
+
+        for rotulo, arvore in arvores.items():
+            resultados[rotulo] = {
+                nome: _medir(arvore, nome, args.repeticoes, banco, codigos, obrigatorio=rotulo == "atual")
+                for nome in TRECHOS
+            }
+
+    print(f"{'medição':<26} {'árvore':<12} {'parede (ms)':>12} {'interno (ms)':>13}  módulos pesados")
+    for nome in TRECHOS:
+        for rotulo in arvores:
+            r = resultados[rotulo][nome]
+            if r is None:
+                print(f"{nome:<26} {rotulo:<12} {'-':>12} {'-':>13}  (indisponível)")
+                continue
+            print(f"{nome:<26} {rotulo:<12} {r['parede_ms']:>12.1f} {r['interno_ms']:>13.2f}  "
+                  f"{', '.join(r['pesados']) or '-'}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump({"repeticoes": args.repeticoes, "resultados": resultados}, arquivo, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
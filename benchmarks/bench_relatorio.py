@@ -0,0 +1,108 @@
+"""Compara gerar_relatorio_organizado_df com a implementação anterior baseada em apply.
+
+Uso: python -m benchmarks.bench_relatorio [--tamanhos 10000 100000 1000000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import HORARIOS_PADRAO
+from relatorios import gerar_relatorio_organizado_df
+from benchmarks.dados_sinteticos import gerar_registros_df
+
+
+def _formatar_timedelta_legado(td):
+    if pd.isnull(td):
+        return "00:00"
+    total_seconds = int(td.total_seconds())
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, _ = divmod(remainder, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+def gerar_relatorio_legado(df_registros: pd.DataFrame) -> pd.DataFrame:
+    if df_registros.empty:
+        return pd.DataFrame()
+
+    df = df_registros.copy()
+    
+    df_pivot = df.pivot_table(
+        index=['Data', 'Código', 'Nome'],
+        columns='Descrição',
+        values='Hora',
+        aggfunc='first'
+    ).reset_index()
+
+    df_obs = df.dropna(subset=['Observação']).groupby(['Data', 'Código'])['Observação'].apply(lambda x: ' | '.join(x.unique())).reset_index()
+    
+    df_final = pd.merge(df_pivot, df_obs, on=['Data', 'Código'], how='left')
+    df_final['Observação'] = df_final['Observação'].fillna('')
+
+    eventos = list(HORARIOS_PADRAO.keys())
+    for evento in eventos:
+        if evento not in df_final.columns:
+            df_final[evento] = np.nan
+        df_final[evento] = pd.to_datetime(df_final[evento], format='%H:%M:%S', errors='coerce').dt.time
+
+    dt_inicio_expediente = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Início do Expediente'].astype(str), errors='coerce')
+    dt_fim_expediente = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Fim do Expediente'].astype(str), errors='coerce')
+    dt_inicio_almoco = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Início do Almoço'].astype(str), errors='coerce')
+    dt_fim_almoco = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Fim do Almoço'].astype(str), errors='coerce')
+
+    duracao_pausa = dt_fim_almoco - dt_inicio_almoco
+    jornada_bruta = dt_fim_expediente - dt_inicio_expediente
+    
+    duracao_pausa = duracao_pausa.apply(lambda x: x if pd.notna(x) and x.total_seconds() >= 0 else pd.Timedelta(0))
+    
+    horas_trabalhadas = jornada_bruta - duracao_pausa
+
+    df_final['Horas de Pausa'] = duracao_pausa.apply(_formatar_timedelta_legado)
+    df_final['Total Horas Trabalhadas'] = horas_trabalhadas.apply(_formatar_timedelta_legado)
+    
+    colunas_finais = [
+        'Data', 'Código', 'Nome', 
+        'Início do Expediente', 'Início do Almoço', 
+        'Fim do Almoço', 'Fim do Expediente',
+        'Horas de Pausa', 'Total Horas Trabalhadas', 'Observação'
+    ]
+    for col in colunas_finais:
+        if col not in df_final.columns:
+            df_final[col] = 'N/A'
+            
+    df_final = df_final[colunas_finais]
+    
+    df_final.rename(columns={'Código': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'}, inplace=True)
+
+    df_final['Data'] = pd.to_datetime(df_final['Data']).dt.strftime('%d/%m/%Y')
+
+    return df_final
+
+
+def _cronometrar(funcao, df, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = funcao(df)
+        tempos.append(time.perf_counter() - inicio)
+    return min(tempos), resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeticoes", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'batidas':>10} {'legado (s)':>12} {'vetorizado (s)':>15} {'ganho':>7}")
+    for tamanho in args.tamanhos:
+        df = gerar_registros_df(tamanho)
+        tempo_legado, esperado = _cronometrar(gerar_relatorio_legado, df, args.repeticoes)
+        tempo_novo, obtido = _cronometrar(gerar_relatorio_organizado_df, df, args.repeticoes)
+        pd.testing.assert_frame_equal(obtido, esperado)
+        assert obtido.to_csv(index=False) == esperado.to_csv(index=False)
+        print(f"{tamanho:>10} {tempo_legado:>12.3f} {tempo_novo:>15.3f} {tempo_legado / tempo_novo:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
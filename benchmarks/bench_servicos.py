@@ -0,0 +1,188 @@
+"""Mede latência (p50/p95) e pico de memória das principais funções de services.py.
+
+Gera um banco sintético por cenário (funcionários x anos), cronometra cada função
+e grava os resultados num arquivo JSON que serve de linha de base. Com --comparar,
+confronta a execução atual com uma linha de base anterior e termina com código 1
+se alguma mediana piorar além do limite.
+
+Uso:
+    python -m benchmarks.bench_servicos --funcionarios 50 500 --anos 1 --saida baseline.json
+    python -m benchmarks.bench_servicos --funcionarios 50 500 --anos 1 --comparar baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+import analise
+import relatorios
+import services
+from benchmarks.dados_sinteticos import gerar_lotes_escala, popular_banco
+
+
+def _amostrar(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return tempos
+
+
+def _pico_memoria_mb(funcao):
+    # tracemalloc deixa as chamadas bem mais lentas, por isso roda numa chamada à parte.
+    tracemalloc.start()
+    try:
+        funcao()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _resumir(tempos, pico_mb):
+    tempos_ms = np.array(tempos) * 1000
+    return {
+        "amostras": len(tempos_ms),
+        "p50_ms": round(float(np.percentile(tempos_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(tempos_ms, 95)), 3),
+        "pico_mb": round(pico_mb, 2),
+    }
+
+
+def medir_cenario(funcionarios, anos, repeticoes, repeticoes_rapidas, diretorio):
+    caminho = os.path.join(diretorio, f"bench_{funcionarios}_{anos}.db")
+    inicio = time.perf_counter()
+    batidas = popular_banco(caminho, gerar_lotes_escala(funcionarios, anos=anos))
+    print(f"  banco com {batidas} batidas gerado em {time.perf_counter() - inicio:.1f}s")
+
+    rng = random.Random(42)
+    codigos = [str(c) for c in range(1, funcionarios + 1)]
+    df_bruto = relatorios.ler_registros_df()
+    df_organizado = relatorios.gerar_relatorio_organizado_df(df_bruto)
+
+    # bater_ponto grava a primeira batida do dia de funcionários ainda não usados,
+    # de modo que cada amostra percorre o caminho completo de inserção (as duas
+    # chamadas extras são o aquecimento e a medição de memória).
+    livres = iter(rng.sample(codigos, len(codigos)))
+
+    def bater():
+        codigo = next(livres)
+        mensagem, tipo = services.bater_ponto(codigo, f"Funcionário {codigo}", "Operador")
+        assert tipo == "success", mensagem
+
+    # Uma edição seguida da releitura do resumo diário: o relatório em cache só relê o
+    # dia alterado, enquanto gerar_relatorio_resumido_df relê o período inteiro.
+    ids = df_bruto["ID"].tolist()
+
+    def editar_e_reler():
+        services.atualizar_registro(rng.choice(ids), nova_observacao=f"revisado {rng.random():.6f}")
+        relatorios.consultar_relatorio_diario()
+
+    # analisar_jornadas a frio (caches vazios) e depois de uma edição, que só relê o dia alterado.
+    def analisar_a_frio():
+        analise._dias_em_cache.limpar()
+        analise.analisar_jornadas()
+
+    def editar_e_analisar():
+        services.atualizar_registro(rng.choice(ids), nova_observacao=f"revisado {rng.random():.6f}")
+        analise.analisar_jornadas()
+
+    alvos = {
+        "ler_registros_df": (relatorios.ler_registros_df, repeticoes),
+        "obter_proximo_evento": (lambda: services.obter_proximo_evento(rng.choice(codigos)), repeticoes_rapidas),
+        "bater_ponto": (bater, min(repeticoes_rapidas, max(1, funcionarios - 2))),
+        "gerar_relatorio_organizado_df": (lambda: relatorios.gerar_relatorio_organizado_df(df_bruto), repeticoes),
+        "gerar_arquivo_excel": (lambda: relatorios.gerar_arquivo_excel(df_organizado, df_bruto), repeticoes),
+        "gerar_relatorio_resumido_df": (relatorios.gerar_relatorio_resumido_df, repeticoes),
+        "relatorio_diario_apos_edicao": (editar_e_reler, repeticoes_rapidas),
+        "analisar_jornadas": (analisar_a_frio, repeticoes),
+        "analisar_jornadas_apos_edicao": (editar_e_analisar, repeticoes),
+    }
+    resultados = {}
+    for nome, (funcao, n) in alvos.items():
+        funcao()
+        tempos = _amostrar(funcao, n)
+        resultados[nome] = _resumir(tempos, _pico_memoria_mb(funcao))
+        r = resultados[nome]
+        print(f"  {nome:<32} p50 {r['p50_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms  pico {r['pico_mb']:>8.1f} MB")
+
+    services.fechar_conexoes()
+    return {"funcionarios": funcionarios, "anos": anos, "batidas": batidas, "resultados": resultados}
+
+
+def comparar(atual, linha_base, limite):
+    """Imprime a razão atual/linha de base das medianas e devolve as regressões acima de ``limite``."""
+    anteriores = {(c["funcionarios"], c["anos"]): c["resultados"] for c in linha_base["cenarios"]}
+    regressoes = []
+    print(f"\n{'cenário':>14} {'função':<32} {'p50 base':>10} {'p50 atual':>10} {'razão':>7}")
+    for cenario in atual["cenarios"]:
+        chave = (cenario["funcionarios"], cenario["anos"])
+        if chave not in anteriores:
+            continue
+        for nome, resultado in cenario["resultados"].items():
+            base = anteriores[chave].get(nome)
+            if base is None:
+                continue
+            razao = resultado["p50_ms"] / base["p50_ms"] if base["p50_ms"] else float("inf")
+            marca = " <-- regressão" if razao > 1 + limite else ""
+            print(f"{f'{chave[0]}f/{chave[1]}a':>14} {nome:<32} {base['p50_ms']:>10.2f} {resultado['p50_ms']:>10.2f} {razao:>6.2f}x{marca}")
+            if marca:
+                regressoes.append((chave, nome, razao))
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--funcionarios", type=int, nargs="+", default=[50, 500])
+    parser.add_argument("--anos", type=float, nargs="+", default=[1])
+    parser.add_argument("--repeticoes", type=int, default=5, help="amostras das funções pesadas")
+    parser.add_argument("--repeticoes-rapidas", type=int, default=200, help="amostras de obter_proximo_evento e bater_ponto")
+    parser.add_argument("--saida", help="arquivo JSON onde gravar os resultados")
+    parser.add_argument("--comparar", help="linha de base JSON de uma execução anterior")
+    parser.add_argument("--limite-regressao", type=float, default=0.2, help="piora tolerada na mediana (0.2 = 20%%)")
+    parser.add_argument("--diretorio", help="onde criar os bancos sintéticos (padrão: diretório temporário)")
+    args = parser.parse_args()
+
+    resultado = {
+        "gerado_em": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "ambiente": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plataforma": platform.platform(),
+            "processador": platform.processor() or platform.machine(),
+        },
+        "cenarios": [],
+    }
+    with tempfile.TemporaryDirectory(dir=args.diretorio) as diretorio:
+        for funcionarios in args.funcionarios:
+            for anos in args.anos:
+                print(f"{funcionarios} funcionários, {anos:g} ano(s):")
+                resultado["cenarios"].append(
+                    medir_cenario(funcionarios, anos, args.repeticoes, args.repeticoes_rapidas, diretorio)
+                )
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as arquivo:
+            json.dump(resultado, arquivo, indent=2, ensure_ascii=False)
+        print(f"\nResultados gravados em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            regressoes = comparar(resultado, json.load(arquivo), args.limite_regressao)
+        if regressoes:
+            print(f"\n{len(regressoes)} regressão(ões) acima de {args.limite_regressao:.0%}.")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,202 @@
+"""Teste de carga do serviço HTTP (api.py): batidas de ponto por segundo.
+
+Cada conexão (keep-alive) pega funcionários de uma fila e envia as quatro batidas do dia
+de cada um em sequência, como faria um quiosque. Com --local, cria um banco temporário
+com os funcionários de teste e sobe o servidor num subprocesso; sem ele, usa --url e
+funcionários já cadastrados com a mesma senha (códigos --prefixo1, --prefixo2, ...).
+
+O primeiro login de cada funcionário paga o scrypt; por padrão uma rodada de
+aquecimento (GET proximo-evento) preenche o cache de login antes da medição.
+
+Uso:
+    python -m benchmarks.carga_api --local --funcionarios 200 --concorrencia 16
+    python -m benchmarks.carga_api --url http://127.0.0.1:8765 --funcionarios 50 --prefixo carga
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+import numpy as np
+import pandas as pd
+
+import relatorios
+import services
+
+SENHA_PADRAO = "carga123"
+
+
+class Cliente:
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self._reader = None
+        self._writer = None
+
+    async def requisitar(self, metodo, caminho, corpo=None, cabecalhos=None):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.porta)
+        dados = b"" if corpo is None else json.dumps(corpo).encode("utf-8")
+        linhas = [f"{metodo} {caminho} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(dados)}"]
+        if corpo is not None:
+            linhas.append("Content-Type: application/json")
+        linhas.extend(f"{nome}: {valor}" for nome, valor in (cabecalhos or {}).items())
+        self._writer.write(("\r\n".join(linhas) + "\r\n\r\n").encode("latin-1") + dados)
+        await self._writer.drain()
+
+        status = int((await self._reader.readline()).split()[1])
+        tamanho = 0
+        while True:
+            linha = await self._reader.readline()
+            if linha in (b"\r\n", b""):
+                break
+            nome, _, valor = linha.decode("latin-1").partition(":")
+            if nome.strip().lower() == "content-length":
+                tamanho = int(valor)
+        resposta = await self._reader.readexactly(tamanho)
+        return status, resposta
+
+    async def fechar(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
+
+
+def _basic(codigo, senha):
+    return {"Authorization": "Basic " + base64.b64encode(f"{codigo}:{senha}".encode()).decode()}
+
+
+async def _rodar(host, porta, codigos, senha, concorrencia, aquecer):
+    fila = asyncio.Queue()
+    if aquecer:
+        for codigo in codigos:
+            fila.put_nowait(codigo)
+
+        async def aquecedor():
+            cliente = Cliente(host, porta)
+            try:
+                while not fila.empty():
+                    codigo = fila.get_nowait()
+                    await cliente.requisitar("GET", f"/funcionarios/{codigo}/proximo-evento", cabecalhos=_basic(codigo, senha))
+            finally:
+                await cliente.fechar()
+
+        await asyncio.gather(*(aquecedor() for _ in range(concorrencia)))
+
+    for codigo in codigos:
+        fila.put_nowait(codigo)
+    latencias = []
+    status = Counter()
+
+    async def trabalhador():
+        cliente = Cliente(host, porta)
+        try:
+            while not fila.empty():
+                codigo = fila.get_nowait()
+                for _ in range(4):
+                    inicio = time.perf_counter()
+                    codigo_http, _ = await cliente.requisitar("POST", "/batidas", {"codigo": codigo, "senha": senha})
+                    latencias.append(time.perf_counter() - inicio)
+                    status[codigo_http] += 1
+        finally:
+            await cliente.fechar()
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    return time.perf_counter() - inicio, np.array(latencias) * 1000, status
+
+
+def _porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _preparar_local(diretorio, funcionarios, prefixo, senha):
+    caminho = os.path.join(diretorio, "carga.db")
+    services.DATABASE_FILE = caminho
+    services.init_db()
+    planilha = pd.DataFrame({
+        "codigo": [f"{prefixo}{i}" for i in range(1, funcionarios + 1)],
+        "nome": [f"Funcionário {i}" for i in range(1, funcionarios + 1)],
+        "cargo": "Operador",
+        "senha": senha,
+        "empresa": 1,
+    })
+    resultado = relatorios.importar_funcionarios(planilha)
+    services.fechar_conexoes()
+    if not resultado["erros"].empty:
+        raise SystemExit(resultado["erros"].to_string())
+    return caminho
+
+
+def _aguardar_servidor(host, porta, processo, limite_segundos=30):
+    fim = time.monotonic() + limite_segundos
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise SystemExit("O servidor terminou antes de aceitar conexões.")
+        try:
+            with socket.create_connection((host, porta), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise SystemExit("O servidor não respondeu a tempo.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765", help="endereço do serviço (ignorado com --local)")
+    parser.add_argument("--local", action="store_true", help="sobe um servidor próprio num banco temporário")
+    parser.add_argument("--funcionarios", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, default=8, help="conexões simultâneas")
+    parser.add_argument("--prefixo", default="carga", help="prefixo dos códigos dos funcionários de teste")
+    parser.add_argument("--senha", default=SENHA_PADRAO)
+    parser.add_argument("--sem-aquecimento", action="store_true", help="mede também o primeiro login (scrypt)")
+    args = parser.parse_args()
+
+    codigos = [f"{args.prefixo}{i}" for i in range(1, args.funcionarios + 1)]
+    processo = None
+    with tempfile.TemporaryDirectory() as diretorio:
+        if args.local:
+            host, porta = "127.0.0.1", _porta_livre()
+            caminho = _preparar_local(diretorio, args.funcionarios, args.prefixo, args.senha)
+            raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            processo = subprocess.Popen(
+                [sys.executable, os.path.join(raiz, "cli.py"), "--banco", caminho, "servidor", "--porta", str(porta)],
+                stdout=subprocess.DEVNULL,
+            )
+            _aguardar_servidor(host, porta, processo)
+        else:
+            endereco = urlsplit(args.url)
+            host, porta = endereco.hostname, endereco.port or 80
+
+        try:
+            duracao, latencias, status = asyncio.run(
+                _rodar(host, porta, codigos, args.senha, args.concorrencia, not args.sem_aquecimento)
+            )
+        finally:
+            if processo is not None:
+                processo.terminate()
+                processo.wait()
+
+    total = len(latencias)
+    aceitas = status.get(201, 0)
+    print(f"{total} requisições em {duracao:.2f}s com {args.concorrencia} conexões")
+    print(f"  batidas registradas: {aceitas} ({aceitas / duracao:.1f}/s)")
+    print(f"  requisições/s: {total / duracao:.1f}")
+    print(f"  latência p50 {np.percentile(latencias, 50):.2f} ms  p95 {np.percentile(latencias, 95):.2f} ms  "
+          f"máx {latencias.max():.2f} ms")
+    print(f"  status: {dict(sorted(status.items()))}")
+    return 0 if aceitas == total else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
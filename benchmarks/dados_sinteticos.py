@@ -0,0 +1,113 @@
+"""Geração de batidas de ponto sintéticas para os benchmarks.
+
+As batidas seguem HORARIOS_PADRAO com variação aleatória de alguns minutos,
+e uma fração dos eventos do dia é omitida para exercitar jornadas incompletas.
+Uma fração das batidas restantes simula edições do administrador: a hora é
+ajustada para o horário previsto e a observação é preenchida.
+"""
+import numpy as np
+import pandas as pd
+
+import services
+from config import HORARIOS_PADRAO
+from relatorios import COLUNAS_REGISTROS
+
+EVENTOS = list(HORARIOS_PADRAO.keys())
+SEGUNDOS_PREVISTOS = np.array([h.hour * 3600 + h.minute * 60 for h in HORARIOS_PADRAO.values()])
+
+
+def _gerar_batidas(codigos_funcionarios, datas, rng, fracao_ausentes, fracao_observacoes):
+    num_funcionarios, dias = len(codigos_funcionarios), len(datas)
+    codigos = np.repeat(np.asarray(codigos_funcionarios), dias * len(EVENTOS))
+    datas = np.tile(np.repeat(np.asarray(datas, dtype=object), len(EVENTOS)), num_funcionarios)
+    indices_eventos = np.tile(np.arange(len(EVENTOS)), num_funcionarios * dias)
+
+    segundos = SEGUNDOS_PREVISTOS[indices_eventos] + rng.integers(-15 * 60, 15 * 60, size=len(indices_eventos))
+    manter = rng.random(len(indices_eventos)) >= fracao_ausentes
+    manter[:len(EVENTOS)] = True
+
+    codigos, datas, indices_eventos, segundos = (
+        codigos[manter], datas[manter], indices_eventos[manter], segundos[manter]
+    )
+    editados = rng.random(len(codigos)) < fracao_observacoes
+    segundos = np.where(editados, SEGUNDOS_PREVISTOS[indices_eventos], segundos)
+
+    codigos = codigos.astype(str)
+    horas = (
+        pd.Series(segundos // 3600).astype(str).str.zfill(2) + ":"
+        + pd.Series(segundos // 60 % 60).astype(str).str.zfill(2) + ":"
+        + pd.Series(segundos % 60).astype(str).str.zfill(2)
+    ).to_numpy()
+    diferencas = services.calcular_diferencas_min(segundos, SEGUNDOS_PREVISTOS[indices_eventos])
+    observacoes = np.where(editados, "Ajuste manual", "")
+
+    df = pd.DataFrame({
+        "id": codigos.astype(object) + "-" + datas + "-" + indices_eventos.astype(str).astype(object),
+        "codigo_funcionario": codigos,
+        "nome": np.char.add("Funcionário ", codigos),
+        "cargo": "Operador",
+        "data": datas,
+        "hora": horas,
+        "descricao": np.array(EVENTOS, dtype=object)[indices_eventos],
+        "diferenca_min": diferencas,
+        "observacao": observacoes,
+    })
+    return df.rename(columns=COLUNAS_REGISTROS)
+
+
+def gerar_registros_df(total_batidas, dias=250, fracao_ausentes=0.03, fracao_observacoes=0.02, semente=42):
+    """Retorna cerca de ``total_batidas`` linhas no formato de ``consultar_registros``."""
+    rng = np.random.default_rng(semente)
+    dias = max(1, min(dias, total_batidas // len(EVENTOS)))
+    num_funcionarios = max(1, -(-total_batidas // (dias * len(EVENTOS))))
+    datas = pd.date_range("2024-01-01", periods=dias, freq="D").strftime("%Y-%m-%d").to_numpy()
+    df = _gerar_batidas(np.arange(1, num_funcionarios + 1), datas, rng, fracao_ausentes, fracao_observacoes)
+    return df.head(total_batidas)
+
+
+def gerar_lotes_escala(funcionarios, anos=1, fracao_ausentes=0.03, fracao_editados=0.02, semente=42,
+                       funcionarios_por_lote=500):
+    """Gera, em lotes de funcionários, ``anos`` de dias úteis de batidas para ``funcionarios`` pessoas.
+
+    Os lotes podem ser passados diretamente a ``popular_banco`` sem materializar a base inteira.
+    """
+    rng = np.random.default_rng(semente)
+    datas = pd.bdate_range("2020-01-01", periods=int(round(anos * 261))).strftime("%Y-%m-%d").to_numpy()
+    for inicio in range(1, funcionarios + 1, funcionarios_por_lote):
+        codigos = np.arange(inicio, min(inicio + funcionarios_por_lote, funcionarios + 1))
+        yield _gerar_batidas(codigos, datas, rng, fracao_ausentes, fracao_editados)
+
+
+def popular_banco(caminho, df_registros):
+    """Cria (ou reabre) ``caminho``, aponta ``services`` para ele e grava os registros.
+
+    ``df_registros`` pode ser um DataFrame ou um iterável de DataFrames (como ``gerar_lotes_escala``).
+    """
+    services.DATABASE_FILE = caminho
+    services.fechar_conexoes()
+    services.init_db()
+
+    lotes = [df_registros] if isinstance(df_registros, pd.DataFrame) else df_registros
+    colunas_sql = {v: k for k, v in COLUNAS_REGISTROS.items()}
+    senha = services._hash_senha("senha")
+    total = 0
+    with services.get_db_connection(escrita=True) as conn:
+        for lote in lotes:
+            registros = lote.rename(columns=colunas_sql)
+            funcionarios = registros.drop_duplicates("codigo_funcionario")
+            empresas = funcionarios["codigo_funcionario"].astype(int) % 4 + 1
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO funcionarios (codigo, nome, cargo, senha, role, empresa_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(funcionarios["codigo_funcionario"], funcionarios["nome"], funcionarios["cargo"],
+                        [senha] * len(funcionarios), ["employee"] * len(funcionarios),
+                        empresas.tolist()),
+                )
+                conn.executemany(
+                    f"INSERT INTO registros ({', '.join(registros.columns)}) VALUES ({', '.join('?' * len(registros.columns))})",
+                    zip(*(registros[coluna].to_numpy(dtype=object).tolist() for coluna in registros.columns)),
+                )
+            total += len(registros)
+    services.invalidar_cache_referencia()
+    services.reconstruir_resumo_diario()
+    return total
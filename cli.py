@@ -0,0 +1,179 @@
+"""Comandos de manutenção do banco de ponto.
+
+Uso: python cli.py <comando> [opções]
+"""
+import argparse
+import sys
+
+import services
+from config import API_HOST, API_PORTA, TAMANHO_PAGINA_HISTORICO
+
+
+def _reconstruir_resumo(args):
+    total = services.reconstruir_resumo_diario(args.inicio, args.fim)
+    print(f"Resumo diário reconstruído: {total} dia(s) de funcionário.")
+
+
+def _importar_batidas(args):
+    import pandas as pd
+
+    import relatorios
+
+    eventos = pd.read_csv(args.arquivo, dtype=str, usecols=["codigo", "momento"])
+    resultado = relatorios.importar_batidas(eventos)
+    print(f"Batidas inseridas: {resultado['inseridos']}")
+    print(f"Duplicadas: {len(resultado['duplicados'])}")
+    print(f"Rejeitadas: {len(resultado['rejeitados'])}")
+    if args.relatorio:
+        pd.concat([resultado["duplicados"], resultado["rejeitados"]], ignore_index=True).to_csv(args.relatorio, index=False)
+        print(f"Detalhes gravados em {args.relatorio}")
+
+
+def _recalcular_diferencas(args):
+    import relatorios
+
+    tolerancia = services.TOLERANCIA_MINUTOS if args.tolerancia is None else args.tolerancia
+    total = relatorios.recalcular_diferencas(args.inicio, args.fim, args.empresa, tolerancia=tolerancia)
+    print(f"Diferenças recalculadas: {total} registro(s) alterado(s).")
+
+
+def _importar_funcionarios(args):
+    import relatorios
+
+    resultado = relatorios.importar_funcionarios(relatorios.ler_planilha_funcionarios(args.arquivo))
+    print(f"Funcionários cadastrados: {resultado['inseridos']}")
+    print(f"Linhas com erro: {len(resultado['erros'])}")
+    if args.relatorio:
+        resultado["erros"].to_csv(args.relatorio, index=False)
+        print(f"Detalhes gravados em {args.relatorio}")
+
+
+def _arquivar_meses(args):
+    if args.mes:
+        arquivados = {mes: services.arquivar_mes(mes) for mes in args.mes}
+    else:
+        arquivados = services.arquivar_meses_fechados(args.meses_quentes)
+    for mes, total in arquivados.items():
+        print(f"{mes}: {total} registro(s) arquivado(s).")
+    if not arquivados:
+        print("Nenhum mês encerrado para arquivar.")
+    if args.compactar:
+        services.compactar_banco()
+        print("Banco principal compactado.")
+
+
+def _desarquivar_mes(args):
+    total = services.desarquivar_mes(args.mes)
+    print(f"{args.mes}: {total} registro(s) devolvido(s) ao banco principal.")
+
+
+def _servidor(args):
+    import api
+    api.executar(args.host, args.porta)
+
+
+def _bater_ponto(args):
+    funcionario = services.obter_funcionario(args.codigo)
+    if funcionario is None:
+        print(f"Funcionário {args.codigo} não cadastrado.")
+        return 1
+    mensagem, tipo = services.bater_ponto(args.codigo, funcionario["nome"], funcionario["cargo"])
+    print(mensagem)
+    return 0 if tipo == "success" else 1
+
+
+def _historico(args):
+    import relatorios
+
+    pagina, cursor = relatorios.consultar_historico_funcionario(args.codigo, limite=args.limite)
+    if pagina.empty:
+        print("Nenhum registro.")
+        return
+    print(pagina[["Data", "Hora", "Descrição", "Diferença (min)", "Observação"]].to_string(index=False))
+    if cursor is not None:
+        print(f"... (mais registros; use --limite maior que {args.limite})")
+
+
+def _relatorio(args):
+    import relatorios
+
+    relatorios.exportar_registros(
+        args.formato, args.saida, empresa_id=args.empresa, data_inicio=args.inicio, data_fim=args.fim, codigo=args.codigo
+    )
+    print(f"Relatório gravado em {args.saida}")
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Ferramentas de linha de comando do Ponto Omega.")
+    parser.add_argument("--banco", help="caminho do arquivo SQLite (padrão: config.DATABASE_FILE)")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    reconstruir = comandos.add_parser("reconstruir-resumo", help="recalcula a tabela resumo_diario a partir dos registros")
+    reconstruir.add_argument("--inicio", help="data inicial (AAAA-MM-DD)")
+    reconstruir.add_argument("--fim", help="data final (AAAA-MM-DD)")
+    reconstruir.set_defaults(executar=_reconstruir_resumo)
+
+    recalcular = comandos.add_parser("recalcular-diferencas", help="recalcula diferenca_min com a tolerância e os horários atuais")
+    recalcular.add_argument("--inicio", help="data inicial (AAAA-MM-DD)")
+    recalcular.add_argument("--fim", help="data final (AAAA-MM-DD)")
+    recalcular.add_argument("--empresa", type=int, help="id da empresa")
+    recalcular.add_argument("--tolerancia", type=int, help="tolerância em minutos (padrão: config.TOLERANCIA_MINUTOS)")
+    recalcular.set_defaults(executar=_recalcular_diferencas)
+
+    importar = comandos.add_parser("importar-batidas", help="importa batidas de um CSV com colunas codigo,momento")
+    importar.add_argument("arquivo", help="CSV exportado pelo relógio de ponto")
+    importar.add_argument("--relatorio", help="CSV onde gravar as batidas duplicadas e rejeitadas")
+    importar.set_defaults(executar=_importar_batidas)
+
+    funcionarios = comandos.add_parser("importar-funcionarios", help="cadastra funcionários a partir de uma planilha CSV ou XLSX")
+    funcionarios.add_argument("arquivo", help="planilha com colunas codigo,nome,cargo,senha,empresa")
+    funcionarios.add_argument("--relatorio", help="CSV onde gravar as linhas com erro")
+    funcionarios.set_defaults(executar=_importar_funcionarios)
+
+    arquivar = comandos.add_parser("arquivar-meses", help="move meses encerrados para os bancos anuais de arquivo")
+    arquivar.add_argument("--mes", nargs="+", help="meses específicos (AAAA-MM); padrão: todos os encerrados")
+    arquivar.add_argument("--meses-quentes", type=int, default=services.ARQUIVO_MESES_QUENTES,
+                          help="meses mantidos no banco principal, contando o atual (padrão: config.ARQUIVO_MESES_QUENTES)")
+    arquivar.add_argument("--compactar", action="store_true", help="executa VACUUM no banco principal ao final")
+    arquivar.set_defaults(executar=_arquivar_meses)
+
+    desarquivar = comandos.add_parser("desarquivar-mes", help="devolve um mês arquivado ao banco principal para correções")
+    desarquivar.add_argument("mes", help="mês no formato AAAA-MM")
+    desarquivar.set_defaults(executar=_desarquivar_mes)
+
+    servidor = comandos.add_parser("servidor", help="inicia o serviço HTTP (api.py) para quiosques e integrações")
+    servidor.add_argument("--host", default=API_HOST, help="interface (padrão: config.API_HOST)")
+    servidor.add_argument("--porta", type=int, default=API_PORTA, help="porta (padrão: config.API_PORTA)")
+    servidor.set_defaults(executar=_servidor)
+
+    bater = comandos.add_parser("bater-ponto", help="registra o próximo evento do dia para um funcionário")
+    bater.add_argument("codigo", help="código do funcionário")
+    bater.set_defaults(executar=_bater_ponto)
+
+    historico = comandos.add_parser("historico", help="mostra as batidas mais recentes de um funcionário")
+    historico.add_argument("codigo", help="código do funcionário")
+    historico.add_argument("--limite", type=int, default=TAMANHO_PAGINA_HISTORICO, help="quantidade de batidas")
+    historico.set_defaults(executar=_historico)
+
+    relatorio = comandos.add_parser("relatorio", help="exporta os registros filtrados para um arquivo")
+    relatorio.add_argument("saida", help="arquivo de destino")
+    relatorio.add_argument("--formato", default="csv", choices=("csv", "parquet", "xlsx"), help="formato do arquivo")
+    relatorio.add_argument("--inicio", help="data inicial (AAAA-MM-DD)")
+    relatorio.add_argument("--fim", help="data final (AAAA-MM-DD)")
+    relatorio.add_argument("--empresa", type=int, help="id da empresa")
+    relatorio.add_argument("--codigo", help="código do funcionário")
+    relatorio.set_defaults(executar=_relatorio)
+
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    if args.banco:
+        services.DATABASE_FILE = args.banco
+    services.init_db()
+    return args.executar(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,48 @@ FUSO_HORARIO = ZoneInfo("America/Fortaleza")
 DATABASE_FILE = "ponto.db"
 RELATORIO_CSV = "relatorio_ponto.csv"
 
+POOL_CONEXOES_LEITURA = 4
+SQLITE_BUSY_TIMEOUT_MS = 5000
+SQLITE_CACHE_SIZE_KB = 16384
+
+CACHE_REFERENCIA_TTL_SEGUNDOS = None
+
+SENHA_SCRYPT_N = 2 ** 14
+SENHA_SCRYPT_R = 8
+SENHA_SCRYPT_P = 1
+SENHA_THREADS_KDF = 4
+SENHA_KDF_PENDENTES_MAX = 32
+SENHA_KDF_ESPERA_SEGUNDOS = 10
+
+LOGIN_TENTATIVAS_MAX = 5
+LOGIN_JANELA_TENTATIVAS_SEGUNDOS = 300
+LOGIN_CODIGOS_MONITORADOS_MAX = 10000
+LOGIN_CACHE_TAMANHO = 1024
+LOGIN_CACHE_TTL_SEGUNDOS = 900
+
+TAMANHO_PAGINA_ADMIN = 50
+TAMANHO_PAGINA_HISTORICO = 20
+TAMANHO_LOTE_EXPORTACAO = 10000
+RELATORIOS_EM_CACHE = 16
+ANALISE_EM_CACHE = 4
+DIRETORIO_EXPORTACOES = "exportacoes"
+PROCESSOS_EXPORTACAO = 2
+RETENCAO_EXPORTACOES_HORAS = 24
+
+DIRETORIO_ARQUIVO = "arquivo"
+ARQUIVO_MESES_QUENTES = 3
+
+API_HOST = "127.0.0.1"
+API_PORTA = 8765
+API_THREADS = 8
+API_TAMANHO_MAX_CORPO = 1024 * 1024
+API_TAMANHO_BLOCO_ENVIO = 256 * 1024
+
+METRICAS_ATIVAS = False
+METRICAS_LIMITES_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICAS_ORCAMENTO_TELA_SEGUNDOS = 2.0
+METRICAS_ARQUIVO_PROMETHEUS = "metricas_ponto.prom"
+
 TOLERANCIA_MINUTOS = 5
 
 HORARIOS_PADRAO = {
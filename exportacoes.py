@@ -0,0 +1,174 @@
+"""Fila de exportações em segundo plano.
+
+Cada pedido (formato + filtros + última mudança nos dias filtrados) vira uma chave SHA-256.
+O arquivo é gerado num processo separado, gravado em DIRETORIO_EXPORTACOES com a chave no
+nome e reaproveitado enquanto nenhum registro do período mudar.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import relatorios
+import services
+from config import DIRETORIO_EXPORTACOES, PROCESSOS_EXPORTACAO, RETENCAO_EXPORTACOES_HORAS
+
+def _normalizar_filtros(filtros):
+    return {
+        nome: valor.isoformat() if hasattr(valor, "isoformat") else valor
+        for nome, valor in sorted(filtros.items())
+    }
+
+def chave_exportacao(formato, **filtros):
+    # A seq da última mudança nos dias do filtro entra na chave: uma escrita nesses dias
+    # gera uma chave nova, e batidas fora do período não invalidam o arquivo.
+    caminho_banco = os.path.abspath(services.DATABASE_FILE)
+    versao = services.obter_sequencia_mudancas(**filtros)
+    pedido = {
+        "formato": formato,
+        "banco": caminho_banco,
+        "versao": versao,
+        "filtros": _normalizar_filtros(filtros),
+    }
+    return hashlib.sha256(json.dumps(pedido, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+def _gravar_progresso(caminho, linhas):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as arquivo:
+        arquivo.write(str(linhas))
+    os.replace(temporario, caminho)
+
+def _executar_exportacao(caminho_banco, formato, filtros, destino, arquivo_progresso):
+    # Roda no processo filho (contexto spawn): services é importado do zero e apontado
+    # para o mesmo banco. O arquivo só aparece no destino final quando está completo.
+    services.DATABASE_FILE = caminho_banco
+    escritas = {"linhas": 0, "ultima": 0.0}
+
+    def progresso(linhas):
+        escritas["linhas"] += linhas
+        agora = time.monotonic()
+        if agora - escritas["ultima"] >= 0.5:
+            escritas["ultima"] = agora
+            _gravar_progresso(arquivo_progresso, escritas["linhas"])
+
+    temporario = destino + ".parcial"
+    try:
+        relatorios.exportar_registros(formato, temporario, progresso=progresso, **filtros)
+        os.replace(temporario, destino)
+    finally:
+        for caminho in (temporario, arquivo_progresso):
+            if os.path.exists(caminho):
+                os.remove(caminho)
+        services.fechar_conexoes()
+    return destino
+
+class FilaExportacao:
+    def __init__(self, diretorio=DIRETORIO_EXPORTACOES, processos=PROCESSOS_EXPORTACAO,
+                 retencao_horas=RETENCAO_EXPORTACOES_HORAS):
+        self.diretorio = diretorio
+        self.processos = processos
+        self.retencao_horas = retencao_horas
+        self._executor = None
+        self._tarefas = {}
+        self._lock = threading.Lock()
+
+    def _obter_executor(self):
+        if self._executor is None:
+            # spawn: o processo filho não herda conexões SQLite nem threads do Streamlit.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.processos, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def caminho_arquivo(self, chave, formato):
+        return os.path.join(self.diretorio, f"relatorio_{chave}.{formato}")
+
+    def _caminho_progresso(self, chave):
+        return os.path.join(self.diretorio, f".{chave}.progresso")
+
+    def limpar_antigos(self):
+        if self.retencao_horas is None or not os.path.isdir(self.diretorio):
+            return
+        limite = time.time() - self.retencao_horas * 3600
+        with self._lock:
+            em_andamento = {chave for chave, tarefa in self._tarefas.items() if not tarefa["futuro"].done()}
+        for nome in os.listdir(self.diretorio):
+            caminho = os.path.join(self.diretorio, nome)
+            if any(chave in nome for chave in em_andamento):
+                continue
+            try:
+                if os.path.getmtime(caminho) < limite:
+                    os.remove(caminho)
+            except OSError:
+                pass
+
+    def solicitar(self, formato, **filtros):
+        if formato not in relatorios.EXPORTADORES:
+            raise ValueError(f"Formato de exportação desconhecido: '{formato}'.")
+        caminho_banco = os.path.abspath(services.DATABASE_FILE)
+        chave = chave_exportacao(formato, **filtros)
+        destino = self.caminho_arquivo(chave, formato)
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+            if os.path.exists(destino) or (tarefa is not None and not tarefa["futuro"].done()):
+                return chave
+            os.makedirs(self.diretorio, exist_ok=True)
+            argumentos = (caminho_banco, formato, filtros, destino, self._caminho_progresso(chave))
+            try:
+                futuro = self._obter_executor().submit(_executar_exportacao, *argumentos)
+            except BrokenProcessPool:
+                # Um processo filho morreu (falta de memória, kill): recria o pool uma vez.
+                self._executor = None
+                futuro = self._obter_executor().submit(_executar_exportacao, *argumentos)
+            self._tarefas[chave] = {
+                "formato": formato,
+                "futuro": futuro,
+                "total": relatorios.contar_linhas_exportacao(formato, **filtros),
+                "inicio": time.monotonic(),
+            }
+        self.limpar_antigos()
+        return chave
+
+    def situacao(self, chave, formato):
+        """Devolve um dict com ``estado`` ("pronto", "em_andamento", "erro" ou "ausente"),
+        ``progresso`` (0 a 1), ``caminho`` e ``erro``."""
+        destino = self.caminho_arquivo(chave, formato)
+        with self._lock:
+            tarefa = self._tarefas.get(chave)
+        if tarefa is not None and tarefa["futuro"].done():
+            erro = tarefa["futuro"].exception()
+            if erro is not None:
+                return {"estado": "erro", "progresso": 0.0, "caminho": None, "erro": str(erro)}
+        if os.path.exists(destino):
+            return {"estado": "pronto", "progresso": 1.0, "caminho": destino, "erro": None}
+        if tarefa is None:
+            return {"estado": "ausente", "progresso": 0.0, "caminho": None, "erro": None}
+        try:
+            with open(self._caminho_progresso(chave), encoding="utf-8") as arquivo:
+                linhas = int(arquivo.read() or 0)
+        except (OSError, ValueError):
+            linhas = 0
+        progresso = min(linhas / tarefa["total"], 0.99) if tarefa["total"] else 0.0
+        return {"estado": "em_andamento", "progresso": progresso, "caminho": None, "erro": None}
+
+    def encerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+_fila = None
+_fila_lock = threading.Lock()
+
+def obter_fila():
+    # Uma fila por processo do Streamlit, compartilhada entre as sessões: dois
+    # administradores pedindo o mesmo relatório reaproveitam a mesma tarefa.
+    global _fila
+    with _fila_lock:
+        if _fila is None:
+            _fila = FilaExportacao()
+        return _fila
@@ -0,0 +1,253 @@
+"""Instrumentação opcional do Ponto Omega.
+
+Ativada por config.METRICAS_ATIVAS. Registra histogramas de duração das consultas SQL
+(com linhas lidas/afetadas), das funções de services.py e da renderização das telas,
+e exporta tudo no formato texto do Prometheus.
+"""
+import bisect
+import functools
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from config import (
+    METRICAS_ATIVAS, METRICAS_LIMITES_SEGUNDOS, METRICAS_ORCAMENTO_TELA_SEGUNDOS, METRICAS_ARQUIVO_PROMETHEUS
+)
+
+_ativo = METRICAS_ATIVAS
+
+AJUDA = {
+    "ponto_sql_execucao_segundos": "Tempo de execute/executemany por comando SQL.",
+    "ponto_sql_leitura_segundos": "Tempo de fetchone/fetchmany/fetchall por comando SQL.",
+    "ponto_sql_linhas_total": "Linhas lidas (fetch) ou afetadas (INSERT/UPDATE/DELETE) por comando SQL.",
+    "ponto_funcao_duracao_segundos": "Duração das funções de services.py.",
+    "ponto_tela_duracao_segundos": "Duração da renderização de cada tela do Streamlit.",
+    "ponto_telas_acima_orcamento_total": "Renderizações que passaram de METRICAS_ORCAMENTO_TELA_SEGUNDOS.",
+}
+
+def ativo():
+    return _ativo
+
+def ativar(valor=True):
+    # As conexões já abertas continuam sem instrumentação de SQL até services.fechar_conexoes().
+    global _ativo
+    _ativo = bool(valor)
+
+class _Histograma:
+    __slots__ = ("contagens", "soma", "total")
+
+    def __init__(self, num_limites):
+        self.contagens = [0] * (num_limites + 1)
+        self.soma = 0.0
+        self.total = 0
+
+class Registro:
+    def __init__(self, limites):
+        self.limites = tuple(sorted(limites))
+        self._histogramas = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    def observar(self, nome, segundos, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        indice = bisect.bisect_left(self.limites, segundos)
+        with self._lock:
+            histograma = self._histogramas.get(chave)
+            if histograma is None:
+                histograma = self._histogramas[chave] = _Histograma(len(self.limites))
+            histograma.contagens[indice] += 1
+            histograma.soma += segundos
+            histograma.total += 1
+
+    def incrementar(self, nome, valor=1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self._lock:
+            self._contadores[chave] = self._contadores.get(chave, 0) + valor
+
+    def limpar(self):
+        with self._lock:
+            self._histogramas.clear()
+            self._contadores.clear()
+
+    def _quantil(self, histograma, q):
+        # Estimativa pelo limite superior do balde, como histogram_quantile sem interpolação.
+        alvo = q * histograma.total
+        acumulado = 0
+        for limite, contagem in zip(self.limites + (float("inf"),), histograma.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return limite
+        return float("inf")
+
+    def resumo(self):
+        with self._lock:
+            histogramas = [(chave, h.total, h.soma, list(h.contagens)) for chave, h in self._histogramas.items()]
+            contadores = dict(self._contadores)
+        linhas = []
+        for (nome, rotulos), total, soma, contagens in sorted(histogramas):
+            histograma = _Histograma(len(self.limites))
+            histograma.total, histograma.contagens = total, contagens
+            linhas.append({
+                "metrica": nome,
+                "rotulos": ", ".join(f"{k}={v}" for k, v in rotulos),
+                "chamadas": total,
+                "total_s": round(soma, 4),
+                "media_ms": round(soma / total * 1000, 3) if total else 0.0,
+                "p50_ate_ms": self._quantil(histograma, 0.5) * 1000,
+                "p95_ate_ms": self._quantil(histograma, 0.95) * 1000,
+                "linhas": contadores.get(("ponto_sql_linhas_total", rotulos)),
+            })
+        return linhas
+
+    def texto_prometheus(self):
+        with self._lock:
+            histogramas = sorted((chave, h.total, h.soma, list(h.contagens)) for chave, h in self._histogramas.items())
+            contadores = sorted(self._contadores.items())
+        saida = []
+        declarados = set()
+
+        def declarar(nome, tipo):
+            if nome not in declarados:
+                declarados.add(nome)
+                saida.append(f"# HELP {nome} {AJUDA.get(nome, nome)}")
+                saida.append(f"# TYPE {nome} {tipo}")
+
+        for (nome, rotulos), total, soma, contagens in histogramas:
+            declarar(nome, "histogram")
+            acumulado = 0
+            for limite, contagem in zip(self.limites + (float("inf"),), contagens):
+                acumulado += contagem
+                le = "+Inf" if limite == float("inf") else repr(float(limite))
+                saida.append(f"{nome}_bucket{_rotulos_prometheus(rotulos + (('le', le),))} {acumulado}")
+            saida.append(f"{nome}_sum{_rotulos_prometheus(rotulos)} {soma!r}")
+            saida.append(f"{nome}_count{_rotulos_prometheus(rotulos)} {total}")
+        for (nome, rotulos), valor in contadores:
+            declarar(nome, "counter")
+            saida.append(f"{nome}{_rotulos_prometheus(rotulos)} {valor}")
+        return "\n".join(saida) + "\n"
+
+def _escapar_rotulo(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _rotulos_prometheus(rotulos):
+    if not rotulos:
+        return ""
+    return "{" + ",".join(f'{k}="{_escapar_rotulo(v)}"' for k, v in rotulos) + "}"
+
+registro = Registro(METRICAS_LIMITES_SEGUNDOS)
+
+@functools.lru_cache(maxsize=1024)
+def _normalizar_sql(sql):
+    return " ".join(sql.split())[:160]
+
+class CursorInstrumentado(sqlite3.Cursor):
+    _consulta = None
+
+    def execute(self, sql, parametros=()):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(sql, parametros)
+        finally:
+            self._registrar_execucao(sql, inicio)
+
+    def executemany(self, sql, parametros):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(sql, parametros)
+        finally:
+            self._registrar_execucao(sql, inicio)
+
+    def _registrar_execucao(self, sql, inicio):
+        self._consulta = _normalizar_sql(sql)
+        registro.observar("ponto_sql_execucao_segundos", time.perf_counter() - inicio, consulta=self._consulta)
+        if self.rowcount > 0:
+            registro.incrementar("ponto_sql_linhas_total", self.rowcount, consulta=self._consulta)
+
+    def _registrar_leitura(self, inicio, linhas):
+        if self._consulta is not None:
+            registro.observar("ponto_sql_leitura_segundos", time.perf_counter() - inicio, consulta=self._consulta)
+            if linhas:
+                registro.incrementar("ponto_sql_linhas_total", linhas, consulta=self._consulta)
+
+    def fetchone(self):
+        inicio = time.perf_counter()
+        linha = super().fetchone()
+        self._registrar_leitura(inicio, 0 if linha is None else 1)
+        return linha
+
+    def fetchmany(self, size=None):
+        inicio = time.perf_counter()
+        linhas = super().fetchmany(self.arraysize if size is None else size)
+        self._registrar_leitura(inicio, len(linhas))
+        return linhas
+
+    def fetchall(self):
+        inicio = time.perf_counter()
+        linhas = super().fetchall()
+        self._registrar_leitura(inicio, len(linhas))
+        return linhas
+
+class ConexaoInstrumentada(sqlite3.Connection):
+    # Passada como factory para sqlite3.connect. Conexão.execute do C não usa o método
+    # cursor(), então execute/executemany são redirecionados para o cursor instrumentado.
+    # Linhas percorridas por iteração direta (for linha in cursor) não entram na contagem.
+    def cursor(self, factory=CursorInstrumentado):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametros=()):
+        return self.cursor().execute(sql, parametros)
+
+    def executemany(self, sql, parametros):
+        return self.cursor().executemany(sql, parametros)
+
+def fabrica_conexao():
+    return ConexaoInstrumentada if _ativo else sqlite3.Connection
+
+def instrumentar(funcao):
+    nome = funcao.__name__
+
+    @functools.wraps(funcao)
+    def envoltorio(*args, **kwargs):
+        if not _ativo:
+            return funcao(*args, **kwargs)
+        inicio = time.perf_counter()
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            registro.observar("ponto_funcao_duracao_segundos", time.perf_counter() - inicio, funcao=nome)
+    return envoltorio
+
+def exportar_prometheus(caminho=METRICAS_ARQUIVO_PROMETHEUS):
+    # Escrita atômica (arquivo temporário + os.replace), como espera o coletor
+    # "textfile" do node_exporter.
+    diretorio = os.path.dirname(os.path.abspath(caminho))
+    descritor, temporario = tempfile.mkstemp(dir=diretorio, prefix=".metricas_", suffix=".prom")
+    try:
+        with os.fdopen(descritor, "w", encoding="utf-8") as arquivo:
+            arquivo.write(registro.texto_prometheus())
+        os.replace(temporario, caminho)
+    except BaseException:
+        os.unlink(temporario)
+        raise
+    return caminho
+
+@contextmanager
+def medir_tela(nome, orcamento_segundos=METRICAS_ORCAMENTO_TELA_SEGUNDOS):
+    if not _ativo:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        registro.observar("ponto_tela_duracao_segundos", duracao, tela=nome)
+        if orcamento_segundos is not None and duracao > orcamento_segundos:
+            registro.incrementar("ponto_telas_acima_orcamento_total", tela=nome)
+            try:
+                exportar_prometheus()
+            except OSError:
+                pass
@@ -0,0 +1,1026 @@
+"""Consultas em DataFrame, importações em lote e relatórios/exportações do Ponto Omega.
+
+Fica fora de services.py para que pandas, NumPy e openpyxl só sejam importados quando
+uma tela, comando ou rota precisar deles: login e batida de ponto não passam por aqui.
+services.py reexporta estes nomes sob demanda (PEP 562), então `services.ler_funcionarios_df`
+e `from services import gerar_arquivo_csv` continuam funcionando.
+"""
+import functools
+import importlib.util
+import io
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+
+import metricas
+import services
+from config import (
+    FUSO_HORARIO, HORARIOS_PADRAO, RELATORIOS_EM_CACHE, TAMANHO_LOTE_EXPORTACAO, TAMANHO_PAGINA_HISTORICO,
+    TOLERANCIA_MINUTOS
+)
+from services import (
+    _cache_referencia,
+    _filtro_periodo,
+    _filtros_registros,
+    _fonte,
+    _formatar_data_filtro,
+    _formatar_horario,
+    _hash_senhas,
+    _intervalos_arquivados,
+    _periodos_consulta,
+    _periodos_por_ano,
+    _recalcular_resumo,
+    _registrar_auditoria,
+    _segundos_previstos,
+    _transacao_imediata,
+    calcular_diferencas_min,
+    contar_registros,
+    get_db_connection,
+    invalidar_cache_referencia,
+    obter_horarios_empresa,
+    obter_horarios_funcionario,
+)
+
+def _carregar_empresas():
+    with get_db_connection() as conn:
+        return pd.read_sql_query("SELECT id, nome_empresa FROM empresas ORDER BY nome_empresa", conn)
+
+def _carregar_funcionarios():
+    with get_db_connection() as conn:
+        query = """
+            SELECT f.codigo, f.nome, f.cargo, f.role, f.empresa_id, e.nome_empresa
+            FROM funcionarios f
+            LEFT JOIN empresas e ON f.empresa_id = e.id
+        """
+        return pd.read_sql_query(query, conn)
+
+@metricas.instrumentar
+def ler_empresas():
+    return _cache_referencia.obter((services.DATABASE_FILE, "empresas"), _carregar_empresas).copy()
+
+@metricas.instrumentar
+def ler_funcionarios_df():
+    return _cache_referencia.obter((services.DATABASE_FILE, "funcionarios"), _carregar_funcionarios).copy()
+
+def _segundos_previstos_funcionarios(codigos, descricoes):
+    # Segundos previstos linha a linha: os horários são resolvidos uma vez por
+    # funcionário distinto e indexados pela posição do evento. Eventos fora de
+    # HORARIOS_PADRAO ficam NaN.
+    eventos = list(HORARIOS_PADRAO.keys())
+    posicoes, codigos_unicos = pd.factorize(pd.Series(codigos, dtype=object))
+    tabela = np.array(
+        [list(_segundos_previstos(obter_horarios_funcionario(c)).values()) for c in codigos_unicos], dtype="float64"
+    ).reshape(len(codigos_unicos), len(eventos))
+    indices_evento = pd.Series(descricoes, dtype=object).map({evento: i for i, evento in enumerate(eventos)}).to_numpy()
+    conhecidos = ~pd.isna(indices_evento) & (posicoes >= 0)
+    resultado = np.full(len(indices_evento), np.nan)
+    resultado[conhecidos] = tabela[posicoes[conhecidos], indices_evento[conhecidos].astype(int)]
+    return resultado
+
+def _momento_local(valor):
+    try:
+        momento = pd.Timestamp(valor)
+    except (TypeError, ValueError):
+        return pd.NaT
+    if pd.isna(momento):
+        return pd.NaT
+    return momento.tz_localize(FUSO_HORARIO) if momento.tzinfo is None else momento.tz_convert(FUSO_HORARIO)
+
+def _normalizar_momentos(valores):
+    # Horários sem fuso são tratados como hora local (FUSO_HORARIO). Lotes com fusos
+    # mistos não passam na conversão vetorizada e caem na conversão valor a valor.
+    try:
+        momentos = pd.to_datetime(valores, errors='coerce', format='ISO8601')
+        if momentos.dt.tz is None:
+            momentos = momentos.dt.tz_localize(FUSO_HORARIO)
+        else:
+            momentos = momentos.dt.tz_convert(FUSO_HORARIO)
+    except (TypeError, ValueError):
+        momentos = pd.to_datetime(pd.Series([_momento_local(v) for v in valores], index=valores.index, dtype=object))
+    return momentos.dt.floor('us')
+
+@functools.lru_cache(maxsize=1)
+def _tabela_horas():
+    return np.array([f"{h:02d}:{m:02d}:{s:02d}" for h in range(24) for m in range(60) for s in range(60)], dtype=object)
+
+def _campos_momentos(momentos):
+    # strftime em séries com fuso é lento em lotes grandes; datas e deslocamentos são
+    # formatados por valor distinto e as horas vêm de uma tabela com os 86.400 segundos.
+    locais = momentos.dt.tz_localize(None)
+    dias = locais.dt.normalize()
+    segundos = (locais - dias).to_numpy().astype('timedelta64[us]').astype(np.int64)
+    segundos_inteiros = segundos // 1_000_000
+
+    codigos_dia, dias_unicos = pd.factorize(dias)
+    datas = pd.DatetimeIndex(dias_unicos).strftime('%Y-%m-%d').to_numpy(dtype=object)[codigos_dia]
+    horas = _tabela_horas()[segundos_inteiros]
+
+    deslocamentos = (locais - momentos.dt.tz_convert(None)).dt.total_seconds().astype(np.int64).to_numpy() // 60
+    codigos_desl, desl_unicos = pd.factorize(deslocamentos)
+    sufixos = np.array([
+        f"{'-' if d < 0 else '+'}{abs(d) // 60:02d}:{abs(d) % 60:02d}" for d in desl_unicos
+    ], dtype=object)[codigos_desl]
+
+    # Só os valores com fração passam por np.char, que falha em arrays vazios.
+    microssegundos = segundos % 1_000_000
+    com_fracao = microssegundos > 0
+    fracoes = np.full(len(segundos), '', dtype=object)
+    if com_fracao.any():
+        fracoes[com_fracao] = np.char.add('.', np.char.zfill(microssegundos[com_fracao].astype(str), 6)).astype(object)
+    isoformat = datas + 'T' + horas + fracoes + sufixos
+    return datas, horas, isoformat, segundos / 1e6
+
+def _carregar_dias_afetados(conn, pares):
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS _dias_afetados (
+            codigo_funcionario TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (codigo_funcionario, data)
+        )
+    """)
+    conn.execute("DELETE FROM _dias_afetados")
+    conn.executemany("INSERT OR IGNORE INTO _dias_afetados VALUES (?, ?)", pares)
+
+def _recalcular_resumo_dias(conn, pares):
+    _carregar_dias_afetados(conn, pares)
+    _recalcular_resumo(conn, "(codigo_funcionario, data) IN (SELECT codigo_funcionario, data FROM _dias_afetados)", [])
+
+def _pertence(valores, referencia):
+    # Series.isin em colunas de texto (pyarrow, padrão do pandas 3) compara valor a valor
+    # em Python; com dtype object a busca usa a tabela de hash.
+    return pd.Series(np.asarray(valores, dtype=object), dtype=object).isin(np.asarray(referencia, dtype=object)).to_numpy()
+
+@metricas.instrumentar
+def importar_batidas(eventos):
+    # Importa batidas acumuladas por relógios de ponto. A ordem de entrada não importa:
+    # em cada dia afetado, as batidas já gravadas e as importadas são ordenadas juntas pela
+    # hora e os eventos são reatribuídos nessa ordem, de modo que uma batida offline mais
+    # antiga que as gravadas vira o início do expediente.
+    # Os relatórios de rejeitadas e duplicadas mostram o valor de momento como veio.
+    df = pd.DataFrame(eventos, columns=['codigo', 'entrada'])
+    df['codigo'] = df['codigo'].astype(str).str.strip()
+    df['momento'] = _normalizar_momentos(df['entrada'])
+
+    funcionarios = ler_funcionarios_df().set_index('codigo')
+    rejeitados = []
+    invalidos = df['momento'].isna()
+    rejeitados.append(df[invalidos].assign(motivo="Data/hora inválida."))
+    df = df[~invalidos]
+    desconhecidos = ~_pertence(df['codigo'], funcionarios.index)
+    rejeitados.append(df[desconhecidos].assign(motivo="Funcionário não cadastrado."))
+    df = df[~desconhecidos]
+
+    duplicados = []
+    repetidos = df.duplicated(['codigo', 'momento'])
+    duplicados.append(df[repetidos].assign(motivo="Batida repetida no lote."))
+    df = df[~repetidos].sort_values(['codigo', 'momento'], kind='stable')
+
+    datas, horas, isoformat, segundos_reais = _campos_momentos(df['momento'])
+    df['codigo'] = df['codigo'].to_numpy(dtype=object)
+    df['id'] = df['codigo'].to_numpy(dtype=object) + '-' + isoformat
+    df['data'] = datas
+    df['hora'] = horas
+    df['segundos'] = segundos_reais
+    arquivados = _pertence(df['data'].str[:7], listar_meses_arquivados()['mes'])
+    rejeitados.append(df[arquivados].assign(motivo="Mês arquivado."))
+    df = df[~arquivados]
+
+    eventos_programados = list(HORARIOS_PADRAO.keys())
+    inseridos = 0
+
+    with get_db_connection(escrita=True) as conn:
+        with _transacao_imediata(conn):
+            if not df.empty:
+                # Só os dias do lote são lidos: os pares (funcionário, dia) vão para uma
+                # tabela temporária e entram no JOIN com o índice de registros.
+                pares = df[['codigo', 'data']].drop_duplicates()
+                _carregar_dias_afetados(conn, zip(pares['codigo'].to_numpy(dtype=object), pares['data'].to_numpy(dtype=object)))
+                existentes = pd.read_sql_query("""
+                    SELECT r.id, r.codigo_funcionario AS codigo, r.data, r.hora, r.descricao, r.diferenca_min, r.observacao
+                    FROM _dias_afetados d
+                    JOIN registros r ON r.codigo_funcionario = d.codigo_funcionario AND r.data = d.data
+                """, conn)
+                ja_gravados = _pertence(df['id'], existentes['id'])
+                duplicados.append(df[ja_gravados].assign(motivo="Batida já registrada."))
+                df = df[~ja_gravados]
+
+                # Dias em que todas as batidas do lote já estavam gravadas não são reordenados.
+                chaves_lote = df['codigo'].to_numpy(dtype=object) + '|' + df['data'].to_numpy(dtype=object)
+                chaves_existentes = existentes['codigo'].to_numpy(dtype=object) + '|' + existentes['data'].to_numpy(dtype=object)
+                existentes = existentes[_pertence(chaves_existentes, chaves_lote)]
+                contagem = existentes.groupby(['codigo', 'data']).size().rename('existentes')
+                df = df.join(contagem, on=['codigo', 'data'])
+                # Num dia que passaria de quatro batidas ficam de fora as importadas mais tardias.
+                por_dia = df.groupby(['codigo', 'data'])
+                excesso = (
+                    df['existentes'].fillna(0).astype(int).to_numpy()
+                    + por_dia['id'].transform('size').to_numpy() - len(eventos_programados)
+                )
+                excedentes = por_dia.cumcount(ascending=False).to_numpy() < excesso
+                rejeitados.append(df[excedentes].assign(motivo="Jornada do dia já completa."))
+                df = df[~excedentes]
+
+                existentes['segundos'] = pd.to_timedelta(existentes['hora']).dt.total_seconds()
+                colunas_dia = ['id', 'codigo', 'data', 'hora', 'segundos']
+                colunas_gravadas = ['descricao', 'diferenca_anterior', 'observacao']
+                dias_afetados = pd.concat(
+                    [
+                        existentes.rename(columns={'diferenca_min': 'diferenca_anterior'})[colunas_dia + colunas_gravadas]
+                        .assign(gravada=True),
+                        df[colunas_dia].assign(gravada=False),
+                    ],
+                    ignore_index=True
+                ).sort_values(['codigo', 'data', 'segundos', 'id'], kind='stable')
+                ordem = dias_afetados.groupby(['codigo', 'data']).cumcount().to_numpy()
+                dias_afetados['evento'] = np.array(eventos_programados, dtype=object)[ordem]
+                dias_afetados['diferenca_min'] = calcular_diferencas_min(
+                    dias_afetados['segundos'].to_numpy(),
+                    _segundos_previstos_funcionarios(dias_afetados['codigo'], dias_afetados['evento'].to_numpy())
+                )
+                gravadas = dias_afetados['gravada'].to_numpy(dtype=bool)
+                reordenadas = dias_afetados[gravadas & (dias_afetados['evento'] != dias_afetados['descricao']).to_numpy()]
+                if not reordenadas.empty:
+                    # Duas etapas por causa do índice único (funcionário, dia, evento): os
+                    # eventos das batidas reordenadas são liberados antes de serem reatribuídos.
+                    # Cada reatribuição fica em registros_auditoria, como uma edição sem editor.
+                    ids = reordenadas['id'].to_numpy(dtype=object)
+                    conn.executemany("UPDATE registros SET descricao = id WHERE id = ?", ((i,) for i in ids))
+                    conn.executemany(
+                        "UPDATE registros SET descricao = ?, diferenca_min = ? WHERE id = ?",
+                        zip(reordenadas['evento'].to_numpy(dtype=object), reordenadas['diferenca_min'].to_numpy(dtype=object), ids)
+                    )
+                    alterado_em = datetime.now(FUSO_HORARIO).isoformat(timespec="seconds")
+                    _registrar_auditoria(conn, zip(
+                        ids, *(reordenadas[coluna].to_numpy(dtype=object) for coluna in (
+                            'codigo', 'data', 'descricao', 'evento', 'hora', 'hora',
+                            'diferenca_anterior', 'diferenca_min', 'observacao', 'observacao',
+                        )),
+                        itertools.repeat(None), itertools.repeat(alterado_em),
+                    ))
+
+                novas = dias_afetados[~gravadas]
+                linhas = pd.DataFrame({
+                    'id': novas['id'],
+                    'codigo_funcionario': novas['codigo'],
+                    'nome': funcionarios['nome'].reindex(novas['codigo']).to_numpy(),
+                    'cargo': funcionarios['cargo'].reindex(novas['codigo']).to_numpy(),
+                    'data': novas['data'],
+                    'hora': novas['hora'],
+                    'descricao': novas['evento'],
+                    'diferenca_min': novas['diferenca_min'],
+                    'observacao': '',
+                })
+                # rowcount só conta as linhas inseridas pelo comando; total_changes também
+                # somaria as escritas dos gatilhos de versao_dados.
+                inseridos = conn.executemany(
+                    "INSERT OR IGNORE INTO registros VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    zip(*(linhas[coluna].to_numpy(dtype=object) for coluna in linhas.columns))
+                ).rowcount
+                dias = linhas[['codigo_funcionario', 'data']].drop_duplicates()
+                _recalcular_resumo_dias(conn, zip(dias['codigo_funcionario'].to_numpy(dtype=object), dias['data'].to_numpy(dtype=object)))
+
+    colunas_relatorio = ['codigo', 'entrada', 'motivo']
+    return {
+        "inseridos": inseridos,
+        "duplicados": pd.concat(duplicados, ignore_index=True)[colunas_relatorio].rename(columns={'entrada': 'momento'}),
+        "rejeitados": pd.concat(rejeitados, ignore_index=True)[colunas_relatorio].rename(columns={'entrada': 'momento'}),
+    }
+
+COLUNAS_REGISTROS = {
+    'id': 'ID', 'codigo_funcionario': 'Código', 'nome': 'Nome', 'cargo': 'Cargo',
+    'data': 'Data', 'hora': 'Hora', 'descricao': 'Descrição',
+    'diferenca_min': 'Diferença (min)', 'observacao': 'Observação'
+}
+
+@metricas.instrumentar
+def ler_registros_df():
+    with get_db_connection() as conn:
+        partes = []
+        for inicio, fim in reversed(_periodos_por_ano(conn)):
+            filtro, parametros = _filtro_periodo(inicio, fim)
+            partes.append(pd.read_sql_query(
+                f"SELECT * FROM {_fonte(conn, 'registros', inicio, fim)} WHERE 1 = 1{filtro}", conn, params=parametros
+            ))
+    
+    df = pd.concat(partes, ignore_index=True).rename(columns=COLUNAS_REGISTROS)
+    return df
+
+@metricas.instrumentar
+def consultar_registros(empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                        limite=None, deslocamento=0, decrescente=False):
+    # Um ano arquivado por vez, na ordem pedida. Com paginação, os anos que caem
+    # inteiros antes da página são só contados e descontados do deslocamento.
+    ordem = "DESC" if decrescente else "ASC"
+    restantes = None if limite is None else int(limite)
+    deslocamento = int(deslocamento)
+    partes = []
+    with get_db_connection() as conn:
+        for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim, decrescente):
+            where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+            fonte = _fonte(conn, 'registros', inicio, fim)
+            if restantes is not None and deslocamento:
+                total = conn.execute(f"""
+                    SELECT COUNT(*)
+                    FROM {fonte} r
+                    JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                    WHERE {where}
+                """, parametros).fetchone()[0]
+                if total <= deslocamento:
+                    deslocamento -= total
+                    continue
+            query = f"""
+                SELECT r.*
+                FROM {fonte} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+                ORDER BY r.data {ordem}, r.hora {ordem}, r.id {ordem}
+            """
+            if restantes is not None:
+                query += " LIMIT ? OFFSET ?"
+                parametros = parametros + [restantes, deslocamento]
+            partes.append(pd.read_sql_query(query, conn, params=parametros))
+            if restantes is not None:
+                restantes -= len(partes[-1])
+                deslocamento = 0
+                if restantes <= 0:
+                    break
+
+    if not partes:
+        return pd.DataFrame(columns=list(COLUNAS_REGISTROS.values()))
+    df = pd.concat(partes, ignore_index=True).rename(columns=COLUNAS_REGISTROS)
+    return df
+
+@metricas.instrumentar
+def consultar_historico_funcionario(codigo, limite=TAMANHO_PAGINA_HISTORICO, apos=None):
+    # Paginação por chave sobre (data, hora, id), do mais recente para o mais antigo.
+    # `apos` é o cursor devolvido pela página anterior; o custo de cada página não
+    # depende de quantas já foram lidas, ao contrário de LIMIT/OFFSET. Os anos arquivados
+    # são consultados um por vez, do mais novo para o mais antigo, só até a página encher.
+    condicoes = "codigo_funcionario = ?"
+    parametros = [codigo]
+    if apos is not None:
+        condicoes += " AND (data, hora, id) < (?, ?, ?)"
+        parametros.extend(apos)
+    partes = []
+    restantes = int(limite) + 1
+    with get_db_connection() as conn:
+        for inicio, fim in _periodos_por_ano(conn, None if apos is None else apos[0]):
+            filtro, parametros_periodo = _filtro_periodo(inicio, fim)
+            query = f"""
+                SELECT * FROM {_fonte(conn, 'registros', inicio, fim)}
+                WHERE {condicoes}{filtro}
+                ORDER BY data DESC, hora DESC, id DESC
+                LIMIT ?
+            """
+            partes.append(pd.read_sql_query(query, conn, params=parametros + parametros_periodo + [restantes]))
+            restantes -= len(partes[-1])
+            if restantes <= 0:
+                break
+    df = pd.concat(partes, ignore_index=True)
+
+    proximo_cursor = None
+    if len(df) > limite:
+        df = df.iloc[:limite]
+        proximo_cursor = tuple(df.iloc[-1][['data', 'hora', 'id']])
+    return df.rename(columns=COLUNAS_REGISTROS), proximo_cursor
+
+def _iterar_registros(empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                      tamanho_lote=TAMANHO_LOTE_EXPORTACAO, ordem="r.data, r.hora, r.id"):
+    # Os períodos vêm em ordem crescente de data; `ordem` deve começar por r.data para
+    # que a concatenação dos lotes continue ordenada.
+    with get_db_connection() as conn:
+        for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim):
+            where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+            query = f"""
+                SELECT r.*
+                FROM {_fonte(conn, 'registros', inicio, fim)} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+                ORDER BY {ordem}
+            """
+            cursor = conn.execute(query, parametros)
+            colunas = [COLUNAS_REGISTROS[d[0]] for d in cursor.description]
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                yield pd.DataFrame.from_records(linhas, columns=colunas)
+
+def _iniciar_recalculo(data_inicio, data_fim, empresa_id, tolerancia, horarios):
+    # Horários novos: os passados explicitamente ou, sem eles, os vigentes da empresa do
+    # filtro (horarios_vigentes = 1: quem tem horário próprio usou o seu). Os anteriores
+    # são os novos do último recálculo da mesma empresa; NULL se nunca houve um, quando as
+    # diferenças ainda são as calculadas na batida.
+    empresa_id = int(empresa_id) if empresa_id else None
+    novos = obter_horarios_empresa(empresa_id) if horarios is None else horarios
+    horarios_novos = json.dumps(
+        {evento: _formatar_horario(hora) for evento, hora in novos.items()}, ensure_ascii=False
+    )
+    with get_db_connection(escrita=True) as conn:
+        with _transacao_imediata(conn):
+            anterior = conn.execute(
+                "SELECT horarios_novos FROM recalculos_diferencas WHERE empresa_id IS ? ORDER BY id DESC LIMIT 1",
+                (empresa_id,)
+            ).fetchone()
+            return conn.execute("""
+                INSERT INTO recalculos_diferencas (
+                    data_inicio, data_fim, empresa_id, tolerancia, horarios_anteriores, horarios_novos,
+                    horarios_vigentes, iniciado_em
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                _formatar_data_filtro(data_inicio), _formatar_data_filtro(data_fim), empresa_id, tolerancia,
+                anterior[0] if anterior else None, horarios_novos, int(horarios is None),
+                datetime.now(FUSO_HORARIO).isoformat(timespec="seconds"),
+            )).lastrowid
+
+@metricas.instrumentar
+def recalcular_diferencas(data_inicio=None, data_fim=None, empresa_id=None, tolerancia=TOLERANCIA_MINUTOS,
+                          horarios=None, tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    # Recalcula diferenca_min do histórico após mudança de tolerância ou de horários.
+    # Sem `horarios`, cada linha usa o horário vigente do funcionário (ou da empresa).
+    # Cada lote é lido por rowid crescente e gravado na sua própria transação, com
+    # executemany só das linhas que mudaram, para não segurar o lock de escrita (e as
+    # batidas de ponto) durante o recálculo inteiro. Cada execução fica registrada em
+    # recalculos_diferencas (ver _iniciar_recalculo).
+    previstos = None if horarios is None else pd.Series(_segundos_previstos(horarios), dtype="float64")
+    recalculo = _iniciar_recalculo(data_inicio, data_fim, empresa_id, tolerancia, horarios)
+    condicoes = ["rowid > ?"]
+    parametros = []
+    if empresa_id:
+        condicoes.append("codigo_funcionario IN (SELECT codigo FROM funcionarios WHERE empresa_id = ?)")
+        parametros.append(int(empresa_id))
+    if data_inicio is not None:
+        condicoes.append("data >= ?")
+        parametros.append(_formatar_data_filtro(data_inicio))
+    if data_fim is not None:
+        condicoes.append("data <= ?")
+        parametros.append(_formatar_data_filtro(data_fim))
+    query = f"""
+        SELECT rowid AS rid, codigo_funcionario, hora, descricao, diferenca_min
+        FROM registros
+        WHERE {' AND '.join(condicoes)}
+        ORDER BY rowid
+        LIMIT ?
+    """
+    ultimo_rowid = 0
+    alterados = 0
+    while True:
+        with get_db_connection(escrita=True) as conn:
+            with _transacao_imediata(conn):
+                lote = pd.read_sql_query(query, conn, params=[ultimo_rowid] + parametros + [int(tamanho_lote)])
+                if lote.empty:
+                    break
+                ultimo_rowid = int(lote['rid'].iloc[-1])
+
+                _, segundos_reais = _converter_horarios(lote['hora'])
+                if previstos is None:
+                    segundos_previstos = _segundos_previstos_funcionarios(lote['codigo_funcionario'], lote['descricao'])
+                else:
+                    segundos_previstos = lote['descricao'].map(previstos).to_numpy(dtype="float64")
+                validos = ~(np.isnan(segundos_reais) | np.isnan(segundos_previstos))
+                novas = calcular_diferencas_min(
+                    np.where(validos, segundos_reais, 0), np.where(validos, segundos_previstos, 0), tolerancia
+                )
+                mudou = validos & (novas != lote['diferenca_min'].to_numpy())
+                if mudou.any():
+                    conn.executemany(
+                        "UPDATE registros SET diferenca_min = ? WHERE rowid = ?",
+                        zip(novas[mudou].tolist(), lote['rid'].to_numpy()[mudou].tolist())
+                    )
+                    alterados += int(mudou.sum())
+                    conn.execute(
+                        "UPDATE recalculos_diferencas SET linhas_alteradas = ? WHERE id = ?", (alterados, recalculo)
+                    )
+        if len(lote) < tamanho_lote:
+            break
+    with get_db_connection(escrita=True) as conn:
+        with conn:
+            conn.execute(
+                "UPDATE recalculos_diferencas SET concluido_em = ? WHERE id = ?",
+                (datetime.now(FUSO_HORARIO).isoformat(timespec="seconds"), recalculo)
+            )
+    return alterados
+
+@metricas.instrumentar
+def listar_meses_arquivados():
+    with get_db_connection() as conn:
+        return pd.read_sql_query("SELECT * FROM meses_arquivados ORDER BY mes", conn)
+
+COLUNAS_PLANILHA_FUNCIONARIOS = ['codigo', 'nome', 'cargo', 'senha', 'empresa']
+
+def ler_planilha_funcionarios(arquivo):
+    nome_arquivo = str(getattr(arquivo, 'name', arquivo)).lower()
+    if nome_arquivo.endswith(('.xlsx', '.xlsm')):
+        planilha = pd.read_excel(arquivo, dtype=str)
+    else:
+        planilha = pd.read_csv(arquivo, dtype=str, sep=None, engine='python', encoding='utf-8-sig')
+    planilha.columns = planilha.columns.astype(str).str.strip().str.lower()
+    return planilha
+
+@metricas.instrumentar
+def importar_funcionarios(planilha):
+    # Cadastro em lote: a validação é feita sobre a planilha inteira e só as linhas
+    # válidas são gravadas, numa única transação. A coluna "empresa" aceita o id ou o
+    # nome da empresa. "linha" no relatório de erros é a linha da planilha (cabeçalho = 1).
+    faltantes = [c for c in COLUNAS_PLANILHA_FUNCIONARIOS if c not in planilha.columns]
+    if faltantes:
+        raise ValueError(f"Colunas ausentes na planilha: {', '.join(faltantes)}.")
+
+    # A senha fica como digitada, igual ao cadastro pelo formulário (adicionar_funcionario).
+    df = planilha[COLUNAS_PLANILHA_FUNCIONARIOS].fillna('').astype(str)
+    aparar = [c for c in COLUNAS_PLANILHA_FUNCIONARIOS if c != 'senha']
+    df[aparar] = df[aparar].apply(lambda coluna: coluna.str.strip())
+    df.insert(0, 'linha', np.arange(len(df)) + 2)
+
+    empresas = ler_empresas()
+    por_nome = pd.Series(empresas['id'].to_numpy(), index=empresas['nome_empresa'].str.strip().str.casefold())
+    por_id = pd.Series(empresas['id'].to_numpy(), index=empresas['id'].astype(str))
+    empresa_id = df['empresa'].map(por_id).fillna(df['empresa'].str.casefold().map(por_nome))
+
+    vazios = df[COLUNAS_PLANILHA_FUNCIONARIOS].eq('')
+    nomes_vazios = (vazios.astype(object) * [f"{c}, " for c in COLUNAS_PLANILHA_FUNCIONARIOS]).sum(axis=1).str.rstrip(', ')
+    motivo = pd.Series('', index=df.index, dtype=object)
+    motivo = motivo.mask(vazios.any(axis=1), "Campo(s) obrigatório(s) vazio(s): " + nomes_vazios + ".")
+    motivo = motivo.mask(motivo.eq('') & empresa_id.isna(), "Empresa não cadastrada.")
+    motivo = motivo.mask(motivo.eq('') & df['codigo'].duplicated(keep=False), "Código repetido na planilha.")
+
+    # O scrypt é caro: os hashes são calculados antes de abrir a transação para não
+    # segurar o lock de escrita (e as batidas de ponto) durante o cálculo.
+    candidatos = motivo.eq('')
+    hashes = pd.Series(_hash_senhas(df.loc[candidatos, 'senha']), index=df.index[candidatos], dtype=object)
+
+    inseridos = 0
+    with get_db_connection(escrita=True) as conn:
+        with _transacao_imediata(conn):
+            existentes = pd.read_sql_query("SELECT codigo FROM funcionarios", conn)['codigo']
+            motivo = motivo.mask(motivo.eq('') & df['codigo'].isin(existentes), "Código já cadastrado.")
+            validos = motivo.eq('')
+            novos = df[validos]
+            if not novos.empty:
+                conn.executemany(
+                    "INSERT INTO funcionarios (codigo, nome, cargo, senha, role, empresa_id) VALUES (?, ?, ?, ?, ?, ?)",
+                    zip(novos['codigo'], novos['nome'], novos['cargo'], hashes[validos],
+                        itertools.repeat('employee'), empresa_id[validos].astype(int).tolist())
+                )
+                inseridos = len(novos)
+
+    if inseridos:
+        invalidar_cache_referencia()
+    return {
+        "inseridos": inseridos,
+        "erros": df.loc[~validos, ['linha', 'codigo', 'nome']].assign(motivo=motivo[~validos]).reset_index(drop=True),
+    }
+
+_MINUTOS_HHMM = np.array([f"{m:02d}" for m in range(60)], dtype=object)
+
+def _converter_horarios(coluna):
+    # Converte cada horário distinto uma única vez (um dia tem no máximo 86.400) e
+    # espalha o resultado pelos códigos do factorize; ausentes ficam NaT/NaN.
+    codigos, unicos = pd.factorize(coluna)
+    horarios = pd.to_datetime(pd.Series(unicos, dtype=object), format='%H:%M:%S', errors='coerce')
+    segundos = (horarios.dt.hour * 3600 + horarios.dt.minute * 60 + horarios.dt.second).to_numpy(dtype="float64")
+    tempos = horarios.dt.time.to_numpy(dtype=object)
+    ausentes = codigos < 0
+    segundos = np.append(segundos, np.nan)[np.where(ausentes, len(unicos), codigos)]
+    tempos = pd.Series(np.append(tempos, pd.NaT)[np.where(ausentes, len(unicos), codigos)], index=coluna.index)
+    return tempos, segundos
+
+def _formatar_datas_br(datas):
+    codigos, unicos = pd.factorize(datas)
+    return pd.Series(pd.to_datetime(pd.Series(unicos, dtype=object)).dt.strftime('%d/%m/%Y').to_numpy()[codigos], index=datas.index)
+
+def _formatar_segundos_hhmm(segundos):
+    # Mesma aritmética de divmod sobre segundos inteiros usada antes por linha; NaN vira "00:00".
+    total = np.trunc(np.nan_to_num(segundos, nan=0.0)).astype(np.int64)
+    horas = total // 3600
+    minutos = (total % 3600) // 60
+    return pd.Series(horas).astype(str).str.zfill(2).to_numpy(dtype=object) + ":" + _MINUTOS_HHMM[minutos]
+
+COLUNAS_RESUMO_DIARIO = {
+    'data': 'Data', 'codigo_funcionario': 'Código', 'nome': 'Nome',
+    'inicio_expediente': 'Início do Expediente', 'inicio_almoco': 'Início do Almoço',
+    'fim_almoco': 'Fim do Almoço', 'fim_expediente': 'Fim do Expediente',
+    'observacao': 'Observação', 'pausa_segundos': 'pausa_segundos', 'trabalhado_segundos': 'trabalhado_segundos'
+}
+
+def _resumir_registros_df(df):
+    df_pivot = df.pivot_table(
+        index=['Data', 'Código', 'Nome'],
+        columns='Descrição',
+        values='Hora',
+        aggfunc='first'
+    ).reset_index()
+
+    df_obs = df.loc[df['Observação'].notna(), ['Data', 'Código', 'Observação']].drop_duplicates()
+    varias_obs = df_obs.duplicated(['Data', 'Código'], keep=False)
+    if varias_obs.any():
+        df_obs = pd.concat([
+            df_obs[~varias_obs],
+            df_obs[varias_obs].groupby(['Data', 'Código'])['Observação'].agg(' | '.join).reset_index()
+        ], ignore_index=True)
+    
+    df_final = pd.merge(df_pivot, df_obs, on=['Data', 'Código'], how='left')
+    df_final['Observação'] = df_final['Observação'].fillna('')
+
+    segundos = {}
+    for evento in HORARIOS_PADRAO:
+        if evento not in df_final.columns:
+            df_final[evento] = np.nan
+        segundos[evento] = _converter_horarios(df_final[evento])[1]
+
+    duracao_pausa = segundos['Fim do Almoço'] - segundos['Início do Almoço']
+    duracao_pausa = np.where(duracao_pausa >= 0, duracao_pausa, 0.0)
+    jornada_bruta = segundos['Fim do Expediente'] - segundos['Início do Expediente']
+
+    df_final['pausa_segundos'] = duracao_pausa
+    df_final['trabalhado_segundos'] = jornada_bruta - duracao_pausa
+    return df_final
+
+def _formatar_relatorio(df_resumo):
+    df_final = df_resumo.copy()
+    for evento in HORARIOS_PADRAO:
+        df_final[evento] = _converter_horarios(df_final[evento])[0]
+
+    df_final['Horas de Pausa'] = _formatar_segundos_hhmm(df_final['pausa_segundos'].to_numpy(dtype="float64"))
+    df_final['Total Horas Trabalhadas'] = _formatar_segundos_hhmm(df_final['trabalhado_segundos'].to_numpy(dtype="float64"))
+    
+    colunas_finais = [
+        'Data', 'Código', 'Nome', 
+        'Início do Expediente', 'Início do Almoço', 
+        'Fim do Almoço', 'Fim do Expediente',
+        'Horas de Pausa', 'Total Horas Trabalhadas', 'Observação'
+    ]
+    for col in colunas_finais:
+        if col not in df_final.columns:
+            df_final[col] = 'N/A'
+            
+    df_final = df_final[colunas_finais]
+    
+    df_final.rename(columns={'Código': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'}, inplace=True)
+
+    df_final['Data'] = _formatar_datas_br(df_final['Data'])
+
+    return df_final
+
+@metricas.instrumentar
+def gerar_relatorio_organizado_df(df_registros: pd.DataFrame) -> pd.DataFrame:
+    if df_registros.empty:
+        return pd.DataFrame()
+    return _formatar_relatorio(_resumir_registros_df(df_registros))
+
+def _iterar_resumo_diario(empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                          tamanho_lote=TAMANHO_LOTE_EXPORTACAO):
+    with get_db_connection() as conn:
+        for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim):
+            where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+            query = f"""
+                SELECT r.*
+                FROM {_fonte(conn, 'resumo_diario', inicio, fim)} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+                ORDER BY r.data, r.codigo_funcionario, r.nome
+            """
+            cursor = conn.execute(query, parametros)
+            colunas = [COLUNAS_RESUMO_DIARIO[d[0]] for d in cursor.description]
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                yield _formatar_relatorio(pd.DataFrame.from_records(linhas, columns=colunas))
+
+@metricas.instrumentar
+def gerar_relatorio_resumido_df(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    lotes = list(_iterar_resumo_diario(empresa_id, data_inicio, data_fim, codigo))
+    if not lotes:
+        return pd.DataFrame()
+    return pd.concat(lotes, ignore_index=True)
+
+class _CacheResumoDiario:
+    # Resultados derivados do resumo_diario por filtro, mantidos entre as reexecuções do
+    # Streamlit. `ler(conn, fonte, where, parametros)` devolve um DataFrame indexado por
+    # (data ISO, código). Cada entrada guarda a versao_dados em que foi lida; na consulta
+    # seguinte só os dias com seq maior em registros_mudancas são relidos e substituídos.
+    def __init__(self, ler, tamanho, ordenar=True):
+        self._ler = ler
+        self._tamanho = tamanho
+        self._ordenar = ordenar
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+
+    def _ler_periodos(self, conn, periodos, filtros, condicao="", parametros_condicao=()):
+        # Um ano arquivado por vez, em ordem crescente de data, como _iterar_resumo_diario.
+        partes = []
+        for inicio, fim in periodos:
+            where, parametros = _filtros_registros(filtros[0], inicio, fim, filtros[3])
+            fonte = _fonte(conn, 'resumo_diario', inicio, fim)
+            partes.append(self._ler(conn, fonte, where + condicao, [*parametros, *parametros_condicao]))
+        return partes[0] if len(partes) == 1 else pd.concat(partes)
+
+    def consultar(self, empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+        filtros = (empresa_id or None, _formatar_data_filtro(data_inicio), _formatar_data_filtro(data_fim), codigo)
+        chave = (os.path.abspath(services.DATABASE_FILE), *filtros)
+        where, parametros = _filtros_registros(*filtros)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+
+        with get_db_connection() as conn:
+            intervalos = _intervalos_arquivados(conn, data_inicio, data_fim)
+            periodos = _periodos_consulta(conn, data_inicio, data_fim)
+            # A versão e os dias alterados vêm do mesmo snapshot (WAL). As linhas são lidas
+            # depois, fora dele, porque cada período anexa o seu ano (ATTACH não roda dentro
+            # de transação); mudanças posteriores à versão podem aparecer já nessa leitura e
+            # voltam a ser relidas na consulta seguinte, o que é inofensivo.
+            conn.execute("BEGIN")
+            versao = conn.execute("SELECT versao FROM versao_dados WHERE id = 1").fetchone()[0]
+            if entrada is not None and entrada["versao"] == versao:
+                return entrada["resultado"]
+
+            alterados = None
+            if entrada is not None:
+                alterados = [tuple(linha) for linha in conn.execute(f"""
+                    SELECT r.data, r.codigo_funcionario
+                    FROM registros_mudancas r
+                    JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                    WHERE r.seq > ? AND r.seq <= ? AND {where}
+                """, [entrada["versao"], versao, *parametros])]
+            conn.execute("COMMIT")
+
+            if alterados is None or len(alterados) > len(entrada["resultado"]) // 2:
+                resultado = self._ler_periodos(conn, periodos, filtros)
+            elif not alterados:
+                resultado = entrada["resultado"]
+            else:
+                novos = self._ler_periodos(
+                    conn, periodos, filtros,
+                    " AND (r.codigo_funcionario, r.data) IN "
+                    "(SELECT codigo_funcionario, data FROM registros_mudancas WHERE seq > ? AND seq <= ?)",
+                    [entrada["versao"], versao],
+                )
+                resultado = entrada["resultado"].drop(index=alterados, errors="ignore")
+                if not novos.empty:
+                    resultado = pd.concat([resultado, novos])
+                    if self._ordenar:
+                        resultado = resultado.sort_index()
+            # Um mês arquivado ou desarquivado durante a leitura deixaria as fontes
+            # desatualizadas; nesse caso o resultado não vai para o cache.
+            atual = _intervalos_arquivados(conn, data_inicio, data_fim) == intervalos
+
+        if atual:
+            with self._lock:
+                self._entradas[chave] = {"versao": versao, "resultado": resultado}
+                self._entradas.move_to_end(chave)
+                while len(self._entradas) > self._tamanho:
+                    self._entradas.popitem(last=False)
+        return resultado
+
+def _ler_relatorio_diario(conn, fonte, where, parametros):
+    # Mesma ordem do ORDER BY de _iterar_resumo_diario.
+    cursor = conn.execute(f"""
+        SELECT r.*
+        FROM {fonte} r
+        JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+        WHERE {where}
+        ORDER BY r.data, r.codigo_funcionario
+    """, parametros)
+    colunas = [COLUNAS_RESUMO_DIARIO[d[0]] for d in cursor.description]
+    df = pd.DataFrame.from_records(cursor.fetchall(), columns=colunas)
+    indice = pd.MultiIndex.from_arrays([df['Data'].to_numpy(dtype=object), df['Código'].to_numpy(dtype=object)])
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_RELATORIO_DIARIO, index=indice)
+    df.index = indice
+    return _formatar_relatorio(df)
+
+_relatorios_em_cache = _CacheResumoDiario(_ler_relatorio_diario, RELATORIOS_EM_CACHE)
+
+@metricas.instrumentar
+def consultar_relatorio_diario(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    return _relatorios_em_cache.consultar(empresa_id, data_inicio, data_fim, codigo).reset_index(drop=True)
+
+def _larguras_colunas(df):
+    larguras = []
+    for coluna in df.columns:
+        maior_valor = df[coluna].astype(str).str.len().max() if len(df) else 0
+        larguras.append(max(len(str(coluna)), int(maior_valor)) + 2)
+    return larguras
+
+def _aplicar_larguras(worksheet, larguras):
+    for indice, largura in enumerate(larguras, start=1):
+        worksheet.column_dimensions[get_column_letter(indice)].width = largura
+
+@metricas.instrumentar
+def gerar_arquivo_excel(df_organizado, df_bruto):
+    output_buffer = io.BytesIO()
+
+    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
+        df_organizado.to_excel(writer, sheet_name='Relatório Diário', index=False)
+        df_bruto.to_excel(writer, sheet_name='Log de Eventos (Bruto)', index=False)
+
+        _aplicar_larguras(writer.sheets['Relatório Diário'], _larguras_colunas(df_organizado))
+        _aplicar_larguras(writer.sheets['Log de Eventos (Bruto)'], _larguras_colunas(df_bruto))
+
+    output_buffer.seek(0)
+    
+    return output_buffer
+
+COLUNAS_RELATORIO_DIARIO = [
+    'Data', 'Código do Funcionário', 'Nome do Funcionário',
+    'Início do Expediente', 'Início do Almoço',
+    'Fim do Almoço', 'Fim do Expediente',
+    'Horas de Pausa', 'Total Horas Trabalhadas', 'Observação'
+]
+
+def _larguras_exportacao(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    # Em modo write_only as larguras precisam existir antes da primeira linha, então o
+    # maior comprimento de cada coluna vem de um agregado no SQLite, sem percorrer células.
+    maiores = [0] * 9
+    with get_db_connection() as conn:
+        for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim):
+            where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+            query = f"""
+                SELECT
+                    MAX(LENGTH(r.id)), MAX(LENGTH(r.codigo_funcionario)), MAX(LENGTH(r.nome)),
+                    MAX(LENGTH(r.cargo)), MAX(LENGTH(r.hora)), MAX(LENGTH(r.descricao)),
+                    MAX(LENGTH(r.diferenca_min)), MAX(LENGTH(r.observacao))
+                FROM {_fonte(conn, 'registros', inicio, fim)} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+            """
+            query_obs_dia = f"""
+                SELECT MAX(LENGTH(r.observacao))
+                FROM {_fonte(conn, 'resumo_diario', inicio, fim)} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+            """
+            periodo = [*conn.execute(query, parametros).fetchone(), conn.execute(query_obs_dia, parametros).fetchone()[0]]
+            maiores = [max(maior, valor or 0) for maior, valor in zip(maiores, periodo)]
+    id_, codigo_, nome, cargo, hora, descricao, diferenca, observacao, obs_dia = maiores
+
+    def largura(cabecalho, maior_valor):
+        return max(len(cabecalho), maior_valor) + 2
+
+    larguras_diario = [
+        largura('Data', 10), largura('Código do Funcionário', codigo_), largura('Nome do Funcionário', nome),
+        *(largura(evento, 8) for evento in COLUNAS_RELATORIO_DIARIO[3:7]),
+        largura('Horas de Pausa', 5), largura('Total Horas Trabalhadas', 5), largura('Observação', obs_dia)
+    ]
+    larguras_bruto = [
+        largura('ID', id_), largura('Código', codigo_), largura('Nome', nome), largura('Cargo', cargo),
+        largura('Data', 10), largura('Hora', hora), largura('Descrição', descricao),
+        largura('Diferença (min)', diferenca), largura('Observação', observacao)
+    ]
+    return larguras_diario, larguras_bruto
+
+def _anexar_linhas(worksheet, df):
+    valores = df.astype(object).where(df.notna(), None)
+    for linha in valores.itertuples(index=False, name=None):
+        worksheet.append(linha)
+
+@metricas.instrumentar
+def gerar_arquivo_excel_streaming(destino=None, empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                                  tamanho_lote=TAMANHO_LOTE_EXPORTACAO, progresso=None):
+    filtros = {"empresa_id": empresa_id, "data_inicio": data_inicio, "data_fim": data_fim, "codigo": codigo}
+    output = destino if destino is not None else io.BytesIO()
+
+    workbook = Workbook(write_only=True)
+    worksheet_organizado = workbook.create_sheet('Relatório Diário')
+    worksheet_bruto = workbook.create_sheet('Log de Eventos (Bruto)')
+
+    larguras_diario, larguras_bruto = _larguras_exportacao(**filtros)
+    _aplicar_larguras(worksheet_organizado, larguras_diario)
+    _aplicar_larguras(worksheet_bruto, larguras_bruto)
+
+    worksheet_organizado.append(COLUNAS_RELATORIO_DIARIO)
+    for df_organizado in _iterar_resumo_diario(**filtros, tamanho_lote=tamanho_lote):
+        for evento in HORARIOS_PADRAO:
+            df_organizado[evento] = df_organizado[evento].astype(str).where(df_organizado[evento].notna())
+        _anexar_linhas(worksheet_organizado, df_organizado)
+        if progresso is not None:
+            progresso(len(df_organizado))
+
+    worksheet_bruto.append(list(COLUNAS_REGISTROS.values()))
+    for df_bruto in _iterar_registros(**filtros, tamanho_lote=tamanho_lote):
+        df_bruto['Data'] = _formatar_datas_br(df_bruto['Data'])
+        _anexar_linhas(worksheet_bruto, df_bruto)
+        if progresso is not None:
+            progresso(len(df_bruto))
+
+    workbook.save(output)
+    if destino is None:
+        output.seek(0)
+    return output
+
+def _abrir_destino(destino):
+    if destino is None:
+        return io.BytesIO(), False
+    if isinstance(destino, (str, bytes)) or hasattr(destino, '__fspath__'):
+        return open(destino, 'wb'), True
+    return destino, False
+
+def gerar_csv_em_lotes(empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                       tamanho_lote=TAMANHO_LOTE_EXPORTACAO, progresso=None):
+    cabecalho_pendente = True
+    for lote in _iterar_registros(empresa_id, data_inicio, data_fim, codigo, tamanho_lote=tamanho_lote):
+        yield lote.to_csv(index=False, header=cabecalho_pendente).encode('utf-8')
+        cabecalho_pendente = False
+        if progresso is not None:
+            progresso(len(lote))
+    if cabecalho_pendente:
+        yield (",".join(COLUNAS_REGISTROS.values()) + "\n").encode('utf-8')
+
+@metricas.instrumentar
+def gerar_arquivo_csv(destino=None, empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                      tamanho_lote=TAMANHO_LOTE_EXPORTACAO, progresso=None):
+    output, fechar = _abrir_destino(destino)
+    try:
+        for pedaco in gerar_csv_em_lotes(empresa_id, data_inicio, data_fim, codigo, tamanho_lote=tamanho_lote,
+                                         progresso=progresso):
+            output.write(pedaco)
+    finally:
+        if fechar:
+            output.close()
+    if destino is None:
+        output.seek(0)
+    return output
+
+def parquet_disponivel():
+    return importlib.util.find_spec("pyarrow") is not None
+
+@metricas.instrumentar
+def gerar_arquivo_parquet(destino=None, empresa_id=None, data_inicio=None, data_fim=None, codigo=None,
+                          tamanho_lote=TAMANHO_LOTE_EXPORTACAO, progresso=None):
+    if not parquet_disponivel():
+        raise RuntimeError("A exportação em Parquet requer o pacote 'pyarrow'.")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        (nome, pa.int64() if coluna == 'diferenca_min' else pa.string())
+        for coluna, nome in COLUNAS_REGISTROS.items()
+    ])
+    output, fechar = _abrir_destino(destino)
+    try:
+        with pq.ParquetWriter(output, schema) as writer:
+            for lote in _iterar_registros(empresa_id, data_inicio, data_fim, codigo, tamanho_lote=tamanho_lote):
+                writer.write_table(pa.Table.from_pandas(lote, schema=schema, preserve_index=False))
+                if progresso is not None:
+                    progresso(len(lote))
+    finally:
+        if fechar:
+            output.close()
+    if destino is None:
+        output.seek(0)
+    return output
+
+EXPORTADORES = {
+    "xlsx": {
+        "descricao": "Excel (.xlsx)",
+        "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "gerar": gerar_arquivo_excel_streaming,
+    },
+    "csv": {
+        "descricao": "CSV (.csv)",
+        "mime": "text/csv",
+        "gerar": gerar_arquivo_csv,
+    },
+    "parquet": {
+        "descricao": "Parquet (.parquet)",
+        "mime": "application/vnd.apache.parquet",
+        "gerar": gerar_arquivo_parquet,
+    },
+}
+
+def contar_linhas_exportacao(formato, empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    # Total de linhas que o exportador vai escrever, usado para medir o progresso.
+    total = contar_registros(empresa_id, data_inicio, data_fim, codigo)
+    if formato == "xlsx":
+        with get_db_connection() as conn:
+            for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim):
+                where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+                total += conn.execute(f"""
+                    SELECT COUNT(*)
+                    FROM {_fonte(conn, 'resumo_diario', inicio, fim)} r
+                    JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                    WHERE {where}
+                """, parametros).fetchone()[0]
+    return total
+
+def formatos_exportacao_disponiveis():
+    return [formato for formato in EXPORTADORES if formato != "parquet" or parquet_disponivel()]
+
+@metricas.instrumentar
+def exportar_registros(formato, destino=None, **filtros):
+    if formato not in EXPORTADORES:
+        raise ValueError(f"Formato de exportação desconhecido: '{formato}'.")
+    return EXPORTADORES[formato]["gerar"](destino, **filtros)
@@ -1,150 +1,958 @@
 import sqlite3
-import pandas as pd
-from datetime import datetime, time
-from config import DATABASE_FILE, FUSO_HORARIO, HORARIOS_PADRAO, TOLERANCIA_MINUTOS
+from datetime import date, datetime, time
+from config import (
+    DATABASE_FILE, FUSO_HORARIO, HORARIOS_PADRAO, TOLERANCIA_MINUTOS, DIRETORIO_ARQUIVO, ARQUIVO_MESES_QUENTES,
+    POOL_CONEXOES_LEITURA, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE_KB,
+    CACHE_REFERENCIA_TTL_SEGUNDOS,
+    SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P, SENHA_THREADS_KDF,
+    SENHA_KDF_PENDENTES_MAX, SENHA_KDF_ESPERA_SEGUNDOS,
+    LOGIN_TENTATIVAS_MAX, LOGIN_JANELA_TENTATIVAS_SEGUNDOS, LOGIN_CODIGOS_MONITORADOS_MAX,
+    LOGIN_CACHE_TAMANHO, LOGIN_CACHE_TTL_SEGUNDOS
+)
 import hashlib
+import hmac
+import os
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
-import numpy as np
-import io
+import itertools
+import functools
+import logging
+import numbers
+import queue
+import threading
+import time as _time
+import metricas
+
+class _PoolConexoes:
+    # Conexões de leitura ficam numa fila limitada; a escrita usa uma única conexão
+    # serializada por lock. Em modo WAL os leitores nunca bloqueiam a batida de ponto.
+    def __init__(self, caminho, tamanho_leitura):
+        self.caminho = caminho
+        self._tamanho_leitura = max(1, tamanho_leitura)
+        self._leitores = queue.LifoQueue()
+        self._leitores_criados = 0
+        self._abertas = []
+        self._lock = threading.Lock()
+        self._lock_escrita = threading.Lock()
+        self._escritor = None
+
+    def _conectar(self):
+        conn = sqlite3.connect(
+            self.caminho, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+            factory=metricas.fabrica_conexao()
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        conn.execute(f"PRAGMA cache_size=-{int(SQLITE_CACHE_SIZE_KB)}")
+        self._abertas.append(conn)
+        return conn
+
+    def _obter_leitor(self):
+        try:
+            return self._leitores.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._leitores_criados < self._tamanho_leitura:
+                self._leitores_criados += 1
+                return self._conectar()
+        return self._leitores.get()
+
+    @contextmanager
+    def leitura(self):
+        conn = self._obter_leitor()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._leitores.put(conn)
+
+    @contextmanager
+    def escrita(self):
+        with self._lock_escrita:
+            if self._escritor is None:
+                with self._lock:
+                    self._escritor = self._conectar()
+            try:
+                yield self._escritor
+            finally:
+                if self._escritor.in_transaction:
+                    self._escritor.rollback()
+
+    def fechar(self):
+        with self._lock_escrita, self._lock:
+            for conn in self._abertas:
+                conn.close()
+            self._abertas = []
+            self._escritor = None
+            self._leitores = queue.LifoQueue()
+            self._leitores_criados = 0
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def _obter_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.caminho != DATABASE_FILE:
+            if _pool is not None:
+                _pool.fechar()
+            _pool = _PoolConexoes(DATABASE_FILE, POOL_CONEXOES_LEITURA)
+        return _pool
+
+def fechar_conexoes():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+            _pool = None
+    _bancos_inicializados.clear()
+    invalidar_cache_referencia()
+
+@contextmanager
+def get_db_connection(escrita=False):
+    pool = _obter_pool()
+    with (pool.escrita() if escrita else pool.leitura()) as conn:
+        yield conn
 
 @contextmanager
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE_FILE)
-    conn.row_factory = sqlite3.Row
+def _transacao_imediata(conn):
+    conn.execute("BEGIN IMMEDIATE")
     try:
         yield conn
-    finally:
-        conn.close()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+def _derivar_chave(senha, salt, n, r, p):
+    return hashlib.scrypt(
+        senha.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+        maxmem=128 * r * (n + p + 2) + 1024 * 1024, dklen=32
+    )
 
 def _hash_senha(senha: str) -> str:
-    return hashlib.sha256(senha.encode('utf-8')).hexdigest()
+    salt = os.urandom(16)
+    chave = _derivar_chave(senha, salt, SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P)
+    return f"scrypt${SENHA_SCRYPT_N}${SENHA_SCRYPT_R}${SENHA_SCRYPT_P}${salt.hex()}${chave.hex()}"
+
+def _conferir_senha(senha, armazenada):
+    # Retorna (senha confere, novo hash). O novo hash só é gerado quando a senha confere e
+    # está num formato antigo: SHA-256 sem salt ou scrypt com parâmetros de custo diferentes.
+    if '$' not in armazenada:
+        legado = hashlib.sha256(senha.encode('utf-8')).hexdigest()
+        if not hmac.compare_digest(legado, armazenada):
+            return False, None
+        return True, _hash_senha(senha)
+
+    try:
+        algoritmo, n, r, p, salt, chave = armazenada.split('$')
+        n, r, p, salt, chave = int(n), int(r), int(p), bytes.fromhex(salt), bytes.fromhex(chave)
+    except ValueError:
+        return False, None
+    if algoritmo != 'scrypt' or not hmac.compare_digest(_derivar_chave(senha, salt, n, r, p), chave):
+        return False, None
+    if (n, r, p) != (SENHA_SCRYPT_N, SENHA_SCRYPT_R, SENHA_SCRYPT_P):
+        return True, _hash_senha(senha)
+    return True, None
+
+@functools.lru_cache(maxsize=1)
+def _hash_ficticio():
+    # Usado para códigos inexistentes, para que a resposta leve o mesmo tempo de uma senha errada.
+    return _hash_senha(os.urandom(16).hex())
+
+_executor_kdf = None
+_executor_kdf_lock = threading.Lock()
+_vagas_kdf = threading.BoundedSemaphore(SENHA_KDF_PENDENTES_MAX)
+
+def _obter_executor_kdf():
+    # O scrypt libera o GIL, então as threads calculam em paralelo sem travar a renderização
+    # das demais sessões; o semáforo limita quantos logins podem ficar na fila.
+    global _executor_kdf
+    with _executor_kdf_lock:
+        if _executor_kdf is None:
+            _executor_kdf = ThreadPoolExecutor(max_workers=SENHA_THREADS_KDF, thread_name_prefix="kdf")
+        return _executor_kdf
+
+def _hash_senhas(senhas):
+    return list(_obter_executor_kdf().map(_hash_senha, senhas))
+
+_log = logging.getLogger(__name__)
+
+_COLUNAS_REGISTROS_SQL = "id, codigo_funcionario, nome, cargo, data, hora, descricao, diferenca_min, observacao"
+
+def _remover_eventos_duplicados(conn):
+    # Cliques concorrentes antigos podiam gravar o mesmo evento duas vezes no dia;
+    # mantém a primeira batida para que o índice único possa ser criado. As demais não
+    # são apagadas: vão para a quarentena registros_duplicados, com o momento da migração.
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registros_duplicados (
+            id TEXT NOT NULL,
+            codigo_funcionario TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            cargo TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            diferenca_min INTEGER NOT NULL,
+            observacao TEXT,
+            movido_em TEXT NOT NULL
+        )
+    """)
+    excedentes = "rowid NOT IN (SELECT MIN(rowid) FROM registros GROUP BY codigo_funcionario, data, descricao)"
+    movidas = conn.execute(f"""
+        INSERT INTO registros_duplicados ({_COLUNAS_REGISTROS_SQL}, movido_em)
+        SELECT {_COLUNAS_REGISTROS_SQL}, ? FROM registros WHERE {excedentes}
+    """, (datetime.now(FUSO_HORARIO).isoformat(timespec="seconds"),)).rowcount
+    conn.execute(f"DELETE FROM registros WHERE {excedentes}")
+    if movidas:
+        _log.warning("%d batida(s) duplicada(s) movida(s) para registros_duplicados.", movidas)
+
+_SQL_REGISTRAR_MUDANCA = """
+    INSERT INTO registros_mudancas (codigo_funcionario, data, seq)
+    VALUES ({linha}.codigo_funcionario, {linha}.data, (SELECT versao FROM versao_dados WHERE id = 1))
+    ON CONFLICT (codigo_funcionario, data) DO UPDATE SET seq = excluded.seq;
+"""
+
+MIGRACOES = [
+    [
+        "CREATE INDEX IF NOT EXISTS idx_registros_funcionario_data ON registros (codigo_funcionario, data)",
+        "CREATE INDEX IF NOT EXISTS idx_registros_data ON registros (data)",
+        "CREATE INDEX IF NOT EXISTS idx_funcionarios_empresa ON funcionarios (empresa_id)",
+    ],
+    [
+        _remover_eventos_duplicados,
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_registros_funcionario_data_evento ON registros (codigo_funcionario, data, descricao)",
+        "DROP INDEX IF EXISTS idx_registros_funcionario_data",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_registros_data_hora ON registros (data, hora)",
+        "DROP INDEX IF EXISTS idx_registros_data",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS resumo_diario (
+            codigo_funcionario TEXT NOT NULL,
+            data TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            inicio_expediente TEXT,
+            inicio_almoco TEXT,
+            fim_almoco TEXT,
+            fim_expediente TEXT,
+            pausa_segundos INTEGER NOT NULL,
+            trabalhado_segundos INTEGER,
+            observacao TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (codigo_funcionario, data)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_resumo_diario_data ON resumo_diario (data)",
+        lambda conn: _recalcular_resumo(conn, "1 = 1", []),
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_registros_funcionario_data_hora ON registros (codigo_funcionario, data, hora, id)",
+    ],
+    [
+        """
+        CREATE TABLE IF NOT EXISTS horarios_empresa (
+            empresa_id INTEGER NOT NULL,
+            descricao TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            PRIMARY KEY (empresa_id, descricao),
+            FOREIGN KEY (empresa_id) REFERENCES empresas (id)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS horarios_funcionario (
+            codigo_funcionario TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            PRIMARY KEY (codigo_funcionario, descricao),
+            FOREIGN KEY (codigo_funcionario) REFERENCES funcionarios (codigo)
+        )
+        """,
+    ],
+    [
+        # Contador incrementado a cada escrita em registros; identifica a versão dos dados
+        # para o cache de arquivos exportados (exportacoes.py).
+        "CREATE TABLE IF NOT EXISTS versao_dados (id INTEGER PRIMARY KEY CHECK (id = 1), versao INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO versao_dados (id, versao) VALUES (1, 0)",
+        *(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_registros_versao_{operacao.lower()} AFTER {operacao} ON registros
+            BEGIN
+                UPDATE versao_dados SET versao = versao + 1 WHERE id = 1;
+            END
+            """
+            for operacao in ("INSERT", "UPDATE", "DELETE")
+        ),
+    ],
+    [
+        # Catálogo dos meses movidos para os bancos anuais de arquivo (arquivar_mes).
+        # dia_inicio/dia_fim são dias desde 1970-01-01, a mesma codificação do arquivo.
+        """
+        CREATE TABLE IF NOT EXISTS meses_arquivados (
+            mes TEXT PRIMARY KEY,
+            ano INTEGER NOT NULL,
+            dia_inicio INTEGER NOT NULL,
+            dia_fim INTEGER NOT NULL,
+            registros INTEGER NOT NULL,
+            arquivado_em TEXT NOT NULL
+        )
+        """,
+    ],
+    [
+        # Registro de mudanças: para cada (funcionário, dia) tocado, a versao_dados da última
+        # escrita. Os relatórios em cache só releem os dias com seq maior que a sua.
+        """
+        CREATE TABLE IF NOT EXISTS registros_mudancas (
+            codigo_funcionario TEXT NOT NULL,
+            data TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            PRIMARY KEY (codigo_funcionario, data)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_registros_mudancas_seq ON registros_mudancas (seq)",
+        "CREATE INDEX IF NOT EXISTS idx_registros_mudancas_data ON registros_mudancas (data, seq)",
+        *(f"DROP TRIGGER IF EXISTS trg_registros_versao_{operacao}" for operacao in ("insert", "update", "delete")),
+        *(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_registros_mudancas_{operacao.lower()} AFTER {operacao} ON registros
+            BEGIN
+                UPDATE versao_dados SET versao = versao + 1 WHERE id = 1;
+                {" ".join(_SQL_REGISTRAR_MUDANCA.format(linha=linha) for linha in linhas)}
+            END
+            """
+            for operacao, linhas in (("INSERT", ("NEW",)), ("UPDATE", ("OLD", "NEW")), ("DELETE", ("OLD",)))
+        ),
+    ],
+    [
+        # Histórico das edições de registros (atualizar_registros): uma linha por registro
+        # alterado, com os valores antes e depois. Fica fora de registros, que continua
+        # estreita, e os gatilhos abaixo impedem que uma linha seja alterada ou apagada.
+        """
+        CREATE TABLE IF NOT EXISTS registros_auditoria (
+            id INTEGER PRIMARY KEY,
+            registro_id TEXT NOT NULL,
+            codigo_funcionario TEXT NOT NULL,
+            data TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            hora_anterior TEXT NOT NULL,
+            hora_nova TEXT NOT NULL,
+            diferenca_anterior INTEGER NOT NULL,
+            diferenca_nova INTEGER NOT NULL,
+            observacao_anterior TEXT,
+            observacao_nova TEXT,
+            editor TEXT,
+            alterado_em TEXT NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_registros_auditoria_registro ON registros_auditoria (registro_id, id)",
+        *(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_registros_auditoria_{operacao.lower()} BEFORE {operacao} ON registros_auditoria
+            BEGIN
+                SELECT RAISE(ABORT, 'registros_auditoria não admite {operacao}');
+            END
+            """
+            for operacao in ("UPDATE", "DELETE")
+        ),
+    ],
+    [
+        # Versão dos dados de referência (funcionários, empresas e horários) guardados no
+        # _CacheReferencia: escritas feitas por outro processo (cli.py, api.py) também a
+        # incrementam, e o cache de cada processo recarrega na consulta seguinte.
+        "CREATE TABLE IF NOT EXISTS versao_referencia (id INTEGER PRIMARY KEY CHECK (id = 1), versao INTEGER NOT NULL)",
+        "INSERT OR IGNORE INTO versao_referencia (id, versao) VALUES (1, 0)",
+        *(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{tabela}_referencia_{operacao.lower()} AFTER {operacao} ON {tabela}
+            BEGIN
+                UPDATE versao_referencia SET versao = versao + 1 WHERE id = 1;
+            END
+            """
+            for tabela in ("funcionarios", "empresas", "horarios_empresa", "horarios_funcionario")
+            for operacao in ("INSERT", "UPDATE", "DELETE")
+        ),
+    ],
+    [
+        # Evento depois da alteração; `descricao` passa a ser o evento anterior. A importação
+        # de batidas pode reatribuir o evento de uma batida gravada (importar_batidas).
+        # Linhas antigas ficam com NULL: o evento não mudou.
+        "ALTER TABLE registros_auditoria ADD COLUMN descricao_nova TEXT",
+    ],
+    [
+        # Uma linha por execução de recalcular_diferencas: período, filtro, tolerância,
+        # horários usados (JSON {evento: HH:MM:SS}) e quantas linhas mudaram. A contagem
+        # cresce na mesma transação de cada lote, então um recálculo interrompido fica com
+        # o total do que chegou a gravar e concluido_em NULL. Só essas duas colunas podem
+        # ser alteradas, e nenhuma linha pode ser apagada.
+        """
+        CREATE TABLE IF NOT EXISTS recalculos_diferencas (
+            id INTEGER PRIMARY KEY,
+            data_inicio TEXT,
+            data_fim TEXT,
+            empresa_id INTEGER,
+            tolerancia INTEGER NOT NULL,
+            horarios_anteriores TEXT,
+            horarios_novos TEXT NOT NULL,
+            horarios_vigentes INTEGER NOT NULL,
+            linhas_alteradas INTEGER NOT NULL DEFAULT 0,
+            iniciado_em TEXT NOT NULL,
+            concluido_em TEXT
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_recalculos_diferencas_update BEFORE UPDATE OF
+            id, data_inicio, data_fim, empresa_id, tolerancia, horarios_anteriores, horarios_novos,
+            horarios_vigentes, iniciado_em
+        ON recalculos_diferencas
+        BEGIN
+            SELECT RAISE(ABORT, 'recalculos_diferencas só admite UPDATE de linhas_alteradas e concluido_em');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_recalculos_diferencas_delete BEFORE DELETE ON recalculos_diferencas
+        BEGIN
+            SELECT RAISE(ABORT, 'recalculos_diferencas não admite DELETE');
+        END
+        """,
+    ],
+]
+
+def obter_versao_schema(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def obter_sequencia_mudancas(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    # Última seq que tocou algum dia do filtro (0 se nenhum mudou desde a migração): uma
+    # batida de hoje não muda a seq de um relatório do mês passado.
+    where, parametros = _filtros_registros(empresa_id, data_inicio, data_fim, codigo)
+    with get_db_connection() as conn:
+        return conn.execute(f"""
+            SELECT COALESCE(MAX(r.seq), 0)
+            FROM registros_mudancas r
+            JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+            WHERE {where}
+        """, parametros).fetchone()[0]
+
+def aplicar_migracoes(conn):
+    # Cada item de MIGRACOES eleva o PRAGMA user_version em uma unidade. Os passos podem
+    # ser comandos SQL ou funções que recebem a conexão, e cada migração roda em sua
+    # própria transação, de modo que um ponto.db existente evolui sem perder dados.
+    versao_atual = obter_versao_schema(conn)
+    for versao, passos in enumerate(MIGRACOES[versao_atual:], start=versao_atual + 1):
+        conn.execute("BEGIN")
+        try:
+            for passo in passos:
+                if callable(passo):
+                    passo(conn)
+                else:
+                    conn.execute(passo)
+            conn.execute(f"PRAGMA user_version = {versao}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return obter_versao_schema(conn)
+
+def _criar_tabelas(conn):
+    cursor = conn.cursor()
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS empresas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_empresa TEXT NOT NULL UNIQUE
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS funcionarios (
+            codigo TEXT PRIMARY KEY,
+            nome TEXT NOT NULL,
+            cargo TEXT NOT NULL,
+            senha TEXT NOT NULL,
+            role TEXT NOT NULL,
+            empresa_id INTEGER,
+            FOREIGN KEY (empresa_id) REFERENCES empresas (id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS registros (
+            id TEXT PRIMARY KEY,
+            codigo_funcionario TEXT NOT NULL,
+            nome TEXT NOT NULL,
+            cargo TEXT NOT NULL,
+            data TEXT NOT NULL,
+            hora TEXT NOT NULL,
+            descricao TEXT NOT NULL,
+            diferenca_min INTEGER NOT NULL,
+            observacao TEXT,
+            FOREIGN KEY (codigo_funcionario) REFERENCES funcionarios (codigo)
+        )
+    ''')
+    
+    cursor.execute("SELECT COUNT(*) FROM empresas")
+    if cursor.fetchone()[0] == 0:
+        initial_empresas = [
+            ('Ômega Barroso',),
+            ('Ômega Matriz',),
+            ('Ômega Cariri',),
+            ('Ômega Sobral',)
+        ]
+        cursor.executemany("INSERT INTO empresas (nome_empresa) VALUES (?)", initial_empresas)
+
+    cursor.execute("SELECT COUNT(*) FROM funcionarios")
+    if cursor.fetchone()[0] == 0:
+        initial_users = [
+            ('admin', 'Administrador', 'Sistema', _hash_senha('admin123'), 'admin', None)
+        ]
+        cursor.executemany("INSERT INTO funcionarios (codigo, nome, cargo, senha, role, empresa_id) VALUES (?, ?, ?, ?, ?, ?)", initial_users)
+
+    conn.commit()
+
+_bancos_inicializados = set()
+_init_lock = threading.Lock()
 
 def init_db():
+    # Roda uma vez por processo e por arquivo (o Streamlit reexecuta app.py a cada clique).
+    # Num banco já na última versão do schema, só o PRAGMA user_version é consultado.
+    caminho = os.path.abspath(DATABASE_FILE)
+    with _init_lock:
+        if caminho in _bancos_inicializados:
+            return
+        with get_db_connection(escrita=True) as conn:
+            if obter_versao_schema(conn) < len(MIGRACOES):
+                _criar_tabelas(conn)
+                aplicar_migracoes(conn)
+        _bancos_inicializados.add(caminho)
+    invalidar_cache_referencia()
+
+class _CacheReferencia:
+    # Cache de processo (compartilhado entre sessões do Streamlit) para tabelas de
+    # referência. Cada item guarda a versão do banco em que foi lido (`versao()`, uma
+    # consulta de uma linha) e é recarregado quando ela muda, inclusive por escritas de
+    # outro processo. A geração impede que uma carga concorrente com uma invalidação
+    # grave um valor já desatualizado.
+    def __init__(self, ttl_segundos=None, versao=None):
+        self.ttl_segundos = ttl_segundos
+        self._versao = versao
+        self._itens = {}
+        self._geracao = 0
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, carregar):
+        agora = _time.monotonic()
+        # Lida antes da carga: uma escrita entre as duas deixa o item com a versão antiga
+        # e ele é recarregado na consulta seguinte.
+        versao = self._versao() if self._versao is not None else None
+        with self._lock:
+            item = self._itens.get(chave)
+            if (item is not None and item[2] == versao
+                    and (self.ttl_segundos is None or agora - item[1] < self.ttl_segundos)):
+                self.acertos += 1
+                return item[0]
+            self.falhas += 1
+            geracao = self._geracao
+        valor = carregar()
+        with self._lock:
+            if geracao == self._geracao:
+                self._itens[chave] = (valor, agora, versao)
+        return valor
+
+    def invalidar(self):
+        with self._lock:
+            self._itens.clear()
+            self._geracao += 1
+
+    def estatisticas(self):
+        with self._lock:
+            return {"acertos": self.acertos, "falhas": self.falhas, "itens": len(self._itens)}
+
+def _versao_referencia():
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS empresas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nome_empresa TEXT NOT NULL UNIQUE
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS funcionarios (
-                codigo TEXT PRIMARY KEY,
-                nome TEXT NOT NULL,
-                cargo TEXT NOT NULL,
-                senha TEXT NOT NULL,
-                role TEXT NOT NULL,
-                empresa_id INTEGER,
-                FOREIGN KEY (empresa_id) REFERENCES empresas (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS registros (
-                id TEXT PRIMARY KEY,
-                codigo_funcionario TEXT NOT NULL,
-                nome TEXT NOT NULL,
-                cargo TEXT NOT NULL,
-                data TEXT NOT NULL,
-                hora TEXT NOT NULL,
-                descricao TEXT NOT NULL,
-                diferenca_min INTEGER NOT NULL,
-                observacao TEXT,
-                FOREIGN KEY (codigo_funcionario) REFERENCES funcionarios (codigo)
-            )
-        ''')
-        
-        cursor.execute("SELECT COUNT(*) FROM empresas")
-        if cursor.fetchone()[0] == 0:
-            initial_empresas = [
-                ('Ômega Barroso',),
-                ('Ômega Matriz',),
-                ('Ômega Cariri',),
-                ('Ômega Sobral',)
-            ]
-            cursor.executemany("INSERT INTO empresas (nome_empresa) VALUES (?)", initial_empresas)
-
-        cursor.execute("SELECT COUNT(*) FROM funcionarios")
-        if cursor.fetchone()[0] == 0:
-            initial_users = [
-                ('admin', 'Administrador', 'Sistema', _hash_senha('admin123'), 'admin', None)
-            ]
-            cursor.executemany("INSERT INTO funcionarios (codigo, nome, cargo, senha, role, empresa_id) VALUES (?, ?, ?, ?, ?, ?)", initial_users)
+        return conn.execute("SELECT versao FROM versao_referencia WHERE id = 1").fetchone()[0]
 
-        conn.commit()
+_cache_referencia = _CacheReferencia(CACHE_REFERENCIA_TTL_SEGUNDOS, versao=_versao_referencia)
+
+def invalidar_cache_referencia():
+    _cache_referencia.invalidar()
 
-def ler_empresas():
+def estatisticas_cache():
+    return _cache_referencia.estatisticas()
+
+def _carregar_mapa_funcionario_empresa():
     with get_db_connection() as conn:
-        df = pd.read_sql_query("SELECT id, nome_empresa FROM empresas ORDER BY nome_empresa", conn)
-    return df
+        return {row['codigo']: row['empresa_id'] for row in conn.execute("SELECT codigo, empresa_id FROM funcionarios")}
 
-def ler_funcionarios_df():
+def obter_funcionario(codigo):
     with get_db_connection() as conn:
-        query = """
-            SELECT f.codigo, f.nome, f.cargo, f.role, f.empresa_id, e.nome_empresa
-            FROM funcionarios f
-            LEFT JOIN empresas e ON f.empresa_id = e.id
-        """
-        df = pd.read_sql_query(query, conn)
-    return df
+        linha = conn.execute(
+            "SELECT codigo, nome, cargo, role, empresa_id FROM funcionarios WHERE codigo = ?", (codigo,)
+        ).fetchone()
+    return dict(linha) if linha else None
 
-def verificar_login(codigo, senha):
-    senha_hash = _hash_senha(senha)
+def obter_mapa_funcionario_empresa():
+    return _cache_referencia.obter((DATABASE_FILE, "mapa_funcionario_empresa"), _carregar_mapa_funcionario_empresa)
+
+def _carregar_horarios():
+    # Índice em memória dos horários: cada empresa e cada funcionário com horário próprio
+    # já vêm resolvidos (funcionário > empresa > HORARIOS_PADRAO, evento a evento), para
+    # que a batida encontre os horários previstos com uma consulta a dicionário.
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM funcionarios WHERE codigo = ? AND senha = ?", (codigo, senha_hash))
-        user = cursor.fetchone()
-        
-        if user:
-            return dict(user), None
-    return None, "Código ou senha inválidos."
+        linhas_empresas = conn.execute("SELECT empresa_id, descricao, hora FROM horarios_empresa").fetchall()
+        linhas_funcionarios = conn.execute("""
+            SELECT hf.codigo_funcionario, f.empresa_id, hf.descricao, hf.hora
+            FROM horarios_funcionario hf
+            JOIN funcionarios f ON f.codigo = hf.codigo_funcionario
+        """).fetchall()
+
+    por_empresa = {}
+    for empresa_id, descricao, hora in linhas_empresas:
+        if descricao in HORARIOS_PADRAO:
+            por_empresa.setdefault(empresa_id, dict(HORARIOS_PADRAO))[descricao] = time.fromisoformat(hora)
+    por_funcionario = {}
+    for codigo, empresa_id, descricao, hora in linhas_funcionarios:
+        if descricao in HORARIOS_PADRAO:
+            base = por_empresa.get(empresa_id, HORARIOS_PADRAO)
+            por_funcionario.setdefault(codigo, dict(base))[descricao] = time.fromisoformat(hora)
+    return {"empresas": por_empresa, "funcionarios": por_funcionario}
+
+def _indice_horarios():
+    return _cache_referencia.obter((DATABASE_FILE, "horarios"), _carregar_horarios)
+
+def obter_horarios_empresa(empresa_id):
+    return _indice_horarios()["empresas"].get(empresa_id, HORARIOS_PADRAO)
+
+def obter_horarios_funcionario(codigo):
+    # O dicionário devolvido é compartilhado pelo índice e não deve ser alterado.
+    indice = _indice_horarios()
+    horarios = indice["funcionarios"].get(codigo)
+    if horarios is None:
+        horarios = indice["empresas"].get(obter_mapa_funcionario_empresa().get(codigo), HORARIOS_PADRAO)
+    return horarios
+
+def funcionario_tem_horario_proprio(codigo):
+    return codigo in _indice_horarios()["funcionarios"]
+
+def _gravar_horarios(tabela, coluna_chave, chave, horarios):
+    if horarios is not None:
+        desconhecidos = set(horarios) - set(HORARIOS_PADRAO)
+        if desconhecidos:
+            return f"Evento(s) desconhecido(s): {', '.join(sorted(desconhecidos))}.", "error"
+        try:
+            linhas = [(chave, evento, _formatar_horario(hora)) for evento, hora in horarios.items()]
+        except ValueError:
+            return "Formato de hora inválido. Use HH:MM:SS.", "error"
+    try:
+        with get_db_connection(escrita=True) as conn:
+            with conn:
+                conn.execute(f"DELETE FROM {tabela} WHERE {coluna_chave} = ?", (chave,))
+                if horarios:
+                    conn.executemany(f"INSERT INTO {tabela} ({coluna_chave}, descricao, hora) VALUES (?, ?, ?)", linhas)
+    except sqlite3.Error as e:
+        return f"Erro no banco de dados ao salvar horários: {e}", "error"
+
+    invalidar_cache_referencia()
+    return "Horários atualizados com sucesso.", "success"
+
+def _formatar_horario(hora):
+    if isinstance(hora, str):
+        hora = time.fromisoformat(hora.strip())
+    return hora.replace(microsecond=0).strftime("%H:%M:%S")
+
+@metricas.instrumentar
+def definir_horarios_empresa(empresa_id, horarios):
+    return _gravar_horarios("horarios_empresa", "empresa_id", int(empresa_id), horarios)
+
+@metricas.instrumentar
+def definir_horarios_funcionario(codigo, horarios):
+    # horarios=None remove o horário próprio e o funcionário volta a seguir o da empresa.
+    return _gravar_horarios("horarios_funcionario", "codigo_funcionario", codigo, horarios)
+
+class _LimitadorLogin:
+    # Conta falhas por código numa janela deslizante. Códigos bloqueados são recusados
+    # antes de qualquer consulta ou cálculo de hash. Os códigos ficam em ordem da última
+    # falha: os expirados saem pela frente a cada falha registrada e, numa rajada de
+    # códigos aleatórios, `max_codigos` limita a memória descartando os mais antigos.
+    def __init__(self, max_tentativas, janela_segundos, max_codigos):
+        self.max_tentativas = max_tentativas
+        self.janela_segundos = janela_segundos
+        self.max_codigos = max_codigos
+        self._falhas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def segundos_bloqueado(self, codigo):
+        agora = _time.monotonic()
+        with self._lock:
+            falhas = self._falhas.get(codigo)
+            if not falhas:
+                return 0
+            while falhas and agora - falhas[0] >= self.janela_segundos:
+                falhas.popleft()
+            if not falhas:
+                del self._falhas[codigo]
+                return 0
+            if len(falhas) < self.max_tentativas:
+                return 0
+            return int(self.janela_segundos - (agora - falhas[0])) + 1
+
+    def registrar_falha(self, codigo):
+        agora = _time.monotonic()
+        with self._lock:
+            self._falhas.setdefault(codigo, deque(maxlen=self.max_tentativas)).append(agora)
+            self._falhas.move_to_end(codigo)
+            while self._falhas:
+                mais_antigo = next(iter(self._falhas.values()))
+                if agora - mais_antigo[-1] < self.janela_segundos and len(self._falhas) <= self.max_codigos:
+                    break
+                self._falhas.popitem(last=False)
+
+    def limpar(self, codigo):
+        with self._lock:
+            self._falhas.pop(codigo, None)
+
+class _CacheLogin:
+    # Guarda, por código, um HMAC da última senha aceita (com chave aleatória do processo,
+    # nunca a senha) e o hash armazenado naquele momento. Trocar a senha no banco invalida
+    # a entrada, pois o hash armazenado deixa de coincidir.
+    def __init__(self, tamanho, ttl_segundos):
+        self.tamanho = tamanho
+        self.ttl_segundos = ttl_segundos
+        self._chave = os.urandom(32)
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _marca(self, senha):
+        return hmac.new(self._chave, senha.encode('utf-8'), hashlib.sha256).digest()
+
+    def confere(self, chave, senha, armazenada):
+        marca = self._marca(senha)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or _time.monotonic() - item[2] >= self.ttl_segundos:
+                return False
+            self._itens.move_to_end(chave)
+        return hmac.compare_digest(item[0], marca) and item[1] == armazenada
+
+    def guardar(self, chave, senha, armazenada):
+        marca = self._marca(senha)
+        with self._lock:
+            self._itens[chave] = (marca, armazenada, _time.monotonic())
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho:
+                self._itens.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+_limitador_login = _LimitadorLogin(
+    LOGIN_TENTATIVAS_MAX, LOGIN_JANELA_TENTATIVAS_SEGUNDOS, LOGIN_CODIGOS_MONITORADOS_MAX
+)
+_cache_login = _CacheLogin(LOGIN_CACHE_TAMANHO, LOGIN_CACHE_TTL_SEGUNDOS)
+
+@metricas.instrumentar
+def verificar_login(codigo, senha):
+    espera = _limitador_login.segundos_bloqueado(codigo)
+    if espera:
+        return None, f"Muitas tentativas para este código. Tente novamente em {espera} s."
 
-def obter_proximo_evento(codigo):
-    hoje_str = datetime.now(FUSO_HORARIO).strftime("%Y-%m-%d")
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM registros WHERE codigo_funcionario = ? AND data = ?", (codigo, hoje_str))
-        num_pontos = cursor.fetchone()[0]
-    
+        user = conn.execute(
+            "SELECT codigo, nome, cargo, senha, role, empresa_id FROM funcionarios WHERE codigo = ?", (codigo,)
+        ).fetchone()
+    user = dict(user) if user else None
+    armazenada = user.pop('senha') if user else _hash_ficticio()
+    chave_cache = (DATABASE_FILE, codigo)
+
+    if user and _cache_login.confere(chave_cache, senha, armazenada):
+        return user, None
+
+    if not _vagas_kdf.acquire(timeout=SENHA_KDF_ESPERA_SEGUNDOS):
+        return None, "Servidor ocupado no momento. Tente novamente em instantes."
+    try:
+        confere, novo_hash = _obter_executor_kdf().submit(_conferir_senha, senha, armazenada).result()
+    finally:
+        _vagas_kdf.release()
+
+    if not (user and confere):
+        _limitador_login.registrar_falha(codigo)
+        return None, "Código ou senha inválidos."
+
+    if novo_hash:
+        try:
+            with get_db_connection(escrita=True) as conn:
+                with conn:
+                    conn.execute(
+                        "UPDATE funcionarios SET senha = ? WHERE codigo = ? AND senha = ?",
+                        (novo_hash, codigo, armazenada)
+                    )
+            armazenada = novo_hash
+        except sqlite3.Error:
+            pass
+
+    _limitador_login.limpar(codigo)
+    _cache_login.guardar(chave_cache, senha, armazenada)
+    return user, None
+
+@functools.lru_cache(maxsize=131072)
+def _segundos_hora(hora):
+    try:
+        horario = datetime.strptime(hora, "%H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+    return horario.hour * 3600 + horario.minute * 60 + horario.second
+
+def _resumir_dia(linhas):
+    # Mesmas regras de gerar_relatorio_organizado_df: primeira hora de cada evento, pausa
+    # negativa ou incompleta conta como zero e observações distintas unidas por " | ".
+    horas = {}
+    observacoes = []
+    for linha in linhas:
+        horas.setdefault(linha['descricao'], linha['hora'])
+        if linha['observacao'] is not None and linha['observacao'] not in observacoes:
+            observacoes.append(linha['observacao'])
+
+    inicio_exp, inicio_alm, fim_alm, fim_exp = (horas.get(evento) for evento in HORARIOS_PADRAO)
+    s_inicio_exp, s_inicio_alm, s_fim_alm, s_fim_exp = (
+        _segundos_hora(hora) for hora in (inicio_exp, inicio_alm, fim_alm, fim_exp)
+    )
+    pausa = 0
+    if s_inicio_alm is not None and s_fim_alm is not None and s_fim_alm >= s_inicio_alm:
+        pausa = s_fim_alm - s_inicio_alm
+    trabalhado = None
+    if s_inicio_exp is not None and s_fim_exp is not None:
+        trabalhado = s_fim_exp - s_inicio_exp - pausa
+
+    primeira = linhas[0]
+    return (
+        primeira['codigo_funcionario'], primeira['data'], primeira['nome'],
+        inicio_exp, inicio_alm, fim_alm, fim_exp, pausa, trabalhado, " | ".join(observacoes)
+    )
+
+def _recalcular_resumo(conn, condicao, parametros):
+    # `condicao` só pode usar colunas presentes nas duas tabelas (codigo_funcionario, data).
+    conn.execute(f"DELETE FROM resumo_diario WHERE {condicao}", parametros)
+    cursor = conn.execute(f"""
+        SELECT codigo_funcionario, data, nome, descricao, hora, observacao
+        FROM registros
+        WHERE {condicao}
+        ORDER BY codigo_funcionario, data, hora
+    """, parametros)
+    linhas_por_dia = itertools.groupby(cursor, key=lambda linha: (linha['codigo_funcionario'], linha['data']))
+    conn.executemany(
+        "INSERT INTO resumo_diario VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (_resumir_dia(list(linhas)) for _, linhas in linhas_por_dia)
+    )
+
+def _atualizar_resumo_dia(conn, codigo, data_str):
+    _recalcular_resumo(conn, "codigo_funcionario = ? AND data = ?", [codigo, data_str])
+
+def _marcar_dias_resumo(conn, condicao, parametros):
+    conn.execute(f"""
+        INSERT INTO registros_mudancas (codigo_funcionario, data, seq)
+        SELECT codigo_funcionario, data, (SELECT versao FROM versao_dados WHERE id = 1)
+        FROM resumo_diario WHERE {condicao}
+        ON CONFLICT (codigo_funcionario, data) DO UPDATE SET seq = excluded.seq
+    """, parametros)
+
+@metricas.instrumentar
+def reconstruir_resumo_diario(data_inicio=None, data_fim=None):
+    condicoes = ["1 = 1"]
+    parametros = []
+    if data_inicio is not None:
+        condicoes.append("data >= ?")
+        parametros.append(_formatar_data_filtro(data_inicio))
+    if data_fim is not None:
+        condicoes.append("data <= ?")
+        parametros.append(_formatar_data_filtro(data_fim))
+    condicao = " AND ".join(condicoes)
+    with get_db_connection(escrita=True) as conn:
+        with _transacao_imediata(conn):
+            # O resumo é reescrito sem passar pelos gatilhos de registros: a versão e os
+            # dias reconstruídos (antes e depois) são marcados aqui, para que os relatórios
+            # em cache e os arquivos exportados releiam o período.
+            conn.execute("UPDATE versao_dados SET versao = versao + 1 WHERE id = 1")
+            _marcar_dias_resumo(conn, condicao, parametros)
+            _recalcular_resumo(conn, condicao, parametros)
+            _marcar_dias_resumo(conn, condicao, parametros)
+            return conn.execute(
+                f"SELECT COUNT(*) FROM resumo_diario WHERE {condicao}", parametros
+            ).fetchone()[0]
+
+def _proximo_evento(conn, codigo, data_str):
+    num_pontos = conn.execute(
+        "SELECT COUNT(*) FROM registros WHERE codigo_funcionario = ? AND data = ?", (codigo, data_str)
+    ).fetchone()[0]
+
     eventos_programados = list(HORARIOS_PADRAO.keys())
     if num_pontos < len(eventos_programados):
         return eventos_programados[num_pontos]
     return "Jornada Finalizada"
 
-def bater_ponto(codigo, nome, cargo):
+@metricas.instrumentar
+def obter_proximo_evento(codigo):
+    hoje_str = datetime.now(FUSO_HORARIO).strftime("%Y-%m-%d")
+    with get_db_connection() as conn:
+        return _proximo_evento(conn, codigo, hoje_str)
+
+def calcular_diferencas_min(segundos_reais, segundos_previstos, tolerancia=TOLERANCIA_MINUTOS):
+    # Regra única de pontualidade, usada na batida, na edição, na importação e no
+    # recálculo. Recebe segundos do dia (escalares ou arrays): a diferença é arredondada
+    # para minutos e a tolerância é descontada nos dois sentidos; dentro dela vale 0.
+    # Escalares (batida e edição) são calculados sem NumPy, que só é importado para arrays.
+    if isinstance(segundos_reais, numbers.Real) and isinstance(segundos_previstos, numbers.Real):
+        diferenca_bruta = round((segundos_reais - segundos_previstos) / 60)
+        excesso = max(abs(diferenca_bruta) - tolerancia, 0)
+        return excesso if diferenca_bruta > 0 else -excesso
+    import numpy as np
+    diferenca_bruta = np.round((np.asarray(segundos_reais, dtype="float64") - segundos_previstos) / 60)
+    excesso = np.maximum(np.abs(diferenca_bruta) - tolerancia, 0)
+    return (np.sign(diferenca_bruta) * excesso).astype(np.int64)
+
+def _segundos_previstos(horarios=None):
+    horarios = HORARIOS_PADRAO if horarios is None else horarios
+    return {evento: h.hour * 3600 + h.minute * 60 + h.second for evento, h in horarios.items()}
+
+@metricas.instrumentar
+def bater_ponto(codigo, nome, cargo, evento_esperado=None):
     agora = datetime.now(FUSO_HORARIO)
     hoje_str = agora.strftime("%Y-%m-%d")
-    proximo_evento = obter_proximo_evento(codigo)
 
-    if proximo_evento == "Jornada Finalizada":
-        return "Sua jornada de hoje já foi completamente registada.", "warning"
+    # Decidir o evento e inserir na mesma transação IMMEDIATE evita que dois cliques
+    # simultâneos vejam a mesma contagem; o índice único é a garantia final.
+    try:
+        with get_db_connection(escrita=True) as conn:
+            with _transacao_imediata(conn):
+                proximo_evento = _proximo_evento(conn, codigo, hoje_str)
 
-    hora_prevista = HORARIOS_PADRAO[proximo_evento]
-    datetime_previsto = agora.replace(hour=hora_prevista.hour, minute=hora_prevista.minute, second=0, microsecond=0)
-    
-    diferenca_bruta_min = round((agora - datetime_previsto).total_seconds() / 60)
-    
-    if abs(diferenca_bruta_min) <= TOLERANCIA_MINUTOS:
-        diferenca_final_min = 0
-    else:
-        if diferenca_bruta_min > 0:
-            diferenca_final_min = diferenca_bruta_min - TOLERANCIA_MINUTOS
-        else:
-            diferenca_final_min = diferenca_bruta_min + TOLERANCIA_MINUTOS
-            
-    novo_registro = {
-        "id": f"{codigo}-{agora.isoformat()}", "codigo_funcionario": codigo, "nome": nome,
-        "cargo": cargo, "data": hoje_str, "hora": agora.strftime("%H:%M:%S"),
-        "descricao": proximo_evento, "diferenca_min": diferenca_final_min, "observacao": ""
-    }
+                if proximo_evento == "Jornada Finalizada":
+                    return "Sua jornada de hoje já foi completamente registada.", "warning"
+                if evento_esperado is not None and proximo_evento != evento_esperado:
+                    return f"'{evento_esperado}' já foi registado. Atualize a página para continuar.", "warning"
 
-    with get_db_connection() as conn:
-        with conn:
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO registros VALUES (:id, :codigo_funcionario, :nome, :cargo, :data, :hora, :descricao, :diferenca_min, :observacao)", novo_registro)
+                segundos_agora = agora.hour * 3600 + agora.minute * 60 + agora.second + agora.microsecond / 1e6
+                segundos_previstos = _segundos_previstos(obter_horarios_funcionario(codigo))[proximo_evento]
+                diferenca_bruta_min = int(calcular_diferencas_min(segundos_agora, segundos_previstos, tolerancia=0))
+                diferenca_final_min = int(calcular_diferencas_min(segundos_agora, segundos_previstos))
+
+                novo_registro = {
+                    "id": f"{codigo}-{agora.isoformat()}", "codigo_funcionario": codigo, "nome": nome,
+                    "cargo": cargo, "data": hoje_str, "hora": agora.strftime("%H:%M:%S"),
+                    "descricao": proximo_evento, "diferenca_min": diferenca_final_min, "observacao": ""
+                }
+                conn.execute("INSERT INTO registros VALUES (:id, :codigo_funcionario, :nome, :cargo, :data, :hora, :descricao, :diferenca_min, :observacao)", novo_registro)
+                _atualizar_resumo_dia(conn, codigo, hoje_str)
+    except sqlite3.IntegrityError:
+        return "Este ponto já foi registado. Atualize a página para continuar.", "warning"
+    except sqlite3.Error as e:
+        return f"Erro no banco de dados ao registar o ponto: {e}", "error"
     
     msg_extra = ""
     if diferenca_final_min != 0:
@@ -161,69 +969,471 @@ def bater_ponto(codigo, nome, cargo):
         
     return f"'{proximo_evento}' registado para {nome} às {novo_registro['hora']}{msg_extra}{status_final}.", "success"
 
-def ler_registros_df():
+def _formatar_data_filtro(valor):
+    if valor is None:
+        return None
+    if isinstance(valor, str):
+        return valor
+    return valor.strftime("%Y-%m-%d")
+
+def _filtros_registros(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    # Sem empresa selecionada o relatório cobre apenas funcionários (exclui o admin),
+    # como o filtro original feito em pandas no painel do administrador.
+    condicoes = []
+    parametros = []
+    if empresa_id:
+        condicoes.append("f.empresa_id = ?")
+        parametros.append(int(empresa_id))
+    else:
+        condicoes.append("f.role = 'employee'")
+    if data_inicio is not None:
+        condicoes.append("r.data >= ?")
+        parametros.append(_formatar_data_filtro(data_inicio))
+    if data_fim is not None:
+        condicoes.append("r.data <= ?")
+        parametros.append(_formatar_data_filtro(data_fim))
+    if codigo is not None:
+        condicoes.append("r.codigo_funcionario = ?")
+        parametros.append(codigo)
+    return " AND ".join(condicoes), parametros
+
+# Meses fechados ficam em bancos anuais (DIRETORIO_ARQUIVO/<banco>_<ano>.db) com data em
+# dias desde 1970-01-01 e horas em segundos do dia. As consultas de relatório leem de
+# _fonte(), que devolve a tabela quente ou, quando o período cruza meses arquivados, um
+# UNION ALL com os anos necessários anexados à conexão e decodificados para TEXT.
+_CODIFICAR_ARQUIVO = {
+    "dia": "CAST(julianday({0}) - 2440587.5 AS INTEGER)",
+    "segundo": "(CAST(substr({0}, 1, 2) AS INTEGER) * 3600 + CAST(substr({0}, 4, 2) AS INTEGER) * 60"
+               " + CAST(substr({0}, 7, 2) AS INTEGER))",
+}
+_DECODIFICAR_ARQUIVO = {
+    "dia": "date({0} * 86400, 'unixepoch')",
+    "segundo": "time({0}, 'unixepoch')",
+}
+# (coluna no banco quente, coluna no arquivo, codificação)
+_COLUNAS_ARQUIVO = {
+    "registros": [
+        ("id", "id", None), ("codigo_funcionario", "codigo_funcionario", None), ("nome", "nome", None),
+        ("cargo", "cargo", None), ("data", "dia", "dia"), ("hora", "segundo", "segundo"),
+        ("descricao", "descricao", None), ("diferenca_min", "diferenca_min", None), ("observacao", "observacao", None),
+    ],
+    "resumo_diario": [
+        ("codigo_funcionario", "codigo_funcionario", None), ("data", "dia", "dia"), ("nome", "nome", None),
+        ("inicio_expediente", "inicio_expediente", "segundo"), ("inicio_almoco", "inicio_almoco", "segundo"),
+        ("fim_almoco", "fim_almoco", "segundo"), ("fim_expediente", "fim_expediente", "segundo"),
+        ("pausa_segundos", "pausa_segundos", None), ("trabalhado_segundos", "trabalhado_segundos", None),
+        ("observacao", "observacao", None),
+    ],
+}
+_ESQUEMA_ARQUIVO = [
+    """
+    CREATE TABLE IF NOT EXISTS {esquema}.registros (
+        id TEXT PRIMARY KEY,
+        codigo_funcionario TEXT NOT NULL,
+        nome TEXT NOT NULL,
+        cargo TEXT NOT NULL,
+        dia INTEGER NOT NULL,
+        segundo INTEGER NOT NULL,
+        descricao TEXT NOT NULL,
+        diferenca_min INTEGER NOT NULL,
+        observacao TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_registros_funcionario_dia ON registros (codigo_funcionario, dia, segundo)",
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_registros_dia ON registros (dia, segundo)",
+    """
+    CREATE TABLE IF NOT EXISTS {esquema}.resumo_diario (
+        codigo_funcionario TEXT NOT NULL,
+        dia INTEGER NOT NULL,
+        nome TEXT NOT NULL,
+        inicio_expediente INTEGER,
+        inicio_almoco INTEGER,
+        fim_almoco INTEGER,
+        fim_expediente INTEGER,
+        pausa_segundos INTEGER NOT NULL,
+        trabalhado_segundos INTEGER,
+        observacao TEXT NOT NULL DEFAULT '',
+        PRIMARY KEY (codigo_funcionario, dia)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS {esquema}.idx_resumo_diario_dia ON resumo_diario (dia)",
+]
+# SQLITE_MAX_ATTACHED vale 10 nas compilações comuns; uma vaga fica livre para arquivar_mes.
+_MAX_ANOS_ANEXADOS = 9
+
+def _dia_epoca(valor):
+    return (date.fromisoformat(_formatar_data_filtro(valor)) - date(1970, 1, 1)).days
+
+def _caminho_arquivo_anual(ano):
+    base = os.path.splitext(os.path.basename(DATABASE_FILE))[0]
+    diretorio = os.path.join(os.path.dirname(os.path.abspath(DATABASE_FILE)), DIRETORIO_ARQUIVO)
+    return os.path.join(diretorio, f"{base}_{ano}.db")
+
+def _arquivo_anual_existente(ano):
+    # ATTACH de um caminho inexistente cria um banco vazio: a leitura falharia depois com
+    # "no such table" e desarquivar_mes tiraria o mês do catálogo sem devolver nenhuma linha.
+    caminho = _caminho_arquivo_anual(ano)
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(
+            f"Arquivo de {ano} não encontrado em '{caminho}', mas meses_arquivados tem meses desse ano."
+        )
+    return caminho
+
+def _intervalos_arquivados(conn, data_inicio=None, data_fim=None):
+    # {ano: [(dia_inicio, dia_fim), ...]} com os meses arquivados que cruzam o período;
+    # meses consecutivos viram um único intervalo.
+    condicoes = ["1 = 1"]
+    parametros = []
+    if data_inicio is not None:
+        condicoes.append("dia_fim >= ?")
+        parametros.append(_dia_epoca(data_inicio))
+    if data_fim is not None:
+        condicoes.append("dia_inicio <= ?")
+        parametros.append(_dia_epoca(data_fim))
+    intervalos = {}
+    for ano, inicio, fim in conn.execute(f"""
+        SELECT ano, dia_inicio, dia_fim FROM meses_arquivados
+        WHERE {' AND '.join(condicoes)}
+        ORDER BY dia_inicio
+    """, parametros):
+        faixas = intervalos.setdefault(ano, [])
+        if faixas and faixas[-1][1] + 1 == inicio:
+            faixas[-1] = (faixas[-1][0], fim)
+        else:
+            faixas.append((inicio, fim))
+    return intervalos
+
+def _anexar_arquivos(conn, anos):
+    necessarios = {f"arquivo_{ano}": ano for ano in anos}
+    if len(necessarios) > _MAX_ANOS_ANEXADOS:
+        raise ValueError(
+            f"O período cobre {len(necessarios)} anos arquivados; o limite por consulta é {_MAX_ANOS_ANEXADOS}."
+        )
+    anexados = [linha[1] for linha in conn.execute("PRAGMA database_list") if linha[1].startswith("arquivo_")]
+    faltando = [nome for nome in necessarios if nome not in anexados]
+    excedente = len(anexados) + len(faltando) - _MAX_ANOS_ANEXADOS
+    for nome in [nome for nome in anexados if nome not in necessarios][:max(excedente, 0)]:
+        conn.execute(f"DETACH DATABASE {nome}")
+    for nome in faltando:
+        conn.execute(f"ATTACH DATABASE ? AS {nome}", (_arquivo_anual_existente(necessarios[nome]),))
+
+def _fonte(conn, tabela, data_inicio=None, data_fim=None):
+    intervalos = _intervalos_arquivados(conn, data_inicio, data_fim)
+    if not intervalos:
+        return tabela
+    _anexar_arquivos(conn, intervalos)
+    colunas = _COLUNAS_ARQUIVO[tabela]
+    decodificadas = ", ".join(
+        f"{_DECODIFICAR_ARQUIVO[codificacao].format(arquivada)} AS {quente}" if codificacao else quente
+        for quente, arquivada, codificacao in colunas
+    )
+    partes = [f"SELECT {', '.join(quente for quente, _, _ in colunas)} FROM main.{tabela}"]
+    for ano, faixas in intervalos.items():
+        # Os limites vêm do catálogo (inteiros), por isso podem ir direto no SQL; só as
+        # linhas de meses catalogados são lidas, mesmo que o arquivo tenha sobras de uma
+        # execução interrompida.
+        filtro = " OR ".join(f"dia BETWEEN {int(inicio)} AND {int(fim)}" for inicio, fim in faixas)
+        partes.append(f"SELECT {decodificadas} FROM arquivo_{ano}.{tabela} WHERE {filtro}")
+    return "(" + " UNION ALL ".join(partes) + ")"
+
+def _periodos_por_ano(conn, ate=None):
+    # Períodos disjuntos (início, fim), do mais recente para o mais antigo, que cobrem
+    # todas as datas até `ate`. Cada um cruza no máximo um ano arquivado, então _fonte
+    # anexa um arquivo por vez e o limite de anos anexados não é atingido.
+    primeiro, ultimo = conn.execute("SELECT MIN(ano), MAX(ano) FROM meses_arquivados").fetchone()
+    if primeiro is None:
+        return [(None, ate)]
+    periodos = [(f"{ultimo + 1}-01-01", None)]
+    periodos.extend((f"{ano}-01-01", f"{ano}-12-31") for ano in range(ultimo, primeiro - 1, -1))
+    periodos.append((None, f"{primeiro - 1}-12-31"))
+    if ate is None:
+        return periodos
+    return [(inicio, ate if fim is None else min(fim, ate)) for inicio, fim in periodos if inicio is None or inicio <= ate]
+
+def _filtro_periodo(inicio, fim):
+    condicoes, parametros = [], []
+    if inicio is not None:
+        condicoes.append("data >= ?")
+        parametros.append(inicio)
+    if fim is not None:
+        condicoes.append("data <= ?")
+        parametros.append(fim)
+    return "".join(f" AND {condicao}" for condicao in condicoes), parametros
+
+def _periodos_consulta(conn, data_inicio=None, data_fim=None, decrescente=False):
+    # Os períodos de _periodos_por_ano recortados ao filtro de datas, em ordem crescente
+    # (ou decrescente) de data, para que consultas longas leiam um ano arquivado por vez.
+    data_inicio, data_fim = _formatar_data_filtro(data_inicio), _formatar_data_filtro(data_fim)
+    periodos = [
+        (data_inicio if inicio is None or (data_inicio is not None and data_inicio > inicio) else inicio, fim)
+        for inicio, fim in _periodos_por_ano(conn, data_fim)
+        if data_inicio is None or fim is None or fim >= data_inicio
+    ] or [(data_inicio, data_fim)]
+    return periodos if decrescente else periodos[::-1]
+
+@metricas.instrumentar
+def contar_registros(empresa_id=None, data_inicio=None, data_fim=None, codigo=None):
+    total = 0
     with get_db_connection() as conn:
-        df = pd.read_sql_query("SELECT * FROM registros", conn)
-    
-    df = df.rename(columns={
-        'id': 'ID', 'codigo_funcionario': 'Código', 'nome': 'Nome', 'cargo': 'Cargo',
-        'data': 'Data', 'hora': 'Hora', 'descricao': 'Descrição', 
-        'diferenca_min': 'Diferença (min)', 'observacao': 'Observação'
-    })
-    return df
-
-def atualizar_registro(id_registro, novo_horario=None, nova_observacao=None):
+        for inicio, fim in _periodos_consulta(conn, data_inicio, data_fim):
+            where, parametros = _filtros_registros(empresa_id, inicio, fim, codigo)
+            query = f"""
+                SELECT COUNT(*)
+                FROM {_fonte(conn, 'registros', inicio, fim)} r
+                JOIN funcionarios f ON f.codigo = r.codigo_funcionario
+                WHERE {where}
+            """
+            total += conn.execute(query, parametros).fetchone()[0]
+    return total
+
+def _registrar_auditoria(conn, linhas):
+    # Cada linha: (registro_id, codigo_funcionario, data, descricao, descricao_nova,
+    # hora_anterior, hora_nova, diferenca_anterior, diferenca_nova, observacao_anterior,
+    # observacao_nova, editor, alterado_em).
+    conn.executemany("""
+        INSERT INTO registros_auditoria (
+            registro_id, codigo_funcionario, data, descricao, descricao_nova, hora_anterior, hora_nova,
+            diferenca_anterior, diferenca_nova, observacao_anterior, observacao_nova, editor, alterado_em
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, linhas)
+
+# Limite de parâmetros por consulta nas leituras por lista de IDs.
+_LOTE_IDS = 500
+
+def _ler_registros_por_id(conn, ids):
+    atuais = {}
+    for inicio in range(0, len(ids), _LOTE_IDS):
+        lote = ids[inicio:inicio + _LOTE_IDS]
+        for linha in conn.execute(f"""
+            SELECT id, codigo_funcionario, data, descricao, hora, diferenca_min, observacao
+            FROM registros WHERE id IN ({', '.join('?' * len(lote))})
+        """, lote):
+            atuais[linha['id']] = linha
+    return atuais
+
+@metricas.instrumentar
+def atualizar_registros(alteracoes, editor=None):
+    # `alteracoes`: dicts com "id" e, opcionalmente, "novo_horario" e "nova_observacao".
+    # Tudo numa transação: um SELECT do estado atual, um UPDATE por registro alterado e a
+    # linha de auditoria correspondente. Se um registro falhar, nenhum é gravado; edições
+    # que não mudam nada não geram UPDATE nem auditoria.
+    pedidos = {}
+    for alteracao in alteracoes:
+        id_registro = alteracao.get("id")
+        if id_registro is None:
+            return "Alteração sem o ID do registro.", "error"
+        if id_registro in pedidos:
+            return f"O registro {id_registro} aparece mais de uma vez no lote.", "error"
+        novo_horario = alteracao.get("novo_horario")
+        if novo_horario is not None:
+            try:
+                novo_horario = datetime.strptime(novo_horario, "%H:%M:%S").strftime("%H:%M:%S")
+            except (TypeError, ValueError):
+                return "Formato de hora inválido. Use HH:MM:SS.", "error"
+        pedidos[id_registro] = (novo_horario, alteracao.get("nova_observacao"))
+    if not pedidos:
+        return "Nenhum registro alterado.", "warning"
+
+    alterado_em = datetime.now(FUSO_HORARIO).isoformat(timespec="seconds")
     try:
-        with get_db_connection() as conn:
-            with conn:
-                cursor = conn.cursor()
-                if nova_observacao is not None:
-                    cursor.execute("UPDATE registros SET observacao = ? WHERE id = ?", (nova_observacao, id_registro))
-
-                if novo_horario is not None:
-                    novo_horario_obj = datetime.strptime(novo_horario, "%H:%M:%S").time()
-                    cursor.execute("SELECT descricao, data FROM registros WHERE id = ?", (id_registro,))
-                    row = cursor.fetchone()
-                    if row:
-                        descricao_evento = row['descricao']
-                        hora_prevista = HORARIOS_PADRAO.get(descricao_evento)
-                        if hora_prevista:
-                            data_registro = datetime.strptime(row['data'], "%Y-%m-%d")
-                            datetime_previsto = data_registro.replace(hour=hora_prevista.hour, minute=hora_prevista.minute)
-                            datetime_novo = data_registro.replace(hour=novo_horario_obj.hour, minute=novo_horario_obj.minute, second=novo_horario_obj.second)
-                            
-                            diferenca_bruta_min = round((datetime_novo - datetime_previsto).total_seconds() / 60)
-
-                            if abs(diferenca_bruta_min) <= TOLERANCIA_MINUTOS:
-                                diferenca_final_min = 0
-                            else:
-                                if diferenca_bruta_min > 0:
-                                    diferenca_final_min = diferenca_bruta_min - TOLERANCIA_MINUTOS
-                                else:
-                                    diferenca_final_min = diferenca_bruta_min + TOLERANCIA_MINUTOS
-                            
-                            cursor.execute("UPDATE registros SET hora = ?, diferenca_min = ? WHERE id = ?", (novo_horario, diferenca_final_min, id_registro))
+        with get_db_connection(escrita=True) as conn:
+            with _transacao_imediata(conn):
+                atuais = _ler_registros_por_id(conn, list(pedidos))
+                ausentes = [id_registro for id_registro in pedidos if id_registro not in atuais]
+                if ausentes:
+                    if any(_registro_arquivado(id_registro) for id_registro in ausentes):
+                        return "Este registro pertence a um mês arquivado e não pode ser alterado.", "error"
+                    return "Registro não encontrado.", "error"
+
+                atualizacoes, auditoria, dias = [], [], set()
+                for id_registro, (novo_horario, nova_observacao) in pedidos.items():
+                    atual = atuais[id_registro]
+                    hora, diferenca, observacao = atual['hora'], atual['diferenca_min'], atual['observacao']
+                    if nova_observacao is not None:
+                        observacao = nova_observacao
+                    if novo_horario is not None:
+                        segundos_previstos = _segundos_previstos(obter_horarios_funcionario(atual['codigo_funcionario'])).get(atual['descricao'])
+                        if segundos_previstos is not None:
+                            hora = novo_horario
+                            diferenca = int(calcular_diferencas_min(_segundos_hora(hora), segundos_previstos))
+                    if (hora, diferenca, observacao) == (atual['hora'], atual['diferenca_min'], atual['observacao']):
+                        continue
+                    atualizacoes.append((hora, diferenca, observacao, id_registro))
+                    auditoria.append((
+                        id_registro, atual['codigo_funcionario'], atual['data'], atual['descricao'], atual['descricao'],
+                        atual['hora'], hora, atual['diferenca_min'], diferenca, atual['observacao'], observacao,
+                        editor, alterado_em,
+                    ))
+                    dias.add((atual['codigo_funcionario'], atual['data']))
+
+                conn.executemany(
+                    "UPDATE registros SET hora = ?, diferenca_min = ?, observacao = ? WHERE id = ?", atualizacoes
+                )
+                _registrar_auditoria(conn, auditoria)
+                for codigo, data_str in dias:
+                    _atualizar_resumo_dia(conn, codigo, data_str)
 
-    except ValueError:
-        return "Formato de hora inválido. Use HH:MM:SS.", "error"
     except sqlite3.Error as e:
         return f"Erro no banco de dados: {e}", "error"
 
+    return f"{len(atualizacoes)} registro(s) atualizado(s) com sucesso.", "success"
+
+def atualizar_registro(id_registro, novo_horario=None, nova_observacao=None, editor=None):
+    msg, tipo = atualizar_registros(
+        [{"id": id_registro, "novo_horario": novo_horario, "nova_observacao": nova_observacao}], editor=editor
+    )
+    if tipo == "error":
+        return msg, tipo
     return "Registro atualizado com sucesso.", "success"
 
+def listar_alteracoes_registro(id_registro):
+    with get_db_connection() as conn:
+        return [dict(linha) for linha in conn.execute(
+            "SELECT * FROM registros_auditoria WHERE registro_id = ? ORDER BY id", (id_registro,)
+        )]
+
+def _limites_mes(mes):
+    try:
+        inicio = datetime.strptime(mes, "%Y-%m").date()
+    except ValueError:
+        raise ValueError(f"Mês inválido: '{mes}'. Use AAAA-MM.") from None
+    proximo = date(inicio.year + inicio.month // 12, inicio.month % 12 + 1, 1)
+    return inicio, proximo
+
+def _copiar_tabela_arquivo(conn, tabela, origem, destino, codificar, filtro):
+    colunas = _COLUNAS_ARQUIVO[tabela]
+    if codificar:
+        nomes_destino = [arquivada for _, arquivada, _ in colunas]
+        expressoes = [_CODIFICAR_ARQUIVO[cod].format(quente) if cod else quente for quente, _, cod in colunas]
+    else:
+        nomes_destino = [quente for quente, _, _ in colunas]
+        expressoes = [_DECODIFICAR_ARQUIVO[cod].format(arquivada) if cod else arquivada for _, arquivada, cod in colunas]
+    conn.execute(f"""
+        INSERT INTO {destino}.{tabela} ({', '.join(nomes_destino)})
+        SELECT {', '.join(expressoes)} FROM {origem}.{tabela} WHERE {filtro}
+    """)
+
+def _registro_arquivado(id_registro):
+    with get_db_connection() as conn:
+        anos = [linha[0] for linha in conn.execute("SELECT DISTINCT ano FROM meses_arquivados")]
+        for ano in anos:
+            fonte = _fonte(conn, "registros", f"{ano}-01-01", f"{ano}-12-31")
+            if conn.execute(f"SELECT 1 FROM {fonte} WHERE id = ?", (id_registro,)).fetchone():
+                return True
+    return False
+
+@metricas.instrumentar
+def arquivar_mes(mes):
+    # Move os registros e o resumo diário de um mês encerrado para o banco do ano. Duas
+    # transações, na ordem que não perde dados: primeiro a cópia no arquivo é confirmada;
+    # só então o mês sai do banco quente e entra no catálogo. Se o processo cair entre as
+    # duas, o mês continua no banco quente e as linhas copiadas ficam invisíveis (_fonte
+    # só lê meses catalogados) até a próxima tentativa, que as substitui.
+    inicio, proximo = _limites_mes(mes)
+    if proximo > datetime.now(FUSO_HORARIO).date().replace(day=1):
+        raise ValueError(f"O mês {mes} ainda não foi encerrado.")
+    dia_inicio, dia_fim = _dia_epoca(inicio), _dia_epoca(proximo) - 1
+    filtro_quente = f"data >= '{inicio.isoformat()}' AND data < '{proximo.isoformat()}'"
+    filtro_arquivo = f"dia BETWEEN {dia_inicio} AND {dia_fim}"
+    caminho = _caminho_arquivo_anual(inicio.year)
+
+    with get_db_connection(escrita=True) as conn:
+        if conn.execute("SELECT 1 FROM meses_arquivados WHERE mes = ?", (mes,)).fetchone():
+            return 0
+        horas_invalidas = conn.execute(f"""
+            SELECT COUNT(*) FROM registros
+            WHERE {filtro_quente} AND hora NOT GLOB '[0-2][0-9]:[0-5][0-9]:[0-5][0-9]'
+        """).fetchone()[0]
+        if horas_invalidas:
+            raise ValueError(f"{horas_invalidas} registro(s) de {mes} com hora fora do formato HH:MM:SS.")
+
+        os.makedirs(os.path.dirname(caminho), exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS arquivo_destino", (caminho,))
+        try:
+            with _transacao_imediata(conn):
+                for comando in _ESQUEMA_ARQUIVO:
+                    conn.execute(comando.format(esquema="arquivo_destino"))
+                for tabela in _COLUNAS_ARQUIVO:
+                    conn.execute(f"DELETE FROM arquivo_destino.{tabela} WHERE {filtro_arquivo}")
+                    _copiar_tabela_arquivo(conn, tabela, "main", "arquivo_destino", True, filtro_quente)
+
+            with _transacao_imediata(conn):
+                copiados = conn.execute(f"SELECT COUNT(*) FROM arquivo_destino.registros WHERE {filtro_arquivo}").fetchone()[0]
+                quentes = conn.execute(f"SELECT COUNT(*) FROM main.registros WHERE {filtro_quente}").fetchone()[0]
+                if copiados != quentes:
+                    raise sqlite3.DatabaseError(
+                        f"{mes} mudou durante o arquivamento ({quentes} registros, {copiados} copiados); tente novamente."
+                    )
+                for tabela in _COLUNAS_ARQUIVO:
+                    conn.execute(f"DELETE FROM main.{tabela} WHERE {filtro_quente}")
+                conn.execute(
+                    "INSERT INTO meses_arquivados VALUES (?, ?, ?, ?, ?, ?)",
+                    (mes, inicio.year, dia_inicio, dia_fim, copiados, datetime.now(FUSO_HORARIO).isoformat(timespec="seconds"))
+                )
+        finally:
+            conn.execute("DETACH DATABASE arquivo_destino")
+    return copiados
+
+@metricas.instrumentar
+def arquivar_meses_fechados(meses_quentes=ARQUIVO_MESES_QUENTES):
+    # Mantém no banco quente o mês corrente e os `meses_quentes - 1` anteriores, que
+    # ainda recebem correções; os demais meses com registros são arquivados.
+    hoje = datetime.now(FUSO_HORARIO).date()
+    indice_corte = hoje.year * 12 + hoje.month - 1 - (max(meses_quentes, 1) - 1)
+    corte = date(indice_corte // 12, indice_corte % 12 + 1, 1)
+    with get_db_connection() as conn:
+        meses = [linha[0] for linha in conn.execute(
+            "SELECT DISTINCT substr(data, 1, 7) FROM registros WHERE data < ? ORDER BY 1", (corte.isoformat(),)
+        )]
+    return {mes: arquivar_mes(mes) for mes in meses}
+
+@metricas.instrumentar
+def desarquivar_mes(mes):
+    # Devolve um mês ao banco quente (para correções). O catálogo sai na mesma transação
+    # que reinsere as linhas; a limpeza do arquivo vem depois e pode falhar sem efeito
+    # visível, pois linhas fora do catálogo não são lidas.
+    inicio, proximo = _limites_mes(mes)
+    filtro_arquivo = f"dia BETWEEN {_dia_epoca(inicio)} AND {_dia_epoca(proximo) - 1}"
+    with get_db_connection(escrita=True) as conn:
+        if not conn.execute("SELECT 1 FROM meses_arquivados WHERE mes = ?", (mes,)).fetchone():
+            return 0
+        conn.execute("ATTACH DATABASE ? AS arquivo_origem", (_arquivo_anual_existente(inicio.year),))
+        try:
+            with _transacao_imediata(conn):
+                for tabela in _COLUNAS_ARQUIVO:
+                    _copiar_tabela_arquivo(conn, tabela, "arquivo_origem", "main", False, filtro_arquivo)
+                devolvidos = conn.execute(
+                    f"SELECT COUNT(*) FROM arquivo_origem.registros WHERE {filtro_arquivo}"
+                ).fetchone()[0]
+                conn.execute("DELETE FROM meses_arquivados WHERE mes = ?", (mes,))
+            with _transacao_imediata(conn):
+                for tabela in _COLUNAS_ARQUIVO:
+                    conn.execute(f"DELETE FROM arquivo_origem.{tabela} WHERE {filtro_arquivo}")
+        finally:
+            conn.execute("DETACH DATABASE arquivo_origem")
+    return devolvidos
+
+def compactar_banco():
+    # DELETE não devolve páginas ao sistema; depois de arquivar, VACUUM reduz o ponto.db.
+    # Em modo WAL o VACUUM grava no -wal; o checkpoint TRUNCATE leva o resultado ao arquivo.
+    with get_db_connection(escrita=True) as conn:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+@metricas.instrumentar
 def adicionar_funcionario(codigo, nome, cargo, senha, empresa_id):
     if not all([codigo, nome, cargo, senha, empresa_id]):
         return "Todos os campos, incluindo a empresa, são obrigatórios.", "error"
 
+    senha_hash = _obter_executor_kdf().submit(_hash_senha, senha).result()
     try:
-        with get_db_connection() as conn:
+        with get_db_connection(escrita=True) as conn:
             with conn:
                 cursor = conn.cursor()
                 cursor.execute("SELECT codigo FROM funcionarios WHERE codigo = ?", (codigo,))
                 if cursor.fetchone():
                     return f"O código '{codigo}' já está em uso por outro funcionário.", "warning"
 
-                senha_hash = _hash_senha(senha)
                 cursor.execute(
                     "INSERT INTO funcionarios (codigo, nome, cargo, senha, role, empresa_id) VALUES (?, ?, ?, ?, ?, ?)",
                     (codigo, nome, cargo, senha_hash, 'employee', empresa_id)
@@ -231,108 +1441,15 @@ def adicionar_funcionario(codigo, nome, cargo, senha, empresa_id):
     except sqlite3.Error as e:
         return f"Erro no banco de dados ao adicionar funcionário: {e}", "error"
 
-    return f"Funcionário '{nome}' adicionado com sucesso!", "success"
-
-def _formatar_timedelta(td):
-    if pd.isnull(td):
-        return "00:00"
-    total_seconds = int(td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, _ = divmod(remainder, 60)
-    return f"{hours:02d}:{minutes:02d}"
-
-def gerar_relatorio_organizado_df(df_registros: pd.DataFrame) -> pd.DataFrame:
-    if df_registros.empty:
-        return pd.DataFrame()
+    invalidar_cache_referencia()
 
-    df = df_registros.copy()
-    
-    df_pivot = df.pivot_table(
-        index=['Data', 'Código', 'Nome'],
-        columns='Descrição',
-        values='Hora',
-        aggfunc='first'
-    ).reset_index()
-
-    df_obs = df.dropna(subset=['Observação']).groupby(['Data', 'Código'])['Observação'].apply(lambda x: ' | '.join(x.unique())).reset_index()
-    
-    df_final = pd.merge(df_pivot, df_obs, on=['Data', 'Código'], how='left')
-    df_final['Observação'] = df_final['Observação'].fillna('')
-
-    eventos = list(HORARIOS_PADRAO.keys())
-    for evento in eventos:
-        if evento not in df_final.columns:
-            df_final[evento] = np.nan
-        df_final[evento] = pd.to_datetime(df_final[evento], format='%H:%M:%S', errors='coerce').dt.time
-
-    dt_inicio_expediente = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Início do Expediente'].astype(str), errors='coerce')
-    dt_fim_expediente = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Fim do Expediente'].astype(str), errors='coerce')
-    dt_inicio_almoco = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Início do Almoço'].astype(str), errors='coerce')
-    dt_fim_almoco = pd.to_datetime(df_final['Data'].astype(str) + ' ' + df_final['Fim do Almoço'].astype(str), errors='coerce')
-
-    duracao_pausa = dt_fim_almoco - dt_inicio_almoco
-    jornada_bruta = dt_fim_expediente - dt_inicio_expediente
-    
-    duracao_pausa = duracao_pausa.apply(lambda x: x if pd.notna(x) and x.total_seconds() >= 0 else pd.Timedelta(0))
-    
-    horas_trabalhadas = jornada_bruta - duracao_pausa
-
-    df_final['Horas de Pausa'] = duracao_pausa.apply(_formatar_timedelta)
-    df_final['Total Horas Trabalhadas'] = horas_trabalhadas.apply(_formatar_timedelta)
-    
-    colunas_finais = [
-        'Data', 'Código', 'Nome', 
-        'Início do Expediente', 'Início do Almoço', 
-        'Fim do Almoço', 'Fim do Expediente',
-        'Horas de Pausa', 'Total Horas Trabalhadas', 'Observação'
-    ]
-    for col in colunas_finais:
-        if col not in df_final.columns:
-            df_final[col] = 'N/A'
-            
-    df_final = df_final[colunas_finais]
-    
-    df_final.rename(columns={'Código': 'Código do Funcionário', 'Nome': 'Nome do Funcionário'}, inplace=True)
-
-    df_final['Data'] = pd.to_datetime(df_final['Data']).dt.strftime('%d/%m/%Y')
-
-    return df_final
-
-def gerar_arquivo_excel(df_organizado, df_bruto):
-    output_buffer = io.BytesIO()
-
-    with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-        df_organizado.to_excel(writer, sheet_name='Relatório Diário', index=False)
-        df_bruto.to_excel(writer, sheet_name='Log de Eventos (Bruto)', index=False)
+    return f"Funcionário '{nome}' adicionado com sucesso!", "success"
 
-        workbook = writer.book
-        
-        worksheet_organizado = writer.sheets['Relatório Diário']
-        for column in worksheet_organizado.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet_organizado.column_dimensions[column_letter].width = adjusted_width
-
-        worksheet_bruto = writer.sheets['Log de Eventos (Bruto)']
-        for column in worksheet_bruto.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2)
-            worksheet_bruto.column_dimensions[column_letter].width = adjusted_width
-
-    output_buffer.seek(0)
-    
-    return output_buffer
\ No newline at end of file
+def __getattr__(nome):
+    # Consultas em DataFrame, importações e exportações moram em relatorios.py, que traz
+    # pandas/NumPy/openpyxl e só é importado no primeiro acesso a um desses nomes.
+    if not nome.startswith("__"):
+        import relatorios
+        if hasattr(relatorios, nome):
+            return getattr(relatorios, nome)
+    raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
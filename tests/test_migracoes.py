@@ -0,0 +1,111 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import services
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Migrações 1 a 3: índices das consultas quentes.
+VERSAO_INDICES = 3
+
+CONSULTA_PROXIMO_EVENTO = "SELECT COUNT(*) FROM registros WHERE codigo_funcionario = ? AND data = ?"
+CONSULTA_PERIODO = "SELECT * FROM registros WHERE data >= ? AND data <= ? ORDER BY data, hora"
+CONSULTA_EMPRESA = "SELECT codigo FROM funcionarios WHERE empresa_id = ?"
+
+
+def _migrar(tmp_path, monkeypatch, versao):
+    # Cópia do ponto.db versionado (schema original, user_version 0) migrada por init_db
+    # até `versao`.
+    caminho = str(tmp_path / "ponto.db")
+    shutil.copyfile(os.path.join(RAIZ, "ponto.db"), caminho)
+    monkeypatch.setattr(services, "DATABASE_FILE", caminho)
+    monkeypatch.setattr(services, "MIGRACOES", services.MIGRACOES[:versao])
+    services.init_db()
+    services.fechar_conexoes()
+    return sqlite3.connect(caminho)
+
+
+@pytest.fixture
+def banco_indices(tmp_path, monkeypatch):
+    conn = _migrar(tmp_path, monkeypatch, VERSAO_INDICES)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def banco_atual(tmp_path, monkeypatch):
+    conn = _migrar(tmp_path, monkeypatch, len(services.MIGRACOES))
+    yield conn
+    conn.close()
+
+
+def _plano(conn, sql, parametros):
+    return " | ".join(linha[-1] for linha in conn.execute(f"EXPLAIN QUERY PLAN {sql}", parametros))
+
+
+def test_migracoes_chegam_a_ultima_versao(banco_atual):
+    assert services.obter_versao_schema(banco_atual) == len(services.MIGRACOES)
+
+
+def test_proximo_evento_usa_indice_unico_do_dia(banco_indices):
+    plano = _plano(banco_indices, CONSULTA_PROXIMO_EVENTO, ("1", "2024-01-02"))
+    assert "uq_registros_funcionario_data_evento" in plano
+
+
+def test_filtro_por_periodo_usa_indice_de_data(banco_indices):
+    plano = _plano(banco_indices, CONSULTA_PERIODO, ("2024-01-01", "2024-01-31"))
+    assert "idx_registros_data_hora" in plano
+
+
+def test_funcionarios_por_empresa_usa_indice(banco_indices):
+    plano = _plano(banco_indices, CONSULTA_EMPRESA, (1,))
+    assert "idx_funcionarios_empresa" in plano
+
+
+def test_schema_atual_mantem_buscas_indexadas(banco_atual):
+    # A migração 5 cria um índice coberto (funcionário, data, hora, id) que o planejador
+    # pode preferir ao índice único para a contagem do dia; as duas são buscas indexadas.
+    plano = _plano(banco_atual, CONSULTA_PROXIMO_EVENTO, ("1", "2024-01-02"))
+    assert "SEARCH registros USING COVERING INDEX" in plano
+    assert "codigo_funcionario=? AND data=?" in plano
+    assert "idx_registros_data_hora" in _plano(banco_atual, CONSULTA_PERIODO, ("2024-01-01", "2024-01-31"))
+    assert "idx_funcionarios_empresa" in _plano(banco_atual, CONSULTA_EMPRESA, (1,))
+
+
+def test_eventos_duplicados_vao_para_quarentena(tmp_path, monkeypatch, caplog):
+    caminho = str(tmp_path / "ponto.db")
+    shutil.copyfile(os.path.join(RAIZ, "ponto.db"), caminho)
+    with sqlite3.connect(caminho) as conn:
+        conn.executemany(
+            "INSERT INTO registros VALUES (?, '100', 'Teste', 'Operador', '2024-01-02', ?, 'Início do Expediente', 0, NULL)",
+            [("dup-1", "08:00:00"), ("dup-2", "08:00:05"), ("dup-3", "08:00:09")],
+        )
+    conn.close()
+    monkeypatch.setattr(services, "DATABASE_FILE", caminho)
+    with caplog.at_level("WARNING", logger="services"):
+        services.init_db()
+    services.fechar_conexoes()
+
+    with sqlite3.connect(caminho) as conn:
+        restantes = [linha[0] for linha in conn.execute(
+            "SELECT id FROM registros WHERE id LIKE 'dup-%'"
+        )]
+        quarentena = [linha[0] for linha in conn.execute("SELECT id FROM registros_duplicados ORDER BY id")]
+    conn.close()
+    assert restantes == ["dup-1"]
+    assert quarentena == ["dup-2", "dup-3"]
+    assert "2 batida(s) duplicada(s)" in caplog.text
+
+
+def test_recalculos_diferencas_so_aceita_progresso(banco_atual):
+    banco_atual.execute("""
+        INSERT INTO recalculos_diferencas (tolerancia, horarios_novos, horarios_vigentes, iniciado_em)
+        VALUES (5, '{}', 1, '2024-01-02T08:00:00-03:00')
+    """)
+    banco_atual.execute("UPDATE recalculos_diferencas SET linhas_alteradas = 3, concluido_em = iniciado_em")
+    with pytest.raises(sqlite3.IntegrityError):
+        banco_atual.execute("UPDATE recalculos_diferencas SET horarios_novos = '[]'")
+    with pytest.raises(sqlite3.IntegrityError):
+        banco_atual.execute("DELETE FROM recalculos_diferencas")